@@ -1,18 +1,43 @@
+import time
+_STARTUP_T0 = time.perf_counter()  # --startup-profile times phases from here
 import os
+import bisect
 import json
-import time
 import hashlib
+import hmac
+import math
+import queue
+import random
 import re
+import sys
+import threading
 import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Any, Dict, List, Tuple, Optional
 
-import requests
+_startup_phases: List[Tuple[str, float]] = []
+_startup_last = _STARTUP_T0
+
+
+def _startup_phase(name: str) -> None:
+    """Record the time spent since the previous mark (reported by --startup-profile)."""
+    global _startup_last
+    now = time.perf_counter()
+    _startup_phases.append((name, (now - _startup_last) * 1000.0))
+    _startup_last = now
+
 
-from flask import Flask, jsonify, request, send_from_directory, session, send_file
+_startup_phase("stdlib imports")
+
+from flask import Blueprint, Flask, Response, g, has_request_context, jsonify, request, send_from_directory, session, send_file, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
+_startup_phase("flask/werkzeug imports")
+
 # =========================================================
 # Advanced Flashcards WebApp Server (Multi-user with Username/Password Auth)
 # - Users create a profile with username/password
@@ -51,6 +76,327 @@ def _safe_int(value, default=0):
     except Exception:
         return default
 
+
+# ============ JSON FILE I/O ============
+# All data-file loads/saves go through _load_json_file / _save_json_file so
+# calls, bytes and time can be counted per file class (profiles, progress,
+# decks, ...) for the current request and in process-wide totals. Set
+# KENPO_IO_WARN_DUPLICATES=1 to log requests that read the same file twice.
+#
+# Locking: saves write a temp file and os.replace() it, so readers always see a
+# whole file; a per-path reader/writer lock keeps that replace from overlapping
+# a read in this process. Load -> modify -> save sequences (set_status, custom
+# set toggles, deck edits, ...) hold the files' transaction locks for the whole
+# request via @_json_locked(...) or `with _json_txn(path, ...)`; those also take
+# an OS advisory lock in data/.locks/ so several server processes can share one
+# data folder (KENPO_FILE_LOCKS=0 turns that off).
+IO_WARN_DUPLICATES = (os.environ.get("KENPO_IO_WARN_DUPLICATES") or "").strip().lower() in ("1", "true", "yes", "on")
+
+_json_io_totals: Dict[str, Dict[str, float]] = {}
+_json_io_lock = threading.Lock()
+
+
+def _json_file_class(path: Any) -> str:
+    """Short class name for a data file, e.g. data/users/<id>/progress.json -> "progress"."""
+    p = str(path)
+    if p.endswith(".tmp"):
+        p = p[:-4]
+    name = os.path.basename(p)
+    if name in ("cards.json", "progress.json"):
+        area = os.path.basename(os.path.dirname(os.path.dirname(p)))
+        return {"users": "progress", "user_cards": "user_cards", "deck_cards": "deck_cards"}.get(area, name[:-5])
+    return name[:-5] if name.endswith(".json") else name
+
+
+def _note_json_io(op: str, path: Any, nbytes: int, t0: float) -> None:
+    ms = (time.perf_counter() - t0) * 1000.0
+    cls = _json_file_class(path)
+    with _json_io_lock:
+        t = _json_io_totals.get(cls)
+        if t is None:
+            t = _json_io_totals[cls] = {"reads": 0, "writes": 0, "read_bytes": 0, "write_bytes": 0,
+                                        "read_ms": 0.0, "write_ms": 0.0, "duplicate_reads": 0}
+        t[op + "s"] += 1
+        t[op + "_bytes"] += nbytes
+        t[op + "_ms"] += ms
+    if not has_request_context():
+        return
+    io = g.setdefault("json_io", {"read": 0, "write": 0, "read_bytes": 0, "write_bytes": 0, "duplicate_reads": 0})
+    io[op] += 1
+    io[op + "_bytes"] += nbytes
+    per_class = g.setdefault("json_io_classes", {})
+    c = per_class.setdefault(cls, {"reads": 0, "writes": 0, "bytes": 0, "ms": 0.0})
+    c[op + "s"] += 1
+    c["bytes"] += nbytes
+    c["ms"] += ms
+    if op == "read":
+        seen = g.setdefault("json_read_paths", {})
+        key = os.path.normcase(os.path.abspath(str(path)))
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:
+            io["duplicate_reads"] += 1
+            with _json_io_lock:
+                _json_io_totals[cls]["duplicate_reads"] += 1
+
+
+FILE_LOCKS = (os.environ.get("KENPO_FILE_LOCKS", "1") or "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class _PathLock:
+    """Locks for one data file.
+
+    - read/write: a short reader/writer lock around the physical file I/O, so a
+      save's temp-write + replace never overlaps a read of the same file
+      (Windows cannot replace a file that is open). Waiting writers block new
+      readers so a busy file cannot starve a save.
+    - txn: a re-entrant exclusive lock (plus an OS advisory lock for other
+      processes) held across a whole load -> modify -> save sequence.
+      Plain reads never wait on it, so readers are not stalled by long requests.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting = 0
+        self._txn = threading.RLock()
+        self._txn_depth = 0
+        self._os_fh = None
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            while self._writing or self._waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self._writing or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting -= 1
+            self._writing = True
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writing = False
+            self._cond.notify_all()
+
+    def acquire_txn(self) -> None:
+        self._txn.acquire()
+        if self._txn_depth == 0:
+            try:
+                self._os_fh = _os_lock(self.key)
+            except BaseException:
+                self._txn.release()
+                raise
+        self._txn_depth += 1
+
+    def release_txn(self) -> None:
+        self._txn_depth -= 1
+        if self._txn_depth == 0:
+            fh, self._os_fh = self._os_fh, None
+            _os_unlock(fh)
+        self._txn.release()
+
+
+_path_locks: Dict[str, _PathLock] = {}
+_path_locks_guard = threading.Lock()
+
+
+def _path_key(path: Any) -> str:
+    return os.path.normcase(os.path.abspath(str(path)))
+
+
+def _path_lock(path: Any) -> _PathLock:
+    key = _path_key(path)
+    lock = _path_locks.get(key)
+    if lock is None:
+        with _path_locks_guard:
+            lock = _path_locks.setdefault(key, _PathLock(key))
+    return lock
+
+
+def _os_lock(key: str):
+    """Exclusive OS advisory lock on data/.locks/<hash>.lock (held until _os_unlock)."""
+    if not FILE_LOCKS:
+        return None
+    lock_dir = os.path.join(DATA_DIR, ".locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    fh = open(os.path.join(lock_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + ".lock"), "a+b")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)  # retries for ~10s, then raises
+                    break
+                except OSError:
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+    except BaseException:
+        fh.close()
+        raise
+    return fh
+
+
+def _os_unlock(fh) -> None:
+    if fh is None:
+        return
+    try:
+        if os.name == "nt":
+            import msvcrt
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    except OSError:
+        pass
+    finally:
+        fh.close()
+
+
+class _json_txn:
+    """Hold the transaction locks of several data files (taken in sorted order, so
+    two requests cannot deadlock) across a whole load -> modify -> save sequence.
+    Re-entrant: nested txns on a path the thread already holds are free."""
+
+    def __init__(self, *paths: Any):
+        keys = sorted({_path_key(p) for p in paths if p})
+        self._locks = [_path_lock(k) for k in keys]
+
+    def __enter__(self):
+        taken = []
+        try:
+            for lock in self._locks:
+                lock.acquire_txn()
+                taken.append(lock)
+        except BaseException:
+            for lock in reversed(taken):
+                lock.release_txn()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        for lock in reversed(self._locks):
+            lock.release_txn()
+        return False
+
+
+def _replace_file(src: str, dst: Any) -> None:
+    # Windows refuses to replace a file another process has open; retry briefly.
+    for attempt in range(50):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == 49:
+                raise
+            time.sleep(0.02)
+
+
+def _load_json_file(path: Any) -> Any:
+    t0 = time.perf_counter()
+    lock = _path_lock(path)
+    lock.acquire_read()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            nbytes = os.fstat(f.fileno()).st_size
+    finally:
+        lock.release_read()
+    _note_json_io("read", path, nbytes, t0)
+    return data
+
+
+def _write_file_atomic(path: Any, write, binary: bool = False) -> int:
+    """Call write(f) on <path>.<pid>.<thread>.tmp, then os.replace() it over path.
+    Returns the bytes written. Readers see either the old or the new file."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    lock = _path_lock(path)
+    lock.acquire_write()
+    try:
+        with open(tmp, "wb") if binary else open(tmp, "w", encoding="utf-8") as f:
+            write(f)
+            nbytes = f.tell()
+        _replace_file(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    finally:
+        lock.release_write()
+    return nbytes
+
+
+def _save_json_file(path: Any, obj: Any) -> None:
+    if _replica_write_blocked(path):
+        return
+    t0 = time.perf_counter()
+    nbytes = _write_file_atomic(path, lambda f: json.dump(obj, f, ensure_ascii=False, indent=2))
+    _note_json_io("write", path, nbytes, t0)
+
+
+def _json_locked(*kinds: str):
+    """Decorator for routes that load, modify and save data files: holds those files'
+    transaction locks for the whole request so concurrent requests cannot lose updates.
+
+    kinds: "progress" / "user_cards" (the signed-in or token user's file), "deck_cards"
+    (all deck card files), or a shared file: "profiles", "decks", "deck_access",
+    "deck_config", "breakdowns", "admin_users", "api_keys".
+    """
+    from functools import wraps
+
+    def deco(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            with _json_txn(*_json_lock_paths(kinds)):
+                return f(*args, **kwargs)
+        return decorated
+    return deco
+
+
+def _json_lock_paths(kinds: Tuple[str, ...]) -> List[str]:
+    shared = {
+        "profiles": PROFILES_PATH, "decks": DECKS_PATH, "deck_access": DECK_ACCESS_PATH,
+        "deck_config": DECK_CONFIG_PATH, "breakdowns": BREAKDOWNS_PATH,
+        "admin_users": ADMIN_USERS_PATH, "api_keys": API_KEYS_PATH, "deck_cards": DECK_CARDS_DIR,
+    }
+    uid = getattr(request, "android_uid", None) or session.get("user_id")
+    paths = []
+    for kind in kinds:
+        if kind == "progress":
+            if uid:
+                paths.append(os.path.join(USERS_DIR, str(uid), "progress.json"))
+        elif kind == "user_cards":
+            if uid:
+                paths.append(os.path.join(USER_CARDS_DIR, str(uid), "cards.json"))
+        else:
+            paths.append(shared[kind])
+    return paths
+
+
+def _json_io_stats() -> Dict[str, Dict[str, float]]:
+    with _json_io_lock:
+        return {cls: {k: (round(v, 1) if isinstance(v, float) else v) for k, v in t.items()}
+                for cls, t in sorted(_json_io_totals.items())}
+
+
 def _resolve_kenpo_json_path() -> str:
     """Resolve the kenpo_words.json path.
 
@@ -81,16 +427,219 @@ def _resolve_kenpo_json_path() -> str:
 
 
 KENPO_JSON_PATH = _resolve_kenpo_json_path()
+_startup_phase("paths, JSON I/O, kenpo_words.json discovery")
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 
-DATA_DIR = os.path.join(APP_DIR, "data")
+# KENPO_DATA_DIR lets benchmarks/tests run the server against a scratch data folder.
+DATA_DIR = os.path.abspath((os.getenv("KENPO_DATA_DIR") or "").strip() or os.path.join(APP_DIR, "data"))
 
 BREAKDOWNS_PATH = os.path.join(DATA_DIR, "breakdowns.json")
 
 # Canonical term->id helper (source of truth for IDs across devices)
 HELPER_PATH = os.path.join(DATA_DIR, "helper.json")
 
+
+# ============ SYNC REPLICA ============
+# KENPO_REPLICA_SOURCE=<primary's data folder> runs this process as a read-only
+# sync replica on the same machine. DATA_DIR (KENPO_DATA_DIR, default
+# data-replica/) becomes a snapshot of that folder, refreshed every
+# KENPO_REPLICA_REFRESH_SECONDS by copying files whose size/mtime changed.
+# Each file is swapped in atomically, so readers see old or new content, never
+# a partial file; across files the snapshot may trail the primary by up to one
+# refresh. Android tokens are checked against the primary's token database,
+# and anything other than GET/HEAD/OPTIONS is forwarded to
+# KENPO_REPLICA_PRIMARY_URL (clients drop Authorization on cross-origin
+# redirects, so a 307 would not work), or refused with 503 when that is not set.
+# Some GET handlers also save (settings defaults, deck-card migrations); on a
+# replica those saves are dropped, since the primary makes the same change, and
+# any local file that differs from its copy anyway is re-copied on the next refresh.
+_replica_source = (os.getenv("KENPO_REPLICA_SOURCE") or "").strip()
+REPLICA_SOURCE = os.path.abspath(_replica_source) if _replica_source else ""
+REPLICA_PRIMARY_URL = (os.getenv("KENPO_REPLICA_PRIMARY_URL") or "").strip().rstrip("/")
+REPLICA_REFRESH_SECONDS = max(1, _safe_int(os.getenv("KENPO_REPLICA_REFRESH_SECONDS"), 2))
+REPLICA_MAX_LAG_SECONDS = max(REPLICA_REFRESH_SECONDS, _safe_int(os.getenv("KENPO_REPLICA_MAX_LAG_SECONDS"), 30))
+# Per-process state that is never mirrored: lock files, caches, logs, the token DB, temp files
+REPLICA_SKIP_DIRS = {".locks", "cache", "logs"}
+REPLICA_SKIP_SUFFIXES = (".tmp", ".sqlite3", ".sqlite3-wal", ".sqlite3-shm", ".sqlite3-journal")
+
+if REPLICA_SOURCE:
+    if not (os.getenv("KENPO_DATA_DIR") or "").strip():
+        DATA_DIR = os.path.join(APP_DIR, "data-replica")
+        BREAKDOWNS_PATH = os.path.join(DATA_DIR, "breakdowns.json")
+        HELPER_PATH = os.path.join(DATA_DIR, "helper.json")
+    if os.path.normcase(DATA_DIR) == os.path.normcase(REPLICA_SOURCE):
+        raise SystemExit("[REPLICA] KENPO_DATA_DIR must not be the primary's data folder")
+
+# relpath -> (size, mtime_ns) of the source copy, then (size, mtime_ns) of our copy
+_replica_manifest: Dict[str, Tuple[int, int, int, int]] = {}
+_replica_lock = threading.Lock()
+_replica_listeners: List[Any] = []  # fn(changed relpaths), called after each refresh that changed files
+_replica_stats = {"refreshes": 0, "copied": 0, "deleted": 0, "errors": 0, "last_error": "",
+                  "dropped_writes": 0, "recopied": 0,
+                  "forwarded": 0, "forward_errors": 0,
+                  "last_refresh": 0.0, "last_duration_ms": 0.0}
+
+
+def _replica_refresh() -> Tuple[int, int]:
+    """Copy new/changed files from REPLICA_SOURCE into DATA_DIR and drop files the
+    primary deleted. Returns (copied, deleted)."""
+    t0 = time.perf_counter()
+    copied = deleted = 0
+    seen = set()
+    changed: List[str] = []
+    with _replica_lock:
+        for root, dirs, files in os.walk(REPLICA_SOURCE):
+            rel_root = os.path.relpath(root, REPLICA_SOURCE)
+            if rel_root == ".":
+                dirs[:] = [d for d in dirs if d not in REPLICA_SKIP_DIRS]
+                rel_root = ""
+            for name in files:
+                if name.endswith(REPLICA_SKIP_SUFFIXES):
+                    continue
+                rel = os.path.join(rel_root, name)
+                seen.add(rel)
+                try:
+                    st = os.stat(os.path.join(root, name))
+                    known = _replica_manifest.get(rel)
+                    if known and known[:2] == (st.st_size, st.st_mtime_ns):
+                        try:
+                            dst_st = os.stat(os.path.join(DATA_DIR, rel))
+                            if known[2:] == (dst_st.st_size, dst_st.st_mtime_ns):
+                                continue
+                        except FileNotFoundError:
+                            pass
+                        _replica_stats["recopied"] += 1  # our copy was changed or removed locally
+                    # The primary replaces files atomically, so the open handle is one whole
+                    # version; record that version's stat rather than the one above.
+                    with open(os.path.join(root, name), "rb") as src:
+                        st = os.fstat(src.fileno())
+                        dst = os.path.join(DATA_DIR, rel)
+                        os.makedirs(os.path.dirname(dst), exist_ok=True)
+                        _write_file_atomic(dst, lambda f: f.write(src.read()), binary=True)
+                    dst_st = os.stat(dst)
+                    _replica_manifest[rel] = (st.st_size, st.st_mtime_ns, dst_st.st_size, dst_st.st_mtime_ns)
+                    changed.append(rel)
+                    copied += 1
+                except FileNotFoundError:
+                    seen.discard(rel)  # deleted mid-walk; handled as a delete below
+                except OSError as e:
+                    _replica_stats["errors"] += 1
+                    _replica_stats["last_error"] = f"{rel}: {e}"
+        # Only files that came from the primary are removed; the replica's own files stay
+        for rel in [r for r in _replica_manifest if r not in seen]:
+            del _replica_manifest[rel]
+            try:
+                os.remove(os.path.join(DATA_DIR, rel))
+                changed.append(rel)
+                deleted += 1
+            except OSError:
+                pass
+        _replica_stats["refreshes"] += 1
+        _replica_stats["copied"] += copied
+        _replica_stats["deleted"] += deleted
+        _replica_stats["last_refresh"] = time.time()
+        _replica_stats["last_duration_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    if changed:
+        for fn in _replica_listeners:
+            try:
+                fn(changed)
+            except Exception as e:
+                print(f"[REPLICA] Listener failed: {e}")
+    return copied, deleted
+
+
+def _replica_write_blocked(path: Any) -> bool:
+    """True (and counted) when this replica must not save path: a snapshot file under DATA_DIR.
+    Per-process folders (REPLICA_SKIP_DIRS) and helper.json (rebuilt from kenpo_words.json,
+    no user data) stay writable."""
+    if not REPLICA_SOURCE or os.path.abspath(path) == os.path.abspath(HELPER_PATH):
+        return False
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(DATA_DIR))
+    if rel.startswith(os.pardir) or rel.split(os.sep, 1)[0] in REPLICA_SKIP_DIRS:
+        return False
+    with _replica_lock:
+        _replica_stats["dropped_writes"] += 1
+    return True
+
+
+def _replica_loop() -> None:
+    while True:
+        time.sleep(REPLICA_REFRESH_SECONDS)
+        try:
+            _replica_refresh()
+        except Exception as e:
+            with _replica_lock:
+                _replica_stats["errors"] += 1
+                _replica_stats["last_error"] = str(e)
+            print(f"[REPLICA] Refresh failed: {e}")
+
+
+def _replica_lag() -> float:
+    """Seconds since the snapshot last finished refreshing."""
+    last = _replica_stats["last_refresh"]
+    return round(time.time() - last, 1) if last else float("inf")
+
+
+def _replica_status() -> Optional[Dict[str, Any]]:
+    if not REPLICA_SOURCE:
+        return None
+    with _replica_lock:
+        out = dict(_replica_stats)
+        out["files"] = len(_replica_manifest)
+    out.update({"source": REPLICA_SOURCE, "primary_url": REPLICA_PRIMARY_URL or None,
+                "refresh_seconds": REPLICA_REFRESH_SECONDS, "lag_s": _replica_lag(),
+                "max_lag_s": REPLICA_MAX_LAG_SECONDS})
+    return out
+
+
+REPLICA_FORWARD_TIMEOUT = 60  # seconds; covers AI calls forwarded to the primary
+REPLICA_HOP_HEADERS = {"host", "connection", "keep-alive", "transfer-encoding", "content-length",
+                       "content-encoding", "accept-encoding", "server", "date"}
+
+
+def _replica_read_only():
+    """before_request hook installed by create_app() in replica mode: send writes to the primary."""
+    if request.method in ("GET", "HEAD", "OPTIONS"):
+        return None
+    if not REPLICA_PRIMARY_URL:
+        return jsonify({"error": "read_only_replica", "message": "This server is a read-only sync replica"}), 503
+    from urllib.error import HTTPError, URLError
+    from urllib.request import Request as UrlRequest, urlopen
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in REPLICA_HOP_HEADERS}
+    headers["X-Forwarded-For"] = (request.headers.get("X-Forwarded-For") or request.remote_addr or "").split(",")[0].strip()
+    req = UrlRequest(REPLICA_PRIMARY_URL + request.full_path.rstrip("?"), data=request.get_data(),
+                     headers=headers, method=request.method)
+    try:
+        upstream = urlopen(req, timeout=REPLICA_FORWARD_TIMEOUT)
+    except HTTPError as e:
+        upstream = e  # 4xx/5xx from the primary are relayed as-is
+    except (URLError, OSError) as e:
+        with _replica_lock:
+            _replica_stats["forward_errors"] += 1
+        print(f"[REPLICA] Forward to primary failed: {request.method} {request.path}: {e}")
+        return jsonify({"error": "primary_unavailable"}), 502
+    with upstream:
+        body = upstream.read()
+        resp = Response(body, status=upstream.getcode())
+        for k, v in upstream.headers.items():
+            if k.lower() not in REPLICA_HOP_HEADERS:
+                resp.headers.add(k, v)
+    with _replica_lock:
+        _replica_stats["forwarded"] += 1
+    return resp
+
+
+if REPLICA_SOURCE:
+    if not os.path.isdir(REPLICA_SOURCE):
+        raise SystemExit(f"[REPLICA] KENPO_REPLICA_SOURCE is not a folder: {REPLICA_SOURCE}")
+    os.makedirs(DATA_DIR, exist_ok=True)
+    _n, _ = _replica_refresh()
+    print(f"[REPLICA] Read-only replica of {REPLICA_SOURCE}: {_n} files in {DATA_DIR}, "
+          f"refresh every {REPLICA_REFRESH_SECONDS}s, writes forwarded to {REPLICA_PRIMARY_URL or '(none: 503)'}")
+    threading.Thread(target=_replica_loop, name="kenpo-replica", daemon=True).start()
+    _startup_phase("replica snapshot")
+
 # helper.json cache (term<->id mapping)
 _helper_cache = {}
 _helper_cache_mtime = -1.0
@@ -140,8 +689,7 @@ def _load_breakdowns() -> Dict[str, Any]:
     try:
         if not os.path.exists(BREAKDOWNS_PATH):
             return {}
-        with open(BREAKDOWNS_PATH, "r", encoding="utf-8") as f:
-            raw = json.load(f)
+        raw = _load_json_file(BREAKDOWNS_PATH)
         if isinstance(raw, dict):
             return raw
     except Exception:
@@ -150,10 +698,9 @@ def _load_breakdowns() -> Dict[str, Any]:
 
 def _save_breakdowns(data: Dict[str, Any]) -> None:
     os.makedirs(DATA_DIR, exist_ok=True)
-    tmp = BREAKDOWNS_PATH + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, BREAKDOWNS_PATH)
+    _save_json_file(BREAKDOWNS_PATH, data)
+    _stats_invalidate()
+    _feed_breakdowns_saved(data)
 
 # A small curated set of auto-suggestions (optional) – users can edit and save.
 AUTO_BREAKDOWNS: Dict[str, Dict[str, Any]] = {
@@ -279,6 +826,157 @@ def _responses_output_text(data: dict) -> str:
     return "\n".join(out).strip()
 
 
+# ============ LOCAL STUB AI PROVIDER ============
+# Offline stand-in for the OpenAI / Gemini REST APIs, for load tests and
+# benchmarks without network access or spend. Enable with
+#   KENPO_AI_STUB=openai | gemini | all
+# (or point OPENAI_API_BASE / GEMINI_API_BASE at "stub://..."). The stub answers
+# at the HTTP layer with the same JSON / SSE shapes the real APIs return, so the
+# normal parsers, caches and router run unchanged. Output is deterministic for a
+# given prompt; latency and failure rate are configurable.
+AI_STUB_LATENCY_MS = max(0, _safe_int(os.environ.get("KENPO_AI_STUB_LATENCY_MS"), 200))
+AI_STUB_JITTER_MS = max(0, _safe_int(os.environ.get("KENPO_AI_STUB_JITTER_MS"), 0))
+AI_STUB_STREAM_CHUNK_MS = max(0, _safe_int(os.environ.get("KENPO_AI_STUB_STREAM_CHUNK_MS"), 20))
+AI_STUB_FAIL_EVERY = max(0, _safe_int(os.environ.get("KENPO_AI_STUB_FAIL_EVERY"), 0))  # 0 = never fail
+
+_ai_stub_mode = (os.environ.get("KENPO_AI_STUB") or "").strip().lower()
+if _ai_stub_mode in ("1", "true", "yes", "on", "all", "both", "openai"):
+    OPENAI_API_BASE = "stub://openai"
+    OPENAI_API_KEY = OPENAI_API_KEY or "stub"
+if _ai_stub_mode in ("1", "true", "yes", "on", "all", "both", "gemini"):
+    GEMINI_API_BASE = "stub://gemini"
+    GEMINI_API_KEY = GEMINI_API_KEY or "stub"
+
+_ai_stub_calls = 0
+_ai_stub_lock = threading.Lock()
+
+
+class _StubAIResponse:
+    """Just enough of requests.Response for the AI callers (json, iter_lines, context manager)."""
+
+    def __init__(self, status_code: int, body: Any = None, sse: Optional[List[Any]] = None):
+        self.status_code = status_code
+        self._body = body
+        self._sse = sse
+        self.content = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.text = self.content.decode("utf-8")
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("no JSON body")
+        return self._body
+
+    def iter_lines(self):
+        for event in self._sse or []:
+            if AI_STUB_STREAM_CHUNK_MS:
+                time.sleep(AI_STUB_STREAM_CHUNK_MS / 1000.0)
+            yield ("data: " + (event if isinstance(event, str) else json.dumps(event))).encode("utf-8")
+            yield b""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _stub_syllables(term: str) -> str:
+    letters = re.sub(r"[^a-z]", "", term.lower())
+    return "-".join(letters[i:i + 3] for i in range(0, len(letters), 3)) or term.lower()
+
+
+def _stub_ai_text(prompt: str) -> str:
+    """Deterministic model output for the prompts this server sends."""
+    if '"literal"' in prompt and '"parts"' in prompt:
+        obj = _extract_json_object(prompt.split("INPUT:", 1)[-1]) or {}
+        term = str(obj.get("term") or "Stub")
+        parts = [{"part": t, "meaning": f"stub-{t.lower()}"} for t in re.split(r"[\s\-]+", term) if t]
+        return json.dumps({"parts": parts, "literal": " ".join(p["meaning"] for p in parts)})
+    if '{"items":' in prompt:
+        block = prompt.split("Terms:", 1)[-1].split("Respond ONLY", 1)[0]
+        items = []
+        for line in block.splitlines():
+            line = line.strip()
+            if not line.startswith("- "):
+                continue
+            term = re.sub(r"\s*\(meaning:.*\)$", "", line[2:]).strip()
+            items.append({"term": term, "definitions": [f"{term} def {i}" for i in range(1, 4)],
+                          "pronunciation": _stub_syllables(term), "groups": ["Stub", "General", "Misc"]})
+        return json.dumps({"items": items})
+    if '{"cards":' in prompt:
+        m = re.search(r"(?:exactly|up to) (\d+)", prompt)
+        n = min(200, _safe_int(m.group(1), 10)) if m else 10
+        topic = (re.search(r"about: (.+)", prompt) or re.search(r"(image|document)", prompt))
+        label = topic.group(1).strip()[:40] if topic else "stub"
+        return json.dumps({"cards": [{"term": f"{label} {i}", "definition": f"Stub definition {i}",
+                                      "pronunciation": "", "group": f"Stub {1 + (i - 1) // 10}"}
+                                     for i in range(1, n + 1)]})
+    m = re.search(r'term "([^"]+)"', prompt)
+    term = m.group(1) if m else "stub"
+    if "JSON array with 3" in prompt:
+        label = "group" if "category/group" in prompt else "def"
+        return json.dumps([f"{term} {label} {i}" for i in range(1, 4)])
+    if "pronunciation" in prompt.lower():
+        return _stub_syllables(term)
+    return f"Stub response ({hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8]})"
+
+
+def _stub_prompt_text(payload: Dict[str, Any]) -> str:
+    """Pull the prompt text out of an OpenAI (responses/chat) or Gemini request body."""
+    if "instructions" in payload or "input" in payload:
+        return f"{payload.get('instructions') or ''}\n\nINPUT:\n{payload.get('input') or ''}"
+    texts: List[str] = []
+    for msg in payload.get("messages") or []:
+        content = msg.get("content") if isinstance(msg, dict) else None
+        if isinstance(content, str):
+            texts.append(content)
+        for part in content if isinstance(content, list) else []:
+            if isinstance(part, dict) and part.get("type") == "text":
+                texts.append(str(part.get("text") or ""))
+    for c in payload.get("contents") or []:
+        for part in (c.get("parts") or []) if isinstance(c, dict) else []:
+            if isinstance(part, dict) and "text" in part:
+                texts.append(str(part["text"]))
+    return "\n".join(texts)
+
+
+def _stub_ai_post(url: str, payload: Dict[str, Any], stream: bool = False) -> _StubAIResponse:
+    global _ai_stub_calls
+    prompt = _stub_prompt_text(payload or {})
+    digest = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    with _ai_stub_lock:
+        _ai_stub_calls += 1
+        n = _ai_stub_calls
+    delay_ms = AI_STUB_LATENCY_MS + (digest % (AI_STUB_JITTER_MS + 1) if AI_STUB_JITTER_MS else 0)
+    if delay_ms:
+        time.sleep(delay_ms / 1000.0)
+    if AI_STUB_FAIL_EVERY and n % AI_STUB_FAIL_EVERY == 0:
+        return _StubAIResponse(503, {"error": {"message": "stub provider injected failure"}})
+
+    text = _stub_ai_text(prompt)
+    chunks = [text[i:i + 40] for i in range(0, len(text), 40)] or [""]
+    if url.startswith("stub://gemini"):
+        if ":streamGenerateContent" in url:
+            return _StubAIResponse(200, sse=[{"candidates": [{"content": {"parts": [{"text": c}]}}]} for c in chunks])
+        return _StubAIResponse(200, {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]})
+    if url.endswith("/v1/responses"):
+        return _StubAIResponse(200, {"output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}]})
+    if stream or payload.get("stream"):
+        return _StubAIResponse(200, sse=[{"choices": [{"delta": {"content": c}}]} for c in chunks] + ["[DONE]"])
+    return _StubAIResponse(200, {"choices": [{"message": {"role": "assistant", "content": text}}]})
+
+
+def _ai_post(url: str, **kwargs):
+    """requests.post for AI provider calls; stub:// bases are answered in-process."""
+    if url.startswith("stub://"):
+        return _stub_ai_post(url, kwargs.get("json") or {}, stream=bool(kwargs.get("stream")))
+    import requests  # imported on first AI call; it costs ~0.1-0.2s of startup otherwise
+    return requests.post(url, **kwargs)
+
+
 def _openai_breakdown(term: str, meaning: str = "", group: str = "") -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     """Call OpenAI server-side to propose a compound-term breakdown.
 
@@ -317,7 +1015,7 @@ def _openai_breakdown(term: str, meaning: str = "", group: str = "") -> Tuple[Op
     }
 
     try:
-        r = requests.post(
+        r = _ai_post(
             url,
             headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
             json=payload,
@@ -404,7 +1102,7 @@ def _gemini_breakdown(term: str, meaning: str = "", group: str = "") -> Tuple[Op
     }
 
     try:
-        r = requests.post(
+        r = _ai_post(
             url,
             headers={"Content-Type": "application/json", "x-goog-api-key": GEMINI_API_KEY},
             json=payload,
@@ -462,6 +1160,195 @@ def _gemini_breakdown(term: str, meaning: str = "", group: str = "") -> Tuple[Op
         return None, {"provider": "gemini", "status": None, "message": f"Gemini error: {e.__class__.__name__}"}
 
 
+# ============ AI PROVIDER ROUTER ============
+# Tracks per-provider health so "auto" mode can skip a provider that keeps
+# failing (circuit breaker) and optionally hedge a slow call by starting the
+# other provider after a latency threshold. Latency samples feed the admin page.
+AI_BREAKER_FAILURES = max(1, _safe_int(os.environ.get("KENPO_AI_BREAKER_FAILURES"), 3))
+AI_BREAKER_COOLDOWN = max(1, _safe_int(os.environ.get("KENPO_AI_BREAKER_COOLDOWN"), 60))
+AI_HEDGE_AFTER_MS = max(0, _safe_int(os.environ.get("KENPO_AI_HEDGE_MS"), 0))  # 0 = hedging off
+AI_LATENCY_SAMPLES = 200
+AI_PROVIDERS = ("openai", "gemini")
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class _ProviderHealth:
+    """Consecutive-failure circuit breaker plus a latency sample ring for one provider."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.hedge_wins = 0
+        self.trial_inflight = False
+        self.last_error = ""
+        self.latencies_ms: "deque[float]" = deque(maxlen=AI_LATENCY_SAMPLES)
+
+    def available(self) -> bool:
+        """Whether a call could be admitted now (no side effects; begin() claims it)."""
+        with self.lock:
+            return time.time() >= self.open_until and not self.trial_inflight
+
+    def begin(self) -> bool:
+        # Once the cooldown passes the breaker is half-open: exactly one caller gets
+        # a trial call, and a failure re-opens it immediately (failure count is kept).
+        with self.lock:
+            if time.time() < self.open_until:
+                return False
+            if self.consecutive_failures >= AI_BREAKER_FAILURES:
+                if self.trial_inflight:
+                    return False
+                self.trial_inflight = True
+            return True
+
+    def record(self, ok: bool, elapsed_ms: float, error: str = "") -> None:
+        with self.lock:
+            self.trial_inflight = False
+            self.latencies_ms.append(round(elapsed_ms, 1))
+            if ok:
+                self.successes += 1
+                self.consecutive_failures = 0
+                self.open_until = 0.0
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error[:200]
+            if self.consecutive_failures >= AI_BREAKER_FAILURES:
+                self.open_until = time.time() + AI_BREAKER_COOLDOWN
+                print(f"[AI] circuit open for {self.name} ({self.consecutive_failures} consecutive failures, {AI_BREAKER_COOLDOWN}s cooldown)")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            samples = list(self.latencies_ms)
+            open_for = max(0.0, self.open_until - time.time())
+            return {
+                "circuit": "open" if open_for > 0 else ("half_open" if self.consecutive_failures >= AI_BREAKER_FAILURES else "closed"),
+                "open_for_s": int(open_for),
+                "consecutive_failures": self.consecutive_failures,
+                "successes": self.successes,
+                "failures": self.failures,
+                "hedge_wins": self.hedge_wins,
+                "last_error": self.last_error,
+                "samples": len(samples),
+                "p50_ms": _percentile(samples, 50),
+                "p95_ms": _percentile(samples, 95),
+            }
+
+
+_ai_provider_health: Dict[str, _ProviderHealth] = {p: _ProviderHealth(p) for p in AI_PROVIDERS}
+_ai_router_pool: Optional[ThreadPoolExecutor] = None
+_ai_router_pool_lock = threading.Lock()
+
+
+def _ai_router_executor() -> ThreadPoolExecutor:
+    """Pool for hedged calls. Losing calls run on until their timeout, so it is sized
+    for two calls per server thread rather than queueing new requests behind them."""
+    global _ai_router_pool
+    with _ai_router_pool_lock:
+        if _ai_router_pool is None:
+            _ai_router_pool = ThreadPoolExecutor(max_workers=SERVER_THREADS * 2, thread_name_prefix="ai-router")
+        return _ai_router_pool
+
+
+def _ai_provider_configured(name: str) -> bool:
+    return bool(OPENAI_API_KEY) if name == "openai" else bool(GEMINI_API_KEY)
+
+
+def _ai_router_stats() -> Dict[str, Any]:
+    return {
+        "breaker_failures": AI_BREAKER_FAILURES,
+        "breaker_cooldown_s": AI_BREAKER_COOLDOWN,
+        "hedge_after_ms": AI_HEDGE_AFTER_MS,
+        "providers": {p: dict(_ai_provider_health[p].snapshot(), configured=_ai_provider_configured(p)) for p in AI_PROVIDERS},
+    }
+
+
+def _timed_breakdown(provider: str, term: str, meaning: str, group: str):
+    """Run one provider's breakdown call and record the outcome in its health stats."""
+    fn = _openai_breakdown if provider == "openai" else _gemini_breakdown
+    if not _ai_provider_health[provider].begin():
+        return None, {"provider": provider, "status": None, "message": "Provider temporarily skipped after repeated failures (circuit open)"}
+    t0 = time.perf_counter()
+    result, err = fn(term=term, meaning=meaning, group=group)
+    elapsed_ms = (time.perf_counter() - t0) * 1000.0
+    ok = bool(result and isinstance(result, dict))
+    _ai_provider_health[provider].record(ok, elapsed_ms, "" if ok else str((err or {}).get("message") or "no result"))
+    return (result if ok else None), err
+
+
+def _route_breakdown(providers: List[str], term: str, meaning: str, group: str) -> Tuple[Optional[Dict[str, Any]], str, Optional[Dict[str, Any]]]:
+    """Try providers in order, skipping unconfigured ones and open circuits.
+
+    With KENPO_AI_HEDGE_MS set, a primary call that is still running after the
+    threshold races against the next provider; the first usable result wins.
+    Returns (result, provider, last_error).
+    """
+    candidates = [p for p in providers if _ai_provider_configured(p)]
+    if not candidates:
+        p = providers[0] if providers else "openai"
+        return None, p, {"provider": p, "status": None, "message": f"{p.upper()}_API_KEY not set on server"}
+    ready = [p for p in candidates if _ai_provider_health[p].available()]
+    if not ready:
+        return None, candidates[0], {"provider": candidates[0], "status": None, "message": "Provider temporarily skipped after repeated failures (circuit open)"}
+
+    last_err: Optional[Dict[str, Any]] = None
+    if AI_HEDGE_AFTER_MS <= 0 or len(ready) < 2:
+        for p in ready:
+            result, err = _timed_breakdown(p, term, meaning, group)
+            if result:
+                return result, p, None
+            last_err = err or last_err
+        return None, ready[-1], last_err
+
+    # Hedged: start the primary, add the secondary if the primary is slow or fails.
+    primary, secondary = ready[0], ready[1]
+    pool = _ai_router_executor()
+    futures = {pool.submit(_timed_breakdown, primary, term, meaning, group): primary}
+    done, _ = wait(list(futures), timeout=AI_HEDGE_AFTER_MS / 1000.0)
+    hedged = not done
+    if hedged:
+        futures[pool.submit(_timed_breakdown, secondary, term, meaning, group)] = secondary
+    pending = set(futures)
+    started_secondary = hedged
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            p = futures[f]
+            try:
+                result, err = f.result()
+            except Exception as e:
+                result, err = None, {"provider": p, "status": None, "message": f"{p} error: {e.__class__.__name__}"}
+            if result:
+                if hedged and p == secondary:
+                    with _ai_provider_health[p].lock:
+                        _ai_provider_health[p].hedge_wins += 1
+                # Any loser keeps running in the pool and still records its latency.
+                return result, p, None
+            last_err = err or last_err
+        if not pending and not started_secondary:
+            started_secondary = True
+            f2 = pool.submit(_timed_breakdown, secondary, term, meaning, group)
+            futures[f2] = secondary
+            pending = {f2}
+    return None, secondary, last_err
+
+
+def _chat_max_tokens(prompt: str) -> int:
+    """Use a higher token limit for card generation (detected from the prompt)."""
+    p = prompt.lower()
+    return 4000 if "flashcard" in p or "cards" in p else 500
+
+
 def _call_openai_chat(prompt: str, model: str, api_key: str) -> str:
     """Simple OpenAI chat completion for generating text responses."""
     if not api_key:
@@ -469,17 +1356,14 @@ def _call_openai_chat(prompt: str, model: str, api_key: str) -> str:
     
     url = f"{OPENAI_API_BASE}/v1/chat/completions"
     
-    # Use higher token limit for card generation (detect from prompt)
-    max_tokens = 4000 if "flashcard" in prompt.lower() or "cards" in prompt.lower() else 500
-    
     payload = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": max_tokens,
+        "max_tokens": _chat_max_tokens(prompt),
         "temperature": 0.7
     }
     
-    r = requests.post(
+    r = _ai_post(
         url,
         headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
         json=payload,
@@ -507,18 +1391,15 @@ def _call_gemini_chat(prompt: str, model: str, api_key: str) -> str:
     
     url = f"{GEMINI_API_BASE}/v1beta/models/{model}:generateContent"
     
-    # Use higher token limit for card generation
-    max_tokens = 4000 if "flashcard" in prompt.lower() or "cards" in prompt.lower() else 500
-    
     payload = {
         "contents": [{"role": "user", "parts": [{"text": prompt}]}],
         "generationConfig": {
-            "maxOutputTokens": max_tokens,
+            "maxOutputTokens": _chat_max_tokens(prompt),
             "temperature": 0.7
         }
     }
     
-    r = requests.post(
+    r = _ai_post(
         url,
         headers={"Content-Type": "application/json", "x-goog-api-key": api_key},
         json=payload,
@@ -545,6 +1426,97 @@ def _call_gemini_chat(prompt: str, model: str, api_key: str) -> str:
     return ""
 
 
+def _iter_sse_data(r) -> Any:
+    """Yield the decoded JSON payload of each `data:` line in a server-sent event stream."""
+    for raw in r.iter_lines():
+        if not raw:
+            continue
+        line = raw.decode("utf-8", errors="replace") if isinstance(raw, bytes) else raw
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            yield json.loads(data)
+        except Exception:
+            continue
+
+
+def _stream_openai_chat(prompt: str, model: str, api_key: str):
+    """Streaming variant of _call_openai_chat: yields text deltas as they arrive."""
+    if not api_key:
+        raise Exception("OpenAI API key not configured")
+
+    url = f"{OPENAI_API_BASE}/v1/chat/completions"
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": _chat_max_tokens(prompt),
+        "temperature": 0.7,
+        "stream": True,
+    }
+
+    with _ai_post(
+        url,
+        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        json=payload,
+        timeout=60,
+        stream=True,
+    ) as r:
+        if r.status_code != 200:
+            try:
+                err = r.json().get("error", {}).get("message", f"HTTP {r.status_code}")
+            except:
+                err = f"HTTP {r.status_code}"
+            raise Exception(f"OpenAI error: {err}")
+
+        for data in _iter_sse_data(r):
+            choices = (data.get("choices") or []) if isinstance(data, dict) else []
+            if choices and isinstance(choices[0], dict):
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+
+
+def _stream_gemini_chat(prompt: str, model: str, api_key: str):
+    """Streaming variant of _call_gemini_chat: yields text deltas as they arrive."""
+    if not api_key:
+        raise Exception("Gemini API key not configured")
+
+    url = f"{GEMINI_API_BASE}/v1beta/models/{model}:streamGenerateContent?alt=sse"
+    payload = {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "maxOutputTokens": _chat_max_tokens(prompt),
+            "temperature": 0.7
+        }
+    }
+
+    with _ai_post(
+        url,
+        headers={"Content-Type": "application/json", "x-goog-api-key": api_key},
+        json=payload,
+        timeout=60,
+        stream=True,
+    ) as r:
+        if r.status_code != 200:
+            try:
+                err = r.json().get("error", {}).get("message", f"HTTP {r.status_code}")
+            except:
+                err = f"HTTP {r.status_code}"
+            raise Exception(f"Gemini error: {err}")
+
+        for data in _iter_sse_data(r):
+            try:
+                parts = data["candidates"][0]["content"]["parts"]
+            except Exception:
+                continue
+            for part in parts or []:
+                if isinstance(part, dict) and part.get("text"):
+                    yield part["text"]
+
+
 USERS_DIR = os.path.join(DATA_DIR, "users")
 PROFILES_PATH = os.path.join(DATA_DIR, "profiles.json")
 SECRET_PATH = os.path.join(DATA_DIR, "secret_key.txt")
@@ -555,10 +1527,9 @@ def _load_admin_usernames() -> set:
     """Load admin usernames from admin_users.json (Source of Truth)."""
     try:
         if os.path.exists(ADMIN_USERS_PATH):
-            with open(ADMIN_USERS_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                usernames = data.get("admin_usernames", [])
-                return {u.lower() for u in usernames}
+            data = _load_json_file(ADMIN_USERS_PATH)
+            usernames = data.get("admin_usernames", [])
+            return {u.lower() for u in usernames}
     except Exception as e:
         print(f"[WARN] Could not load admin_users.json: {e}")
     # Fallback to hardcoded default
@@ -568,7 +1539,19 @@ def _load_admin_usernames() -> set:
 ADMIN_USERNAMES = _load_admin_usernames()
 
 PORT = int(os.environ.get("KENPO_WEB_PORT", "8009"))
-app = Flask(__name__, static_folder="static")
+
+# Routes are grouped into blueprints by URL prefix, so a reverse proxy can send
+# e.g. all sync traffic to a process that only registers the sync blueprint.
+# create_app() (end of this file) registers core plus the KENPO_BLUEPRINTS list.
+# Metrics and profiler routes are per process, so they live on core: every worker
+# (a sync-only worker or a replica too) answers for itself.
+core_bp = Blueprint("core", __name__)      # request hooks, login/logout/me, health, pages, static files, metrics, profiler
+study_bp = Blueprint("study", __name__)    # cards, counts, status, settings, custom set, breakdowns (web)
+sync_bp = Blueprint("sync", __name__)      # /api/sync/*, /api/web/sync/*, /api/vocabulary, POST /api/breakdowns
+admin_bp = Blueprint("admin", __name__)    # /api/admin/* (but metrics/profiler), /api/web/admin/*
+decks_bp = Blueprint("decks", __name__)    # /api/decks*, /api/user_cards*, invite-code redemption
+ai_bp = Blueprint("ai", __name__)          # /api/ai*, /api/breakdown_autofill
+BLUEPRINTS: Dict[str, Blueprint] = {"study": study_bp, "sync": sync_bp, "admin": admin_bp, "decks": decks_bp, "ai": ai_bp}
 
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(USERS_DIR, exist_ok=True)
@@ -591,7 +1574,6 @@ def _load_or_create_secret() -> str:
 
 # -------- API Key Encryption (for safe storage/git commit) --------
 import base64
-import hmac
 
 def _derive_encryption_key(secret: str) -> bytes:
     """Derive a 32-byte key from the secret using SHA-256."""
@@ -634,8 +1616,8 @@ def _save_encrypted_api_keys(keys_dict: dict) -> bool:
         secret = _load_or_create_secret()
         encrypted = _encrypt_api_keys(keys_dict, secret)
         os.makedirs(DATA_DIR, exist_ok=True)
-        with open(API_KEYS_PATH, "w", encoding="utf-8") as f:
-            f.write(encrypted)
+        _write_file_atomic(API_KEYS_PATH, lambda f: f.write(encrypted))
+        _stats_invalidate()
         return True
     except Exception as e:
         print(f"[ERROR] Failed to save API keys: {e}")
@@ -664,11 +1646,12 @@ def _is_admin_user(username: str) -> bool:
 # Initialize API keys from encrypted storage at startup
 _init_api_keys_from_encrypted()
 
-app.secret_key = os.environ.get("KENPO_SECRET_KEY", "") or _load_or_create_secret()
+SECRET_KEY = os.environ.get("KENPO_SECRET_KEY", "") or _load_or_create_secret()
+_startup_phase("AI setup, admin users, API keys")
 # ----------------------------
 # Version + request audit log
 # ----------------------------
-VERSION_FILE = os.path.join(app.root_path, "version.json")
+VERSION_FILE = os.path.join(APP_DIR, "version.json")
 _VERSION_CACHE = None
 _VERSION_MTIME = 0.0
 
@@ -678,17 +1661,553 @@ def get_version():
     try:
         st = os.stat(VERSION_FILE)
         if _VERSION_CACHE is None or st.st_mtime != _VERSION_MTIME:
-            with open(VERSION_FILE, "r", encoding="utf-8") as f:
-                _VERSION_CACHE = json.load(f)
+            _VERSION_CACHE = _load_json_file(VERSION_FILE)
             _VERSION_MTIME = st.st_mtime
     except Exception:
         return {"name": "KenpoFlashcardsWebServer", "version": "unknown", "build": "unknown"}
     return _VERSION_CACHE or {"name": "KenpoFlashcardsWebServer", "version": "unknown", "build": "unknown"}
 
+# ============ REQUEST METRICS ============
+# Per-route latency histograms (HDR-style: log2 buckets with 8 linear
+# sub-buckets, ~12% relative error from 10us to minutes, constant memory),
+# plus status codes, bytes served and JSON data-file reads/writes.
+# Exposed at /api/admin/metrics (JSON) and /api/admin/metrics/prometheus.
+METRICS_TOKEN = (os.environ.get("KENPO_METRICS_TOKEN") or "").strip()  # lets a Prometheus scraper skip the admin login
+_HIST_SUB_BUCKETS = 8
+_PROM_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _LatencyHistogram:
+    """Sparse log-linear histogram of durations in microseconds."""
+
+    __slots__ = ("counts", "prom", "total", "sum_us", "max_us")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.prom = [0] * (len(_PROM_BUCKETS_S) + 1)
+        self.total = 0
+        self.sum_us = 0.0
+        self.max_us = 0.0
+
+    @staticmethod
+    def _index(us: float) -> int:
+        if us < 10.0:
+            return 0
+        mant, exp = math.frexp(us / 10.0)  # us/10 = mant * 2**exp, 0.5 <= mant < 1
+        return exp * _HIST_SUB_BUCKETS + int((mant * 2.0 - 1.0) * _HIST_SUB_BUCKETS)
+
+    @staticmethod
+    def _upper_us(index: int) -> float:
+        if index <= 0:
+            return 10.0
+        exp, sub = divmod(index, _HIST_SUB_BUCKETS)
+        return 10.0 * (2.0 ** (exp - 1)) * (1.0 + (sub + 1) / _HIST_SUB_BUCKETS)
+
+    def record(self, us: float) -> None:
+        i = self._index(us)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.prom[bisect.bisect_left(_PROM_BUCKETS_S, us / 1e6)] += 1
+        self.total += 1
+        self.sum_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def percentile_ms(self, pct: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank = max(1, int(math.ceil(pct / 100.0 * self.total)))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return round(min(self._upper_us(i), self.max_us) / 1000.0, 3)
+        return round(self.max_us / 1000.0, 3)
+
+
+class _RouteMetrics:
+    __slots__ = ("hist", "statuses", "bytes_out", "json_reads", "json_writes", "json_read_bytes", "json_write_bytes",
+                 "json_duplicate_reads", "json_classes")
+
+    def __init__(self):
+        self.hist = _LatencyHistogram()
+        self.statuses: Dict[int, int] = {}
+        self.bytes_out = 0
+        self.json_reads = 0
+        self.json_writes = 0
+        self.json_read_bytes = 0
+        self.json_write_bytes = 0
+        self.json_duplicate_reads = 0
+        self.json_classes: Dict[str, Dict[str, float]] = {}
+
+
+_route_metrics: Dict[Tuple[str, str], _RouteMetrics] = {}
+_route_metrics_lock = threading.Lock()
+_metrics_started = time.time()
+
+
+@core_bp.before_app_request
+def _metrics_start():
+    g.req_t0 = time.perf_counter()
+
+
+@core_bp.after_app_request
+def _metrics_record(response):
+    t0 = g.get("req_t0")
+    if t0 is None:
+        return response
+    us = (time.perf_counter() - t0) * 1e6
+    rule = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    io = g.get("json_io") or {}
+    size = 0 if response.is_streamed else (response.calculate_content_length() or 0)
+    key = (request.method, rule)
+    with _route_metrics_lock:
+        m = _route_metrics.get(key)
+        if m is None:
+            m = _route_metrics[key] = _RouteMetrics()
+        m.hist.record(us)
+        m.statuses[response.status_code] = m.statuses.get(response.status_code, 0) + 1
+        m.bytes_out += size
+        m.json_reads += io.get("read", 0)
+        m.json_writes += io.get("write", 0)
+        m.json_read_bytes += io.get("read_bytes", 0)
+        m.json_write_bytes += io.get("write_bytes", 0)
+        m.json_duplicate_reads += io.get("duplicate_reads", 0)
+        for cls, c in (g.get("json_io_classes") or {}).items():
+            agg = m.json_classes.setdefault(cls, {"reads": 0, "writes": 0, "bytes": 0, "ms": 0.0})
+            for k in agg:
+                agg[k] += c[k]
+    if IO_WARN_DUPLICATES and io.get("duplicate_reads"):
+        dupes = {os.path.basename(p): n for p, n in (g.get("json_read_paths") or {}).items() if n > 1}
+        print(f"[IO] {request.method} {request.path} re-read files in one request: {dupes}")
+    return response
+
+
+def _metrics_authorized() -> Optional[Tuple[Any, int]]:
+    """None if the caller may read metrics, else an error response tuple."""
+    auth = request.headers.get("Authorization", "")
+    if METRICS_TOKEN and hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+        return None
+    uid = current_user_id()
+    if not uid:
+        return jsonify({"error": "login_required"}), 401
+    user = _get_user(uid)
+    if not _is_admin_user(user.get("username", "") if user else ""):
+        return jsonify({"error": "admin_required"}), 403
+    return None
+
+
+def _metrics_snapshot() -> List[Tuple[Tuple[str, str], _RouteMetrics]]:
+    with _route_metrics_lock:
+        return sorted(_route_metrics.items(), key=lambda kv: kv[1].hist.sum_us, reverse=True)
+
+
+@core_bp.route("/api/admin/metrics", methods=["GET", "POST"])
+def api_admin_metrics():
+    """Per-route request metrics, hottest (most total time) first.
+    POST with {"reset": true} returns them and then clears them."""
+    denied = _metrics_authorized()
+    if denied:
+        return denied
+    global _metrics_started
+    routes = []
+    for (method, rule), m in _metrics_snapshot():
+        h = m.hist
+        routes.append({
+            "method": method,
+            "route": rule,
+            "count": h.total,
+            "total_ms": round(h.sum_us / 1000.0, 1),
+            "mean_ms": round(h.sum_us / h.total / 1000.0, 3) if h.total else None,
+            "p50_ms": h.percentile_ms(50),
+            "p90_ms": h.percentile_ms(90),
+            "p99_ms": h.percentile_ms(99),
+            "max_ms": round(h.max_us / 1000.0, 3),
+            "status": {str(k): v for k, v in sorted(m.statuses.items())},
+            "bytes_out": m.bytes_out,
+            "json_reads": m.json_reads,
+            "json_writes": m.json_writes,
+            "json_read_bytes": m.json_read_bytes,
+            "json_write_bytes": m.json_write_bytes,
+            "json_reads_per_request": round(m.json_reads / h.total, 2) if h.total else 0,
+            "json_duplicate_reads": m.json_duplicate_reads,
+            "json_by_class": {cls: {k: round(v, 1) for k, v in c.items()} for cls, c in sorted(m.json_classes.items())},
+        })
+    out = {"since": _metrics_started, "uptime_s": round(time.time() - _metrics_started, 1), "routes": routes,
+           "json_io": _json_io_stats(), "server": _server_status(),
+           "tokens": _token_store_stats(), "login": _login_stats(),
+           "compression": _compression_stats(), "replica": _replica_status(),
+           "feed": _feed_stats()}
+    if request.method == "POST" and (request.get_json(silent=True) or {}).get("reset"):
+        with _route_metrics_lock:
+            _route_metrics.clear()
+        _metrics_started = time.time()
+    return jsonify(out)
+
+
+@core_bp.get("/api/admin/metrics/prometheus")
+def api_admin_metrics_prometheus():
+    """Prometheus text exposition of the per-route metrics."""
+    denied = _metrics_authorized()
+    if denied:
+        return denied
+
+    def esc(v: str) -> str:
+        return v.replace("\\", "\\\\").replace('"', '\\"')
+
+    lines = [
+        "# HELP kenpo_http_request_duration_seconds Request wall time by route.",
+        "# TYPE kenpo_http_request_duration_seconds histogram",
+    ]
+    snap = _metrics_snapshot()
+    for (method, rule), m in snap:
+        labels = f'method="{method}",route="{esc(rule)}"'
+        cumulative = 0
+        for le, n in zip(_PROM_BUCKETS_S, m.hist.prom):
+            cumulative += n
+            lines.append(f'kenpo_http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f'kenpo_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m.hist.total}')
+        lines.append(f"kenpo_http_request_duration_seconds_sum{{{labels}}} {m.hist.sum_us / 1e6:.6f}")
+        lines.append(f"kenpo_http_request_duration_seconds_count{{{labels}}} {m.hist.total}")
+    for name, help_text, attr in (
+        ("kenpo_http_response_bytes_total", "Response body bytes served by route.", "bytes_out"),
+        ("kenpo_json_file_reads_total", "JSON data files read while serving the route.", "json_reads"),
+        ("kenpo_json_file_writes_total", "JSON data files written while serving the route.", "json_writes"),
+        ("kenpo_json_file_read_bytes_total", "Bytes of JSON data files read by route.", "json_read_bytes"),
+        ("kenpo_json_file_write_bytes_total", "Bytes of JSON data files written by route.", "json_write_bytes"),
+        ("kenpo_json_file_duplicate_reads_total", "Repeat reads of an already-read file within one request.", "json_duplicate_reads"),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (method, rule), m in snap:
+            lines.append(f'{name}{{method="{method}",route="{esc(rule)}"}} {getattr(m, attr)}')
+    lines += ["# HELP kenpo_http_responses_total Responses by route and status code.", "# TYPE kenpo_http_responses_total counter"]
+    for (method, rule), m in snap:
+        for code, n in sorted(m.statuses.items()):
+            lines.append(f'kenpo_http_responses_total{{method="{method}",route="{esc(rule)}",code="{code}"}} {n}')
+    io_totals = _json_io_stats()
+    for name, help_text, key in (
+        ("kenpo_json_io_reads_total", "JSON data file reads by file class (all callers).", "reads"),
+        ("kenpo_json_io_writes_total", "JSON data file writes by file class (all callers).", "writes"),
+        ("kenpo_json_io_read_bytes_total", "JSON data file bytes read by file class.", "read_bytes"),
+        ("kenpo_json_io_write_bytes_total", "JSON data file bytes written by file class.", "write_bytes"),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for cls, t in io_totals.items():
+            lines.append(f'{name}{{class="{esc(cls)}"}} {t[key]}')
+    lines += ["# HELP kenpo_json_io_seconds_total Time spent in JSON data file I/O by file class and operation.",
+              "# TYPE kenpo_json_io_seconds_total counter"]
+    for cls, t in io_totals.items():
+        lines.append(f'kenpo_json_io_seconds_total{{class="{esc(cls)}",op="read"}} {t["read_ms"] / 1000.0:.6f}')
+        lines.append(f'kenpo_json_io_seconds_total{{class="{esc(cls)}",op="write"}} {t["write_ms"] / 1000.0:.6f}')
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+# ============ RESPONSE COMPRESSION ============
+# JSON API responses (cards, sync helper/breakdowns/pull, admin stats,
+# vocabulary, ...) of at least KENPO_COMPRESS_MIN_BYTES are brotli- (when the
+# optional `brotli` package is installed) or gzip-encoded when the client
+# accepts it; Android's OkHttp asks for gzip by default. Payloads that repeat
+# byte for byte (the helper, vocabulary, breakdowns between edits) are only
+# compressed once: compressed GET bodies of 16 KB+ are kept in an LRU keyed by
+# a hash of the uncompressed body. Streamed and file responses are untouched.
+# Registered after the metrics hook, so route metrics count wire bytes.
+COMPRESS_ENABLED = (os.environ.get("KENPO_COMPRESS", "1") or "1").strip().lower() not in ("0", "false", "no", "off")
+COMPRESS_MIN_BYTES = max(0, _safe_int(os.environ.get("KENPO_COMPRESS_MIN_BYTES"), 1024))
+COMPRESS_LEVEL = min(9, max(1, _safe_int(os.environ.get("KENPO_COMPRESS_LEVEL"), 6)))
+COMPRESS_BR_QUALITY = min(11, max(0, _safe_int(os.environ.get("KENPO_COMPRESS_BR_QUALITY"), 4)))
+COMPRESS_CACHE_BYTES = max(0, _safe_int(os.environ.get("KENPO_COMPRESS_CACHE_MB"), 16)) * 1024 * 1024
+COMPRESS_CACHE_MIN_BYTES = 16 * 1024
+
+_compress_cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+_compress_cache_bytes = 0
+_compress_lock = threading.Lock()
+_compress_counts = {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cache_hits": 0}
+_brotli_ok: Optional[bool] = None
+
+
+def _compress_encoding() -> str:
+    """Best encoding the client accepts: "br", "gzip" or ""."""
+    global _brotli_ok
+    accept = request.accept_encodings
+    if accept.quality("br") > 0:
+        if _brotli_ok is None:
+            try:
+                import brotli  # noqa: F401
+                _brotli_ok = True
+            except ImportError:
+                _brotli_ok = False
+        if _brotli_ok:
+            return "br"
+    return "gzip" if accept.quality("gzip") > 0 else ""
+
+
+def _compress_body(raw: bytes, enc: str) -> bytes:
+    if enc == "br":
+        import brotli
+        return brotli.compress(raw, quality=COMPRESS_BR_QUALITY)
+    import gzip
+    return gzip.compress(raw, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+
+def _compress_cached(raw: bytes, enc: str) -> bytes:
+    global _compress_cache_bytes
+    key = (hashlib.sha1(raw).hexdigest(), enc)
+    with _compress_lock:
+        body = _compress_cache.get(key)
+        if body is not None:
+            _compress_cache.move_to_end(key)
+            _compress_counts["cache_hits"] += 1
+            return body
+    body = _compress_body(raw, enc)
+    with _compress_lock:
+        if key not in _compress_cache:
+            _compress_cache[key] = body
+            _compress_cache_bytes += len(body)
+            while _compress_cache_bytes > COMPRESS_CACHE_BYTES and _compress_cache:
+                _, old = _compress_cache.popitem(last=False)
+                _compress_cache_bytes -= len(old)
+    return body
+
+
+@core_bp.after_app_request
+def _compress_response(response):
+    if not COMPRESS_ENABLED or response.direct_passthrough or response.is_streamed:
+        return response
+    if response.mimetype != "application/json" or response.status_code in (204, 206, 304):
+        return response
+    if "Content-Encoding" in response.headers:
+        return response
+    raw = response.get_data()
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add("Accept-Encoding")
+    enc = _compress_encoding()
+    if not enc:
+        return response
+    if request.method == "GET" and COMPRESS_CACHE_BYTES and len(raw) >= COMPRESS_CACHE_MIN_BYTES:
+        body = _compress_cached(raw, enc)
+    else:
+        body = _compress_body(raw, enc)
+    if len(body) >= len(raw):
+        return response
+    response.set_data(body)
+    response.headers["Content-Encoding"] = enc
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{enc}", weak)
+    with _compress_lock:
+        _compress_counts["responses"] += 1
+        _compress_counts["bytes_in"] += len(raw)
+        _compress_counts["bytes_out"] += len(body)
+    return response
+
+
+def _compression_stats() -> Dict[str, Any]:
+    with _compress_lock:
+        out: Dict[str, Any] = dict(_compress_counts)
+        out["cache_entries"] = len(_compress_cache)
+        out["cache_bytes"] = _compress_cache_bytes
+    out["ratio"] = round(out["bytes_out"] / out["bytes_in"], 3) if out["bytes_in"] else None
+    out["brotli"] = bool(_brotli_ok)
+    return out
+
+
+# ============ SAMPLING PROFILER (admin, opt-in) ============
+# Off by default: while disabled the only cost is one dict lookup per request.
+# When an admin enables it (POST /api/admin/profiler) a share of requests, or
+# only requests for one route, run under cProfile (aggregated into pstats) while
+# a sampler thread records their Python stacks every few ms (collapsed-stack
+# format for flamegraph.pl / speedscope). Only one request is profiled at a time.
+_profiler_state: Dict[str, Any] = {
+    "enabled": False,
+    "sample_pct": 10.0,
+    "route": "",
+    "max_requests": 200,
+    "interval_ms": max(1, _safe_int(os.environ.get("KENPO_PROFILER_INTERVAL_MS"), 5)),
+    "profiled": 0,
+    "skipped_busy": 0,
+    "started_at": None,
+}
+_profiler_lock = threading.Lock()          # guards state + aggregates
+_profiler_active = threading.Lock()        # held while a request is being profiled
+_profiler_stats = None                     # pstats.Stats aggregate
+_profiler_stacks: Dict[str, int] = {}      # collapsed stack -> samples
+_profiler_thread_id: Optional[int] = None  # request thread currently profiled
+_profiler_sampler: Optional[threading.Thread] = None
+
+
+def _profiler_sample_loop() -> None:
+    while _profiler_state["enabled"]:
+        tid = _profiler_thread_id
+        if tid is not None:
+            frame = sys._current_frames().get(tid)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                with _profiler_lock:
+                    _profiler_stacks[key] = _profiler_stacks.get(key, 0) + 1
+        time.sleep(_profiler_state["interval_ms"] / 1000.0)
+
+
+def _profiler_route_matches() -> bool:
+    route = _profiler_state["route"]
+    if not route:
+        return True
+    rule = request.url_rule.rule if request.url_rule is not None else ""
+    return rule == route or request.path.startswith(route)
+
+
+@core_bp.before_app_request
+def _profiler_maybe_start():
+    global _profiler_thread_id
+    if not _profiler_state["enabled"]:
+        return
+    if not _profiler_route_matches() or random.random() * 100.0 >= _profiler_state["sample_pct"]:
+        return
+    if not _profiler_active.acquire(blocking=False):
+        with _profiler_lock:
+            _profiler_state["skipped_busy"] += 1
+        return
+    import cProfile
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except Exception as e:  # another profiler (debugger/IDE) already active
+        _profiler_active.release()
+        print(f"[PROFILE] could not start cProfile: {e}")
+        return
+    g.profiler = prof
+    _profiler_thread_id = threading.get_ident()
+
+
+@core_bp.teardown_app_request
+def _profiler_maybe_stop(exc=None):
+    global _profiler_thread_id, _profiler_stats
+    prof = g.pop("profiler", None)
+    if prof is None:
+        return
+    prof.disable()
+    _profiler_thread_id = None
+    try:
+        import pstats
+        with _profiler_lock:
+            if _profiler_stats is None:
+                _profiler_stats = pstats.Stats(prof)
+            else:
+                _profiler_stats.add(prof)
+            _profiler_state["profiled"] += 1
+            if _profiler_state["profiled"] >= _profiler_state["max_requests"]:
+                _profiler_state["enabled"] = False
+                print(f"[PROFILE] stopped after {_profiler_state['profiled']} requests")
+    finally:
+        _profiler_active.release()
+
+
+def _profiler_status() -> Dict[str, Any]:
+    with _profiler_lock:
+        out = dict(_profiler_state)
+        out["stack_samples"] = sum(_profiler_stacks.values())
+        out["has_pstats"] = _profiler_stats is not None
+    return out
+
+
+def _require_admin_json():
+    """None for an admin session, else the usual error response tuple."""
+    uid = current_user_id()
+    if not uid:
+        return jsonify({"error": "login_required"}), 401
+    user = _get_user(uid)
+    if not _is_admin_user(user.get("username", "") if user else ""):
+        return jsonify({"error": "admin_required"}), 403
+    return None
+
+
+@core_bp.get("/api/admin/profiler")
+def api_admin_profiler_status():
+    denied = _require_admin_json()
+    if denied:
+        return denied
+    return jsonify(_profiler_status())
+
+
+@core_bp.post("/api/admin/profiler")
+def api_admin_profiler_configure():
+    """Enable/disable sampling.
+
+    JSON: {"enabled": true, "sample_pct": 10, "route": "/api/sync/push",
+           "max_requests": 200, "interval_ms": 5, "reset": false}
+    """
+    global _profiler_sampler, _profiler_stats
+    denied = _require_admin_json()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    enable = bool(data.get("enabled", True))
+    with _profiler_lock:
+        reset = data.get("reset")
+        if reset is None:
+            reset = enable and not _profiler_state["enabled"]  # a fresh start clears old results
+        if reset:
+            _profiler_stats = None
+            _profiler_stacks.clear()
+            _profiler_state["profiled"] = 0
+            _profiler_state["skipped_busy"] = 0
+        if "sample_pct" in data:
+            try:
+                _profiler_state["sample_pct"] = min(100.0, max(0.0, float(data.get("sample_pct"))))
+            except (TypeError, ValueError):
+                return jsonify({"error": "sample_pct must be a number"}), 400
+        if "route" in data:
+            _profiler_state["route"] = str(data.get("route") or "").strip()
+        if "max_requests" in data:
+            _profiler_state["max_requests"] = max(1, _safe_int(data.get("max_requests"), 200))
+        if "interval_ms" in data:
+            _profiler_state["interval_ms"] = min(1000, max(1, _safe_int(data.get("interval_ms"), 5)))
+        _profiler_state["enabled"] = enable
+        if enable:
+            _profiler_state["started_at"] = _now()
+    if enable and (_profiler_sampler is None or not _profiler_sampler.is_alive()):
+        _profiler_sampler = threading.Thread(target=_profiler_sample_loop, name="profiler-sampler", daemon=True)
+        _profiler_sampler.start()
+    user = _get_user(current_user_id()) or {}
+    log_activity("info", f"Profiler {'enabled' if enable else 'disabled'} ({_profiler_state['sample_pct']}% {_profiler_state['route'] or 'all routes'})", user.get("username", ""))
+    return jsonify(_profiler_status())
+
+
+@core_bp.get("/api/admin/profiler/download")
+def api_admin_profiler_download():
+    """Aggregated results: ?format=pstats (marshal, for pstats/snakeviz),
+    collapsed (flamegraph.pl / speedscope) or text (top functions by cumulative time)."""
+    denied = _require_admin_json()
+    if denied:
+        return denied
+    fmt = (request.args.get("format") or "text").strip().lower()
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    with _profiler_lock:
+        if fmt == "collapsed":
+            body = "".join(f"{stack} {n}\n" for stack, n in sorted(_profiler_stacks.items()))
+            return Response(body, mimetype="text/plain",
+                            headers={"Content-Disposition": f"attachment; filename=kenpo-profile-{stamp}.collapsed"})
+        if _profiler_stats is None:
+            return jsonify({"error": "no profile data yet"}), 404
+        if fmt == "pstats":
+            import marshal
+            return Response(marshal.dumps(_profiler_stats.stats), mimetype="application/octet-stream",
+                            headers={"Content-Disposition": f"attachment; filename=kenpo-profile-{stamp}.pstats"})
+        import io
+        buf = io.StringIO()
+        _profiler_stats.stream = buf
+        _profiler_stats.sort_stats("cumulative").print_stats(60)
+        return Response(buf.getvalue(), mimetype="text/plain")
+
+
 # Optional allowlist: set env var KENPO_ALLOWED_IPS="1.2.3.4,5.6.7.8"
 ALLOWED_IPS = {ip.strip() for ip in os.environ.get("KENPO_ALLOWED_IPS", "").split(",") if ip.strip()}
 
-@app.before_request
+@core_bp.before_app_request
 def _access_log_and_optional_allowlist():
     ip = (request.headers.get("X-Forwarded-For") or request.remote_addr or "").split(",")[0].strip()
     ua = (request.headers.get("User-Agent") or "").strip()
@@ -712,11 +2231,6 @@ def _stable_id(group: str, subgroup: str, term: str, meaning: str, pron: str) ->
     return hashlib.sha1(base).hexdigest()[:16]
 
 
-def _load_json_file(path: str) -> Any:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
 def _get_first(d: Dict[str, Any], keys: List[str]) -> Any:
     for k in keys:
         if k in d and d[k] is not None:
@@ -761,11 +2275,11 @@ def _normalize_cards(raw: Any) -> List[Dict[str, Any]]:
 
     if isinstance(raw, dict):
         if isinstance(raw.get("groups"), list):
-            for g in raw["groups"]:
-                if not isinstance(g, dict):
+            for grp in raw["groups"]:
+                if not isinstance(grp, dict):
                     continue
-                gname = _get_first(g, ["name", "group", "section", "category", "title"]) or "General"
-                gcards = g.get("cards") or g.get("items") or g.get("words") or []
+                gname = _get_first(grp, ["name", "group", "section", "category", "title"]) or "General"
+                gcards = grp.get("cards") or grp.get("items") or grp.get("words") or []
                 if isinstance(gcards, list):
                     for item in gcards:
                         if isinstance(item, dict):
@@ -895,10 +2409,7 @@ def load_helper_cached() -> Tuple[Dict[str, Any], str]:
             return {}, status
         helper = _build_helper(cards, kenpo_mtime)
         os.makedirs(DATA_DIR, exist_ok=True)
-        tmp = HELPER_PATH + ".tmp"
-        with open(tmp, "w", encoding="utf-8") as f:
-            json.dump(helper, f, ensure_ascii=False, indent=2)
-        os.replace(tmp, HELPER_PATH)
+        _save_json_file(HELPER_PATH, helper)
         _helper_cache = helper
         _helper_cache_mtime = os.path.getmtime(HELPER_PATH)
 
@@ -973,6 +2484,8 @@ def _default_settings() -> Dict[str, Any]:
             "custom_set_reverse_cards": False,
             "custom_set_show_group_label": False,
             "custom_set_show_breakdown": True,
+            # Web UI keeps a change-feed stream open to refresh on changes from other devices
+            "live_updates": False,
         },
         "groups": {},
         # Custom Set card IDs (starred cards)
@@ -987,8 +2500,7 @@ def _load_profiles() -> Dict[str, Any]:
     if not os.path.exists(PROFILES_PATH):
         return {"users": {}}
     try:
-        with open(PROFILES_PATH, "r", encoding="utf-8") as f:
-            p = json.load(f)
+        p = _load_json_file(PROFILES_PATH)
         if not isinstance(p, dict):
             return {"users": {}}
         p.setdefault("users", {})
@@ -1030,8 +2542,8 @@ def _migrate_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def _save_profiles(p: Dict[str, Any]) -> None:
-    with open(PROFILES_PATH, "w", encoding="utf-8") as f:
-        json.dump(p, f, ensure_ascii=False, indent=2)
+    _save_json_file(PROFILES_PATH, p)
+    _stats_invalidate()
 
 
 def _get_user(user_id: str) -> Optional[Dict[str, Any]]:
@@ -1065,8 +2577,9 @@ def _progress_path(user_id: str) -> str:
 def _ensure_user_progress(user_id: str) -> None:
     path = _progress_path(user_id)
     if not os.path.exists(path):
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump({"__settings__": _default_settings()}, f, ensure_ascii=False, indent=2)
+        with _json_txn(path):
+            if not os.path.exists(path):
+                _save_json_file(path, {"__settings__": _default_settings()})
 
 
 def current_user_id() -> Optional[str]:
@@ -1090,8 +2603,7 @@ def load_progress(user_id: str) -> Dict[str, Any]:
         return {"__settings__": _default_settings()}
 
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            p = json.load(f)
+        p = _load_json_file(path)
     except json.JSONDecodeError:
         p = {}
 
@@ -1104,47 +2616,639 @@ def load_progress(user_id: str) -> Dict[str, Any]:
             if "learned_at" in v:
                 p[k]["updated_at"] = v["learned_at"]
 
-    if "__settings__" not in p or not isinstance(p["__settings__"], dict):
-        p["__settings__"] = _default_settings()
-    else:
-        defaults = _default_settings()
-        p["__settings__"].setdefault("all", defaults["all"])
-        p["__settings__"].setdefault("groups", defaults["groups"])
-        p["__settings__"]["all"].setdefault("show_group_label", False)
-        p["__settings__"]["all"].setdefault("show_subgroup_label", False)
-        p["__settings__"]["all"].setdefault("all_mode", "flat")
-        p["__settings__"]["all"].setdefault("breakdown_ai_provider", "openai")
+    if "__settings__" not in p or not isinstance(p["__settings__"], dict):
+        p["__settings__"] = _default_settings()
+    else:
+        defaults = _default_settings()
+        p["__settings__"].setdefault("all", defaults["all"])
+        p["__settings__"].setdefault("groups", defaults["groups"])
+        p["__settings__"]["all"].setdefault("show_group_label", False)
+        p["__settings__"]["all"].setdefault("show_subgroup_label", False)
+        p["__settings__"]["all"].setdefault("all_mode", "flat")
+        p["__settings__"]["all"].setdefault("breakdown_ai_provider", "openai")
+
+    return p
+
+
+def save_progress(user_id: str, p: Dict[str, Any]) -> None:
+    if _replica_write_blocked(_progress_path(user_id)):
+        return  # the replica's feed publishes the primary's copy once it arrives
+    _save_json_file(_progress_path(user_id), p)
+    _stats_note_progress(user_id, p)
+    _feed_progress_saved(user_id, p)
+
+
+def card_status(progress: Dict[str, Any], card_id: str) -> str:
+    entry = progress.get(card_id)
+    if isinstance(entry, dict):
+        s = entry.get("status")
+        if s in ("active", "unsure", "learned", "deleted"):
+            return s
+    return "active"
+
+
+def set_card_status(progress: Dict[str, Any], card_id: str, status: str) -> None:
+    progress.setdefault(card_id, {})
+    progress[card_id]["status"] = status
+    progress[card_id]["updated_at"] = _now()
+
+
+# ============ CHANGE FEED (SSE) ============
+# GET /api/sync/events (Bearer token) and /api/web/sync/events (session) stream
+# a user's status, custom-set and breakdown changes as Server-Sent Events, so
+# clients do not have to poll pull/counts. save_progress() and
+# _save_breakdowns() publish to an in-process bus by diffing against an
+# in-memory snapshot. Snapshots exist only for users with an open stream, and
+# are kept FEED_RETAIN_SECONDS after the last stream closes so that a reconnect
+# with Last-Event-ID replays what it missed from the backlog ring. When that is
+# not possible the stream sends `resync` and the client pulls once. On a sync
+# replica, files copied from the primary are published the same way.
+# Each open stream holds a server thread. Streams are capped at
+# KENPO_FEED_MAX_STREAMS (0 turns the feed off), and waitress gets that many
+# threads on top of KENPO_THREADS, so open streams never take the threads that
+# requests need. Streams are closed after KENPO_FEED_MAX_SECONDS; EventSource
+# reconnects by itself. The bus is in-process: a stream only sees writes made
+# by the process serving it, so run the feed on a single server process (or
+# route every write for a user to it). The web UI subscribes only when the
+# user turns on "live updates". A dropped client is
+# only noticed when a keepalive write fails, so a user's oldest stream is
+# closed once they open more than FEED_STREAMS_PER_USER.
+FEED_BACKLOG = max(16, _safe_int(os.environ.get("KENPO_FEED_BACKLOG"), 2048))
+FEED_MAX_STREAMS = max(0, _safe_int(os.environ.get("KENPO_FEED_MAX_STREAMS"), 8))  # extra server threads; 0 = feed off
+FEED_MAX_SECONDS = max(30, _safe_int(os.environ.get("KENPO_FEED_MAX_SECONDS"), 900))
+FEED_KEEPALIVE_SECONDS = max(5, _safe_int(os.environ.get("KENPO_FEED_KEEPALIVE_SECONDS"), 15))
+FEED_STREAMS_PER_USER = 4
+FEED_QUEUE_SIZE = 256
+FEED_RETAIN_SECONDS = 300
+FEED_RETRY_MS = 3000
+_FEED_EPOCH = uuid.uuid4().hex[:8]  # ids are "<epoch>-<seq>"; an id from another process forces a resync
+
+_feed_lock = threading.Lock()
+_feed_seq = 0
+_feed_backlog: "deque[Tuple[int, Optional[str], str, Dict[str, Any]]]" = deque(maxlen=FEED_BACKLOG)
+_feed_users: Dict[str, Dict[str, Any]] = {}  # uid -> {"snap", "since", "subs" (oldest first), "idle_since"}
+_feed_breakdowns: Optional[Dict[str, str]] = None  # card id -> digest; built on the first subscribe
+_feed_counts = {"streams": 0, "published": 0, "replayed": 0, "resyncs": 0, "overflows": 0, "rejected": 0}
+
+
+def _feed_snapshot(p: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(card statuses, custom set) of a progress dict - the parts the feed reports on."""
+    statuses: Dict[str, Any] = {}
+    for k, v in p.items():
+        if k.startswith("__"):
+            continue
+        if isinstance(v, dict):
+            statuses[k] = (v.get("status"), v.get("updated_at"))
+        elif isinstance(v, str):
+            statuses[k] = (v, None)
+    settings = p.get("__settings__") if isinstance(p.get("__settings__"), dict) else {}
+    custom = {"customSet": list(p.get("__custom_set__") or []),
+              "custom_set": list(settings.get("custom_set") or []),
+              "custom_set_status": dict(settings.get("custom_set_status") or {})}
+    return statuses, custom
+
+
+def _feed_breakdown_digests(data: Dict[str, Any]) -> Dict[str, str]:
+    return {str(k): hashlib.sha1(json.dumps(v, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+            for k, v in data.items()}
+
+
+def _feed_origin() -> Optional[str]:
+    """X-Kenpo-Client of the writing request, so a client can skip its own echoes."""
+    if not has_request_context():
+        return None
+    return (request.headers.get("X-Kenpo-Client") or "")[:64] or None
+
+
+def _feed_resync_locked() -> Tuple[int, str, Dict[str, Any]]:
+    _feed_counts["resyncs"] += 1
+    return _feed_seq, "resync", {}
+
+
+def _feed_publish_locked(uid: Optional[str], event: str, data: Dict[str, Any]) -> None:
+    """Add an event to the backlog and every matching stream; uid None goes to all users."""
+    global _feed_seq
+    _feed_seq += 1
+    _feed_backlog.append((_feed_seq, uid, event, data))
+    _feed_counts["published"] += 1
+    for u, st in _feed_users.items():
+        if uid is not None and u != uid:
+            continue
+        for sub in st["subs"]:
+            try:
+                sub.put_nowait((_feed_seq, event, data))
+            except queue.Full:
+                # Slow reader: replace its queue with one resync rather than grow without bound
+                with sub.mutex:
+                    sub.queue.clear()
+                sub.put_nowait(_feed_resync_locked())
+                _feed_counts["overflows"] += 1
+
+
+def _feed_progress_saved(uid: str, p: Dict[str, Any]) -> None:
+    """Publish uid's status/custom-set changes since the previous save. No-op without a stream."""
+    with _feed_lock:
+        if uid not in _feed_users:
+            return
+    statuses, custom = _feed_snapshot(p)
+    with _feed_lock:
+        st = _feed_users.get(uid)
+        if st is None:
+            return
+        old_statuses, old_custom = st["snap"]
+        st["snap"] = (statuses, custom)
+        changes: Dict[str, Any] = {cid: {"status": s, "updated_at": t}
+                                   for cid, (s, t) in statuses.items() if old_statuses.get(cid) != (s, t)}
+        for cid in old_statuses.keys() - statuses.keys():
+            changes[cid] = None
+        origin = _feed_origin()
+        if changes:
+            _feed_publish_locked(uid, "progress", {"changes": changes, "origin": origin})
+        if custom != old_custom:
+            _feed_publish_locked(uid, "customset", dict(custom, origin=origin))
+
+
+def _feed_breakdowns_saved(data: Dict[str, Any]) -> None:
+    """Publish changed/deleted breakdowns to every stream. No-op until someone subscribes."""
+    global _feed_breakdowns
+    if _feed_breakdowns is None:
+        return
+    digests = _feed_breakdown_digests(data)
+    with _feed_lock:
+        old = _feed_breakdowns or {}
+        _feed_breakdowns = digests
+        ids = [k for k, d in digests.items() if old.get(k) != d]
+        deleted = [k for k in old if k not in digests]
+        if ids or deleted:
+            _feed_publish_locked(None, "breakdowns", {"ids": ids, "deleted": deleted,
+                                                      "breakdowns": {k: data.get(k) for k in ids},
+                                                      "origin": _feed_origin()})
+
+
+def _feed_replica_changed(paths: List[str]) -> None:
+    """Replica listener: publish progress/breakdown files copied from the primary."""
+    for rel in paths:
+        parts = rel.replace("\\", "/").split("/")
+        if parts == ["breakdowns.json"]:
+            _feed_breakdowns_saved(_load_breakdowns())
+        elif len(parts) == 3 and parts[0] == "users" and parts[2] == "progress.json" and parts[1] in _feed_users:
+            _feed_progress_saved(parts[1], load_progress(parts[1]))
+
+
+_replica_listeners.append(_feed_replica_changed)
+
+
+def _feed_parse_id(value: str) -> Optional[int]:
+    epoch, _, seq = (value or "").partition("-")
+    if epoch != _FEED_EPOCH:
+        return None
+    try:
+        return int(seq)
+    except ValueError:
+        return None
+
+
+def _feed_replay_locked(uid: str, st: Dict[str, Any], last_id: str) -> List[Tuple[int, str, Dict[str, Any]]]:
+    """Events after last_id for uid, or a single resync when they are not all still known."""
+    seq = _feed_parse_id(last_id)
+    if seq is None or seq < st["since"] or seq > _feed_seq:
+        return [_feed_resync_locked()]
+    if _feed_backlog and seq < _feed_backlog[0][0] - 1:
+        return [_feed_resync_locked()]
+    events = [(n, ev, data) for n, u, ev, data in _feed_backlog if n > seq and u in (None, uid)]
+    _feed_counts["replayed"] += len(events)
+    return events
+
+
+def _feed_add_sub_locked(st: Dict[str, Any], sub: "queue.Queue", keep: int = FEED_STREAMS_PER_USER) -> None:
+    """Add sub to a user's streams, first closing the oldest so at most keep remain open."""
+    while st["subs"] and len(st["subs"]) >= keep:
+        oldest = next(iter(st["subs"]))
+        del st["subs"][oldest]
+        with oldest.mutex:
+            oldest.queue.clear()
+        oldest.put_nowait(None)  # tells that stream's generator to finish
+    st["subs"][sub] = None
+    st["idle_since"] = None
+
+
+def _feed_subscribe(uid: str, last_id: str, replace: bool = False) -> Tuple["queue.Queue", List[Tuple[int, str, Dict[str, Any]]]]:
+    """Register a stream for uid. Returns its queue and the events to send before live ones.
+    replace: close one of the user's existing streams to make room (server at its stream limit)."""
+    global _feed_breakdowns
+    sub: "queue.Queue" = queue.Queue(maxsize=FEED_QUEUE_SIZE)
+    now = time.time()
+    with _feed_lock:
+        for u in [u for u, st in _feed_users.items()
+                  if not st["subs"] and st["idle_since"] and now - st["idle_since"] > FEED_RETAIN_SECONDS]:
+            del _feed_users[u]
+        st = _feed_users.get(uid)
+        if st is not None:
+            first = _feed_replay_locked(uid, st, last_id) if last_id else [(_feed_seq, "hello", {})]
+            _feed_add_sub_locked(st, sub, min(FEED_STREAMS_PER_USER, len(st["subs"])) if replace else FEED_STREAMS_PER_USER)
+            _feed_counts["streams"] += 1
+            return sub, first
+    snap = _feed_snapshot(load_progress(uid))
+    digests = _feed_breakdown_digests(_load_breakdowns()) if _feed_breakdowns is None else None
+    with _feed_lock:
+        if _feed_breakdowns is None:
+            _feed_breakdowns = digests
+        st = _feed_users.setdefault(uid, {"snap": snap, "since": _feed_seq, "subs": {}, "idle_since": None})
+        _feed_add_sub_locked(st, sub)
+        _feed_counts["streams"] += 1
+        # Nothing was tracked for this user before now, so a reconnect cannot be replayed
+        first = [_feed_resync_locked()] if last_id else [(_feed_seq, "hello", {})]
+    return sub, first
+
+
+def _feed_unsubscribe(uid: str, sub: "queue.Queue") -> None:
+    with _feed_lock:
+        _feed_counts["streams"] -= 1
+        st = _feed_users.get(uid)
+        if st is not None:
+            st["subs"].pop(sub, None)
+            if not st["subs"]:
+                st["idle_since"] = time.time()
+
+
+def _feed_event_text(seq: int, event: str, data: Dict[str, Any]) -> str:
+    body = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {_FEED_EPOCH}-{seq}\nevent: {event}\ndata: {body}\n\n"
+
+
+def _feed_response(uid: str):
+    if FEED_MAX_STREAMS <= 0:
+        return jsonify({"error": "feed_disabled"}), 404
+    with _feed_lock:
+        st = _feed_users.get(uid)
+        # At the limit, a user who already has a stream (usually a dropped connection
+        # not yet noticed) may swap it for this one; anyone else waits.
+        full = _feed_counts["streams"] >= FEED_MAX_STREAMS
+        replace = full and bool(st and st["subs"])
+        if full and not replace:
+            _feed_counts["rejected"] += 1
+            resp = jsonify({"error": "too_many_streams", "retry_after": 30})
+            resp.status_code = 503
+            resp.headers["Retry-After"] = "30"
+            return resp
+    last_id = (request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or "").strip()
+    sub, first = _feed_subscribe(uid, last_id, replace)
+
+    def generate():
+        try:
+            yield f"retry: {FEED_RETRY_MS}\n\n"
+            for ev in first:
+                yield _feed_event_text(*ev)
+            started = last_write = time.monotonic()
+            # Poll in short steps so shutdown drains and max-duration closes stay prompt
+            while not _server_draining.is_set() and time.monotonic() - started < FEED_MAX_SECONDS:
+                try:
+                    ev = sub.get(timeout=1.0)
+                except queue.Empty:
+                    if time.monotonic() - last_write >= FEED_KEEPALIVE_SECONDS:
+                        last_write = time.monotonic()
+                        yield ": ping\n\n"
+                    continue
+                if ev is None:
+                    break
+                last_write = time.monotonic()
+                yield _feed_event_text(*ev)
+        finally:
+            _feed_unsubscribe(uid, sub)
+
+    resp = Response(generate(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+def _feed_stats() -> Dict[str, Any]:
+    with _feed_lock:
+        out = dict(_feed_counts)
+        out.update({"users": sum(1 for st in _feed_users.values() if st["subs"]),
+                    "retained": len(_feed_users), "backlog": len(_feed_backlog), "last_id": _feed_seq})
+    return out
+
+
+# -------- Bulk user reads --------
+# Admin-wide scans (every user's progress.json) are I/O + json.load bound, so
+# read them on a small thread pool. Results stream back in completion order and
+# at most 2x workers reads are in flight, so memory stays bounded.
+BULK_READ_WORKERS = max(1, _safe_int(os.environ.get("KENPO_BULK_READ_WORKERS"), min(16, (os.cpu_count() or 2) * 2)))
+
+
+def _iter_user_files(user_ids: List[str], reader=None, max_workers: Optional[int] = None):
+    """Yield (user_id, data, error) for each user, reading concurrently.
+
+    reader defaults to load_progress; error is the exception (data None) if the
+    read failed. With max_workers == 1 the reads happen inline, in order.
+    """
+    reader = reader or load_progress
+    workers = max(1, max_workers or BULK_READ_WORKERS)
+    ids = list(user_ids)
+    if workers == 1 or len(ids) <= 1:
+        for user_id in ids:
+            try:
+                yield user_id, reader(user_id), None
+            except Exception as e:
+                yield user_id, None, e
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-read") as pool:
+        done_q: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        pending_ids = iter(ids)
+        in_flight = 0
+
+        def submit_next() -> int:
+            user_id = next(pending_ids, None)
+            if user_id is None:
+                return 0
+            pool.submit(reader, user_id).add_done_callback(lambda f, u=user_id: done_q.put((u, f)))
+            return 1
+
+        for _ in range(workers * 2):
+            in_flight += submit_next()
+        while in_flight:
+            user_id, fut = done_q.get()
+            in_flight -= 1
+            in_flight += submit_next()
+            try:
+                yield user_id, fut.result(), None
+            except Exception as e:
+                yield user_id, None, e
+
+
+# -------- Admin stats aggregator --------
+# /api/admin/stats used to re-read every user's progress.json on each refresh.
+# Instead each user has a small summary row tagged with the size/mtime of the
+# progress file it was built from. save_progress() updates rows as it writes.
+# At most every KENPO_STATS_SCAN_SECONDS (and whenever the user list changes)
+# a dashboard request stats the progress files and re-reads only those that no
+# longer match, which picks up writes from other server processes sharing the
+# data folder; other requests do no per-user work. The profiles/decks/breakdowns
+# part of the payload is cached under the size/mtime of the files it is built
+# from (so another process's writes count too) plus _stats_generation for this
+# process's writes; the per-user rollup is recomputed in memory only when a
+# row's counts actually change.
+STATS_SCAN_SECONDS = max(0, _safe_int(os.environ.get("KENPO_STATS_SCAN_SECONDS"), 30))
+_stats_lock = threading.Lock()
+_stats_rows: Dict[str, Dict[str, Any]] = {}  # user_id -> {"row", "sig", "tick"}
+_stats_generation = 0
+_stats_rows_generation = 0
+_stats_tick = 0  # write order of rows, so a slow refresh never replaces a newer row
+_stats_cache: Optional[Tuple[Any, Any, Dict[str, Any], Dict[str, Any], Dict[str, Any]]] = None  # (key, cards, base payload, users, deck names)
+_stats_rollup: Optional[Tuple[Any, int, Dict[str, Any]]] = None  # (base cache entry, rows generation, payload)
+_stats_scanned: Tuple[Any, float] = (None, 0.0)  # (base cache entry, monotonic time) of the last progress scan
+
+
+def _progress_summary(progress: Dict[str, Any]) -> Dict[str, Any]:
+    """Summary row for one user: status counts, active deck and last sync."""
+    learned = unsure = active = 0
+    for k, v in progress.items():
+        if k.startswith("__") or not isinstance(v, dict):
+            continue
+        s = v.get("status", "active")
+        if s == "learned":
+            learned += 1
+        elif s == "unsure":
+            unsure += 1
+        elif s == "active":
+            active += 1
+    return {
+        "learned": learned,
+        "unsure": unsure,
+        "active": active,
+        "active_deck_id": _get_active_deck_id(progress.get("__settings__", {}), "kenpo"),
+        "last_sync": progress.get("__last_sync__", 0),
+    }
+
+
+def _stats_invalidate() -> None:
+    """Mark the cached admin dashboard payload stale."""
+    global _stats_generation
+    with _stats_lock:
+        _stats_generation += 1
+
+
+def _file_sig(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _progress_file_sig(user_id: str) -> Optional[Tuple[int, int]]:
+    return _file_sig(os.path.join(USERS_DIR, user_id, "progress.json"))
+
+
+def _stats_base_key() -> Tuple[Any, ...]:
+    """Cache key of the non-progress dashboard payload: this process's write generation
+    plus the size/mtime of every file _build_admin_stats() reads."""
+    return (_stats_generation,) + tuple(_file_sig(p) for p in (
+        PROFILES_PATH, DECKS_PATH, DECK_CONFIG_PATH, DECK_ACCESS_PATH, BREAKDOWNS_PATH, API_KEYS_PATH))
+
+
+def _stats_put_row_locked(user_id: str, row: Optional[Dict[str, Any]], sig: Any, tick: Optional[int] = None) -> None:
+    """Store a summary row; tick is the write order it was read at (None = written just now)."""
+    global _stats_rows_generation, _stats_tick
+    old = _stats_rows.get(user_id)
+    if tick is None:
+        _stats_tick += 1
+        tick = _stats_tick
+    elif old is not None and old["tick"] > tick:
+        return  # save_progress() wrote a newer row while this one was being read
+    if row is None:
+        _stats_rows.pop(user_id, None)
+    else:
+        _stats_rows[user_id] = {"row": row, "sig": sig, "tick": tick}
+    if (old and old["row"]) != row:
+        _stats_rows_generation += 1
+
+
+def _stats_note_progress(user_id: str, progress: Dict[str, Any]) -> None:
+    try:
+        row = _progress_summary(progress)
+    except Exception:
+        row = None
+    sig = _progress_file_sig(user_id)
+    with _stats_lock:
+        _stats_put_row_locked(user_id, row, sig)
+
+
+def _stats_refresh(user_ids: List[str], force: bool = False) -> int:
+    """Re-read progress files whose size/mtime differ from their row (every file with
+    force, i.e. ?refresh=1). Returns the number of files read."""
+    with _stats_lock:
+        start = _stats_tick
+        known = {u: r["sig"] for u, r in _stats_rows.items()}
+    stale = {}
+    for user_id in user_ids:
+        sig = _progress_file_sig(user_id)
+        if force or user_id not in known or known[user_id] != sig:
+            stale[user_id] = sig
+    if not stale:
+        return 0
+    t0 = time.perf_counter()
+    read = 0
+    for user_id, progress, err in _iter_user_files(list(stale)):
+        if err is not None:
+            continue
+        try:
+            row = _progress_summary(progress)
+        except Exception:
+            continue
+        with _stats_lock:
+            _stats_put_row_locked(user_id, row, stale[user_id], start)
+        read += 1
+    if force or not known:
+        print(f"[STATS] read {read} user progress files in {(time.perf_counter() - t0) * 1000:.0f}ms")
+    return read
+
+
+# ============ LOGIN THROTTLING ============
+# A password check (werkzeug scrypt/PBKDF2) costs tens of ms of CPU. Failed logins
+# (and registrations) spend from token buckets per client IP and per username; a
+# login is refused only while a bucket is empty, so a classroom behind one school
+# NAT logging in together is never throttled by its own successes. Hashing
+# runs on a small dedicated pool that admits at most KENPO_HASH_MAX_PENDING
+# requests at a time (running + queued); a login past that bound waits up to
+# KENPO_HASH_WAIT_MS for a slot before getting 503 server_busy. A class signing
+# in together just queues for a second or two, while a sustained login storm or
+# credential stuffing gets 429/503 answers instead of tying up every server
+# thread that study traffic needs. The IP is the socket peer (request.remote_addr), not
+# X-Forwarded-For, so it cannot be spoofed to dodge the limit.
+LOGIN_IP_BURST = max(1, _safe_int(os.environ.get("KENPO_LOGIN_IP_BURST"), 100))
+LOGIN_IP_PER_MIN = max(1, _safe_int(os.environ.get("KENPO_LOGIN_IP_PER_MIN"), 100))
+LOGIN_USER_BURST = max(1, _safe_int(os.environ.get("KENPO_LOGIN_USER_BURST"), 5))
+LOGIN_USER_PER_MIN = max(1, _safe_int(os.environ.get("KENPO_LOGIN_USER_PER_MIN"), 6))
+HASH_WORKERS = max(1, _safe_int(os.environ.get("KENPO_HASH_WORKERS"), 2))
+HASH_MAX_PENDING = max(HASH_WORKERS, _safe_int(os.environ.get("KENPO_HASH_MAX_PENDING"), 32))
+HASH_WAIT_SECONDS = max(0, _safe_int(os.environ.get("KENPO_HASH_WAIT_MS"), 2000)) / 1000.0
+
+
+class _TokenBuckets:
+    """Token buckets keyed by string. The least recently used keys are dropped past max_keys."""
+
+    def __init__(self, burst: int, per_min: int, max_keys: int = 10000):
+        self.burst = float(burst)
+        self.rate = per_min / 60.0
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        """Spend one token. Returns 0 when allowed, else seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1.0:
+                self._buckets[key] = (tokens, now)
+                self._buckets.move_to_end(key)
+                return (1.0 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1.0, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0.0
+
+    def wait(self, key: str, now: Optional[float] = None) -> float:
+        """Seconds until key has a token to spend (0 when it has one now). Spends nothing."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is None:
+                return 0.0
+            tokens = min(self.burst, entry[0] + (now - entry[1]) * self.rate)
+            return 0.0 if tokens >= 1.0 else (1.0 - tokens) / self.rate
+
+
+class _HashBusy(Exception):
+    """Raised when no hash-pool slot frees up within HASH_WAIT_SECONDS."""
+
+
+_login_ip_buckets = _TokenBuckets(LOGIN_IP_BURST, LOGIN_IP_PER_MIN)
+_login_user_buckets = _TokenBuckets(LOGIN_USER_BURST, LOGIN_USER_PER_MIN)
+_hash_pool: Optional[ThreadPoolExecutor] = None
+_hash_slots = threading.BoundedSemaphore(HASH_MAX_PENDING)
+_login_counts = {"throttled_ip": 0, "throttled_user": 0, "hash_busy": 0, "hashes": 0}
+_login_lock = threading.Lock()
+
+
+def _login_count(key: str) -> None:
+    with _login_lock:
+        _login_counts[key] += 1
+
+
+def _login_throttle(username: str):
+    """Check this client IP's and username's buckets without spending from them.
+    Returns a 429 response when either bucket is empty, else None."""
+    wait = _login_ip_buckets.wait(request.remote_addr or "")
+    if wait:
+        _login_count("throttled_ip")
+    else:
+        wait = _login_user_buckets.wait(username.strip().lower())
+        if wait:
+            _login_count("throttled_user")
+    if not wait:
+        return None
+    retry = max(1, int(math.ceil(wait)))
+    return jsonify({"error": "too_many_attempts", "retry_after": retry}), 429, {"Retry-After": str(retry)}
+
+
+def _login_spend(username: str = "") -> None:
+    """Spend one attempt for this client IP (and username, when given): call on a failed login."""
+    _login_ip_buckets.take(request.remote_addr or "")
+    if username:
+        _login_user_buckets.take(username.strip().lower())
+
+
+def _hash_busy_response():
+    _login_count("hash_busy")
+    return jsonify({"error": "server_busy", "retry_after": 1}), 503, {"Retry-After": "1"}
+
 
-    return p
+def _run_hash(fn, *args):
+    """Run a password-hash function on the hash pool; raises _HashBusy when it stays full."""
+    global _hash_pool
+    if not _hash_slots.acquire(timeout=HASH_WAIT_SECONDS):
+        raise _HashBusy()
+    try:
+        if _hash_pool is None:
+            with _login_lock:
+                if _hash_pool is None:
+                    _hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwhash")
+        _login_count("hashes")
+        return _hash_pool.submit(fn, *args).result()
+    finally:
+        _hash_slots.release()
 
 
-def save_progress(user_id: str, p: Dict[str, Any]) -> None:
-    with open(_progress_path(user_id), "w", encoding="utf-8") as f:
-        json.dump(p, f, ensure_ascii=False, indent=2)
+def _verify_password(stored_hash: str, password: str) -> bool:
+    return bool(_run_hash(check_password_hash, stored_hash, password))
 
 
-def card_status(progress: Dict[str, Any], card_id: str) -> str:
-    entry = progress.get(card_id)
-    if isinstance(entry, dict):
-        s = entry.get("status")
-        if s in ("active", "unsure", "learned", "deleted"):
-            return s
-    return "active"
+def _hash_password(password: str) -> str:
+    return _run_hash(generate_password_hash, password)
 
 
-def set_card_status(progress: Dict[str, Any], card_id: str, status: str) -> None:
-    progress.setdefault(card_id, {})
-    progress[card_id]["status"] = status
-    progress[card_id]["updated_at"] = _now()
+def _login_stats() -> Dict[str, Any]:
+    with _login_lock:
+        out: Dict[str, Any] = dict(_login_counts)
+    out["hash_workers"] = HASH_WORKERS
+    out["hash_max_pending"] = HASH_MAX_PENDING
+    out["hash_wait_ms"] = int(HASH_WAIT_SECONDS * 1000)
+    return out
 
 
 # -------- Routes --------
-@app.get("/")
+@core_bp.get("/")
 def index():
-    return send_from_directory("static", "index.html")
+    return _send_static("index.html")
 
 
-@app.get("/api/me")
+@core_bp.get("/api/me")
 def api_me():
     uid = current_user_id()
     if uid:
@@ -1152,7 +3256,7 @@ def api_me():
     return jsonify({"logged_in": False, "user": None})
 
 
-@app.post("/api/register")
+@core_bp.post("/api/register")
 def api_register():
     data = request.get_json(force=True) or {}
     username = (data.get("username") or "").strip()
@@ -1168,27 +3272,41 @@ def api_register():
     if len(password) < 4:
         return jsonify({"error": "password_too_short"}), 400
 
+    throttled = _login_throttle(username)
+    if throttled:
+        return throttled
+    _login_spend()  # every registration costs a hash; limit account creation per IP
+
     # Check if username already exists
     if _get_user_by_username(username):
         return jsonify({"error": "username_taken"}), 400
 
-    profiles = _load_profiles()
-    user_id = uuid.uuid4().hex[:12]
-    
-    profiles["users"][user_id] = {
-        "username": username,
-        "password_hash": generate_password_hash(password),
-        "display_name": display_name or username,
-        "created_at": _now()
-    }
+    # Hash outside the profiles lock; re-check the name once it is held
+    try:
+        password_hash = _hash_password(password)
+    except _HashBusy:
+        return _hash_busy_response()
+    with _json_txn(PROFILES_PATH):
+        if _get_user_by_username(username):
+            return jsonify({"error": "username_taken"}), 400
+
+        profiles = _load_profiles()
+        user_id = uuid.uuid4().hex[:12]
+
+        profiles["users"][user_id] = {
+            "username": username,
+            "password_hash": password_hash,
+            "display_name": display_name or username,
+            "created_at": _now()
+        }
 
-    _save_profiles(profiles)
+        _save_profiles(profiles)
     _ensure_user_progress(user_id)
     session["user_id"] = user_id
     return jsonify({"ok": True, "user": _get_user(user_id)})
 
 
-@app.post("/api/login")
+@core_bp.post("/api/login")
 def api_login():
     data = request.get_json(force=True) or {}
     username = (data.get("username") or "").strip()
@@ -1197,6 +3315,10 @@ def api_login():
     if not username:
         return jsonify({"error": "username_required"}), 400
 
+    throttled = _login_throttle(username)
+    if throttled:
+        return throttled
+
     # Allow admin LAN/localhost login even with blank password (personal deployment convenience).
     # If you prefer strict security, set a password for the admin user in profiles.json.
     is_admin = _is_admin_user(username)
@@ -1208,19 +3330,25 @@ def api_login():
     if not result:
         # If admin exists in admin_users.json but profile missing, bootstrap a profile on private networks.
         if is_admin and from_private_net:
-            profiles = _load_profiles()
-            user_id = uuid.uuid4().hex[:12]
-            profiles.setdefault("users", {})[user_id] = {
-                "user_id": user_id,
-                "username": username,
-                "password_hash": generate_password_hash(password) if password else "",
-                "display_name": username,
-                "created_at": _now(),
-            }
-            _save_profiles(profiles)
+            try:
+                password_hash = _hash_password(password) if password else ""
+            except _HashBusy:
+                return _hash_busy_response()
+            with _json_txn(PROFILES_PATH):
+                profiles = _load_profiles()
+                user_id = uuid.uuid4().hex[:12]
+                profiles.setdefault("users", {})[user_id] = {
+                    "user_id": user_id,
+                    "username": username,
+                    "password_hash": password_hash,
+                    "display_name": username,
+                    "created_at": _now(),
+                }
+                _save_profiles(profiles)
             _ensure_user_progress(user_id)
             session["user_id"] = user_id
             return jsonify({"ok": True, "user": _get_user(user_id), "bootstrap_admin": True})
+        _login_spend(username)
         return jsonify({"error": "invalid_credentials"}), 401
 
     user_id, user_data = result
@@ -1234,9 +3362,15 @@ def api_login():
 
     # Normal password verification
     if not stored_hash:
+        _login_spend(username)
         return jsonify({"error": "password_required"}), 401
 
-    if not check_password_hash(stored_hash, password):
+    try:
+        password_ok = _verify_password(stored_hash, password)
+    except _HashBusy:
+        return _hash_busy_response()
+    if not password_ok:
+        _login_spend(username)
         log_activity("warn", f"Failed login attempt for user: {username}", "")
         return jsonify({"error": "invalid_credentials"}), 401
 
@@ -1246,7 +3380,7 @@ def api_login():
     return jsonify({"ok": True, "user": _get_user(user_id)})
 
 
-@app.post("/api/logout")
+@core_bp.post("/api/logout")
 def api_logout():
     uid = current_user_id()
     user = _get_user(uid) if uid else None
@@ -1257,11 +3391,17 @@ def api_logout():
     return jsonify({"ok": True})
 
 
-@app.get("/api/health")
+@core_bp.get("/api/health")
 def health():
     cards, status = load_cards_cached()
     v = get_version()
     kenpo_exists = os.path.exists(KENPO_JSON_PATH)
+    if _server_draining.is_set():
+        # Lets a load balancer / the tray stop routing here while requests drain
+        return jsonify({"status": "draining", "server": _server_status()}), 503
+    if REPLICA_SOURCE and _replica_lag() > REPLICA_MAX_LAG_SECONDS:
+        # Snapshot stopped refreshing; fail the check so the proxy falls back to the primary
+        return jsonify({"status": "replica_stale", "replica": _replica_status()}), 503
     return jsonify({
         "status": status, 
         "cards_loaded": len(cards), 
@@ -1273,10 +3413,10 @@ def health():
     })
 
 
-@app.get("/api/version")
+@core_bp.get("/api/version")
 def api_version():
     return jsonify(get_version())
-@app.get("/api/groups")
+@study_bp.get("/api/groups")
 def api_groups():
     uid, _ = require_user()
     deck_id = request.args.get("deck_id", "")
@@ -1311,26 +3451,166 @@ def api_groups():
 
 import datetime
 
-@app.get("/about")
+@core_bp.get("/about")
 def about_page():
-    return send_from_directory("static", "about.html")
+    return _send_static("about.html")
 
-@app.get("/admin")
+@core_bp.get("/admin")
 def admin_page():
-    return send_from_directory("static", "admin.html")
+    return _send_static("admin.html")
 
-@app.get("/user-guide")
+@core_bp.get("/user-guide")
 def user_guide_page():
-    return send_from_directory("static", "user-guide.html")
-
-@app.get("/user-guide.pdf")
+    return _send_static("user-guide.html")
+
+# User guide PDF: rendered with reportlab once per version/build (get_version())
+# and kept in memory plus data/cache/user_guide_<version>_<build>.pdf, so
+# repeat downloads are a plain conditional file send (ETag/Last-Modified).
+# When version.json changes, the previous PDF keeps being served while the
+# new one renders in the background.
+GUIDE_PDF_DIR = os.path.join(DATA_DIR, "cache")
+_guide_pdf: Dict[str, Any] = {}
+_guide_pdf_lock = threading.Lock()
+_guide_pdf_building = False
+
+
+def _guide_pdf_key(v: Dict[str, Any]) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", f"{v.get('version', '')}_{v.get('build', '')}") or "unknown"
+
+
+def _render_user_guide_pdf(v: Dict[str, Any]) -> bytes:
+    """Render the guide with reportlab (ImportError when it is not installed)."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import inch
+    from io import BytesIO
+
+    title = f"Advanced Flashcards WebApp — User Guide  (v{v.get('version','')}, build {v.get('build','')})"
+    lines = [
+        "Created by Sidney Shelton (Sidscri@yahoo.com)",
+        "",
+        "Overview:",
+        "• Study Kenpo vocabulary and track progress across devices.",
+        "• Tabs: Unlearned / Unsure / Learned / All / Custom Set.",
+        "• Group filtering and All Cards mode.",
+        "• Sync: progress + breakdowns between Android and Web.",
+        "• AI Breakdowns (optional): OpenAI/Gemini configured server-side.",
+        "",
+        "How to use:",
+        "1) Choose a tab (Unlearned/Unsure/Learned/All).",
+        "2) Use Group dropdown or All Cards button to set your filter.",
+        "3) Use status buttons to move a card between states.",
+        "4) Use Search to jump to a term quickly.",
+        "5) Use Breakdown tools to view or generate a breakdown.",
+        "6) Use Sync to push/pull progress and pull breakdowns on other devices.",
+        "",
+        "Keyboard Shortcuts:",
+        "• Space/Enter: Flip card",
+        "• Arrow keys: Navigate cards",
+        "• 1/2/3: Mark as Didn't Get It / Unsure / Got It",
+        "",
+        "Troubleshooting:",
+        "• If sync seems stuck: logout/login and pull again.",
+        "• Ensure server is running and reachable from your device.",
+        "• Visit /admin for diagnostics.",
+    ]
+
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=letter, invariant=1)
+    width, height = letter
+
+    x = 0.8 * inch
+    y = height - 1.0 * inch
+    c.setTitle("Advanced Flashcards WebApp User Guide")
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(x, y, title)
+    y -= 0.4 * inch
+
+    c.setFont("Helvetica", 11)
+    for ln in lines:
+        if y < 0.8 * inch:
+            c.showPage()
+            y = height - 1.0 * inch
+            c.setFont("Helvetica", 11)
+        c.drawString(x, y, ln)
+        y -= 0.22 * inch
+
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _guide_pdf_entry(key: str, data: bytes, mtime: float) -> Dict[str, Any]:
+    return {"key": key, "data": data, "mtime": mtime,
+            "etag": f"guide-{key}-{hashlib.sha256(data).hexdigest()[:12]}"}
+
+
+def _build_user_guide_pdf(v: Dict[str, Any]) -> Dict[str, Any]:
+    """Render the PDF for v, store it on disk (dropping older versions) and in memory."""
+    global _guide_pdf, _guide_pdf_building
+    key = _guide_pdf_key(v)
+    try:
+        t0 = time.perf_counter()
+        data = _render_user_guide_pdf(v)
+        path = os.path.join(GUIDE_PDF_DIR, f"user_guide_{key}.pdf")
+        try:
+            os.makedirs(GUIDE_PDF_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            _replace_file(tmp, path)
+            for name in os.listdir(GUIDE_PDF_DIR):
+                if name.startswith("user_guide_") and name.endswith(".pdf") and name != os.path.basename(path):
+                    os.remove(os.path.join(GUIDE_PDF_DIR, name))
+        except OSError as e:
+            print(f"[GUIDE] Could not write PDF cache: {e}")
+        entry = _guide_pdf_entry(key, data, time.time())
+        with _guide_pdf_lock:
+            _guide_pdf = entry
+        print(f"[GUIDE] Rendered user guide PDF {key} ({len(data) // 1024} KB) in {(time.perf_counter() - t0) * 1000:.0f}ms")
+        return entry
+    finally:
+        with _guide_pdf_lock:
+            _guide_pdf_building = False
+
+
+def _user_guide_pdf_cached() -> Dict[str, Any]:
+    """Current guide PDF entry. Renders synchronously only when nothing is cached yet;
+    after a version change the old PDF is returned while a thread renders the new one."""
+    global _guide_pdf, _guide_pdf_building
+    v = get_version()
+    key = _guide_pdf_key(v)
+    with _guide_pdf_lock:
+        entry = _guide_pdf
+    if entry.get("key") == key:
+        return entry
+    path = os.path.join(GUIDE_PDF_DIR, f"user_guide_{key}.pdf")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            entry = _guide_pdf_entry(key, f.read(), os.path.getmtime(path))
+        with _guide_pdf_lock:
+            _guide_pdf = entry
+        return entry
+    with _guide_pdf_lock:
+        stale = _guide_pdf
+        start = stale and not _guide_pdf_building
+        if start:
+            _guide_pdf_building = True
+    if stale:
+        if start:
+            threading.Thread(target=_build_user_guide_pdf, args=(v,), name="guide-pdf", daemon=True).start()
+        return stale
+    with _guide_pdf_lock:
+        _guide_pdf_building = True
+    return _build_user_guide_pdf(v)
+
+
+@core_bp.get("/user-guide.pdf")
 def user_guide_pdf():
-    """Serve a printable User Guide PDF (generated on demand)."""
+    """Serve a printable User Guide PDF (rendered once per version, then cached)."""
+    from io import BytesIO
     try:
-        from reportlab.lib.pagesizes import letter
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import inch
-        from io import BytesIO
+        entry = _user_guide_pdf_cached()
     except ImportError as e:
         # Return a helpful HTML page instead of a blank error
         return f"""
@@ -1342,64 +3622,6 @@ def user_guide_pdf():
         <p><a href="/" style="color: #5ca5ff;">← Back to App</a></p>
         </body></html>
         """, 500
-
-    try:
-        v = get_version()
-        title = f"Advanced Flashcards WebApp — User Guide  (v{v.get('version','')}, build {v.get('build','')})"
-        lines = [
-            "Created by Sidney Shelton (Sidscri@yahoo.com)",
-            "",
-            "Overview:",
-            "• Study Kenpo vocabulary and track progress across devices.",
-            "• Tabs: Unlearned / Unsure / Learned / All / Custom Set.",
-            "• Group filtering and All Cards mode.",
-            "• Sync: progress + breakdowns between Android and Web.",
-            "• AI Breakdowns (optional): OpenAI/Gemini configured server-side.",
-            "",
-            "How to use:",
-            "1) Choose a tab (Unlearned/Unsure/Learned/All).",
-            "2) Use Group dropdown or All Cards button to set your filter.",
-            "3) Use status buttons to move a card between states.",
-            "4) Use Search to jump to a term quickly.",
-            "5) Use Breakdown tools to view or generate a breakdown.",
-            "6) Use Sync to push/pull progress and pull breakdowns on other devices.",
-            "",
-            "Keyboard Shortcuts:",
-            "• Space/Enter: Flip card",
-            "• Arrow keys: Navigate cards",
-            "• 1/2/3: Mark as Didn't Get It / Unsure / Got It",
-            "",
-            "Troubleshooting:",
-            "• If sync seems stuck: logout/login and pull again.",
-            "• Ensure server is running and reachable from your device.",
-            "• Visit /admin for diagnostics.",
-        ]
-
-        buf = BytesIO()
-        c = canvas.Canvas(buf, pagesize=letter)
-        width, height = letter
-
-        x = 0.8 * inch
-        y = height - 1.0 * inch
-        c.setTitle("Advanced Flashcards WebApp User Guide")
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(x, y, title)
-        y -= 0.4 * inch
-
-        c.setFont("Helvetica", 11)
-        for ln in lines:
-            if y < 0.8 * inch:
-                c.showPage()
-                y = height - 1.0 * inch
-                c.setFont("Helvetica", 11)
-            c.drawString(x, y, ln)
-            y -= 0.22 * inch
-
-        c.showPage()
-        c.save()
-        buf.seek(0)
-
-        return send_file(buf, mimetype="application/pdf", as_attachment=True, download_name="KenpoFlashcards_User_Guide.pdf")
     except Exception as e:
         return f"""
         <html><body style="font-family: sans-serif; padding: 40px; background: #1a1f2e; color: #fff;">
@@ -1410,7 +3632,11 @@ def user_guide_pdf():
         </body></html>
         """, 500
 
-@app.get("/api/whoami")
+    return send_file(BytesIO(entry["data"]), mimetype="application/pdf", as_attachment=True,
+                     download_name="KenpoFlashcards_User_Guide.pdf", etag=entry["etag"],
+                     last_modified=entry["mtime"], max_age=0, conditional=True)
+
+@core_bp.get("/api/whoami")
 def whoami():
     ip = (request.headers.get("X-Forwarded-For") or request.remote_addr or "").split(",")[0].strip()
     return jsonify({
@@ -1447,7 +3673,8 @@ def _set_active_deck_id(settings_obj: Dict[str, Any], deck_id: str) -> Dict[str,
     settings_obj.pop("activeDeckId", None)
     return settings_obj
 
-@app.get("/api/settings")
+@study_bp.get("/api/settings")
+@_json_locked("progress")
 def api_settings_get():
     uid, _ = require_user()
     if not uid:
@@ -1487,7 +3714,8 @@ def api_settings_get():
     return jsonify({"scope": scope, "settings": settings["groups"].get(scope) or {}})
 
 
-@app.post("/api/settings")
+@study_bp.post("/api/settings")
+@_json_locked("progress")
 def api_settings_set():
     uid, _ = require_user()
     if not uid:
@@ -1512,7 +3740,8 @@ def api_settings_set():
     return jsonify({"ok": True})
 
 
-@app.post("/api/settings_reset")
+@study_bp.post("/api/settings_reset")
+@_json_locked("progress")
 def api_settings_reset():
     uid, _ = require_user()
     if not uid:
@@ -1538,7 +3767,7 @@ def api_settings_reset():
     return jsonify({"ok": True})
 
 
-@app.get("/api/counts")
+@study_bp.get("/api/counts")
 def api_counts():
     uid, _ = require_user()
     if not uid:
@@ -1592,7 +3821,7 @@ def api_counts():
 
 # ============ CUSTOM SET API ============
 
-@app.get("/api/custom_set")
+@study_bp.get("/api/custom_set")
 def api_custom_set_get():
     """Get custom set cards with their status."""
     uid, _ = require_user()
@@ -1631,7 +3860,8 @@ def api_custom_set_get():
     })
 
 
-@app.post("/api/custom_set/add")
+@study_bp.post("/api/custom_set/add")
+@_json_locked("progress")
 def api_custom_set_add():
     """Add a card to custom set."""
     uid, _ = require_user()
@@ -1654,7 +3884,8 @@ def api_custom_set_add():
     return jsonify({"ok": True, "in_custom_set": True})
 
 
-@app.post("/api/custom_set/remove")
+@study_bp.post("/api/custom_set/remove")
+@_json_locked("progress")
 def api_custom_set_remove():
     """Remove a card from custom set."""
     uid, _ = require_user()
@@ -1679,7 +3910,8 @@ def api_custom_set_remove():
     return jsonify({"ok": True, "in_custom_set": False})
 
 
-@app.post("/api/custom_set/toggle")
+@study_bp.post("/api/custom_set/toggle")
+@_json_locked("progress")
 def api_custom_set_toggle():
     """Toggle a card in/out of custom set."""
     uid, _ = require_user()
@@ -1708,7 +3940,8 @@ def api_custom_set_toggle():
     return jsonify({"ok": True, "in_custom_set": in_set})
 
 
-@app.post("/api/custom_set/set_status")
+@study_bp.post("/api/custom_set/set_status")
+@_json_locked("progress")
 def api_custom_set_set_status():
     """Set custom set internal status for a card."""
     uid, _ = require_user()
@@ -1737,7 +3970,8 @@ def api_custom_set_set_status():
     return jsonify({"ok": True})
 
 
-@app.post("/api/custom_set/clear")
+@study_bp.post("/api/custom_set/clear")
+@_json_locked("progress")
 def api_custom_set_clear():
     """Clear entire custom set."""
     uid, _ = require_user()
@@ -1755,124 +3989,85 @@ def api_custom_set_clear():
 
 # ============ ADMIN STATS API ============
 
-@app.get("/api/admin/stats")
-def api_admin_stats():
-    """Get comprehensive admin statistics for dashboard."""
-    uid = current_user_id()
-    if not uid:
-        return jsonify({"error": "login_required"}), 401
-    
-    user = _get_user(uid)
-    username = user.get("username", "") if user else ""
-    if not _is_admin_user(username):
-        return jsonify({"error": "admin_required"}), 403
-    
-    # Load all data
-    cards, status = load_cards_cached()
-    profiles = _load_profiles()
-    breakdowns = _load_breakdowns()
-    decks = _load_decks(include_all=True)  # Admin sees all decks
-    
-    # User stats with detailed progress
-    users = profiles.get("users", {})
-    total_users = len(users)
+def _stats_user_rollup(users: Dict[str, Any], deck_names: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Per-user progress list and totals from the summary rows (no file reads)."""
+    with _stats_lock:
+        rows = {u: r["row"] for u, r in _stats_rows.items()}
     user_list = []
-    
+    empty_row = {"learned": 0, "unsure": 0, "active": 0, "active_deck_id": "kenpo", "last_sync": 0}
+
     for user_id, udata in users.items():
         if isinstance(udata, dict):
             uname = udata.get("username", "")
-            is_admin = _is_admin_user(uname)
-            
-            # Get user's progress
-            try:
-                progress = load_progress(user_id)
-                settings = progress.get("__settings__", {})
-                active_deck_id = _get_active_deck_id(settings, "kenpo")
-                last_sync = progress.get("__last_sync__", 0)
-                
-                # Count statuses
-                learned = 0
-                unsure = 0
-                active = 0
-                for k, v in progress.items():
-                    if k.startswith("__"):
-                        continue
-                    if isinstance(v, dict):
-                        s = v.get("status", "active")
-                        if s == "learned":
-                            learned += 1
-                        elif s == "unsure":
-                            unsure += 1
-                        elif s == "active":
-                            active += 1
-                
-                total_cards_user = learned + unsure + active
-                progress_pct = round((learned / total_cards_user * 100) if total_cards_user > 0 else 0, 1)
-                
-                # Get active deck name
-                active_deck_name = "Kenpo Vocabulary"
-                for d in decks:
-                    if d.get("id") == active_deck_id:
-                        active_deck_name = d.get("name", active_deck_id)
-                        break
-                
-            except Exception:
-                learned = unsure = active = 0
-                progress_pct = 0
-                active_deck_id = "kenpo"
-                active_deck_name = "Kenpo Vocabulary"
-                last_sync = 0
-            
+            row = rows.get(user_id) or empty_row
+            learned, unsure, active = row["learned"], row["unsure"], row["active"]
+            total_cards_user = learned + unsure + active
+            progress_pct = round((learned / total_cards_user * 100) if total_cards_user > 0 else 0, 1)
+            active_deck_id = row["active_deck_id"]
+
             user_list.append({
                 "id": user_id,
                 "username": uname,
-                "is_admin": is_admin,
+                "is_admin": _is_admin_user(uname),
                 "password_reset_required": udata.get("password_reset_required", False),
                 "learned": learned,
                 "unsure": unsure,
                 "active": active,
                 "progress_pct": progress_pct,
                 "active_deck_id": active_deck_id,
-                "active_deck_name": active_deck_name,
-                "last_sync": last_sync
+                "active_deck_name": deck_names.get(active_deck_id) or "Kenpo Vocabulary",
+                "last_sync": row["last_sync"]
             })
-    
+
     # Sort users by progress descending
     user_list.sort(key=lambda x: x["progress_pct"], reverse=True)
-    
+
+    # Progress stats across all users
+    totals = {
+        "total_learned": sum(u["learned"] for u in user_list),
+        "total_unsure": sum(u["unsure"] for u in user_list),
+        "total_active": sum(u["active"] for u in user_list),
+    }
+    return user_list, totals
+
+
+def _build_admin_stats(cards: List[Dict[str, Any]], status: str) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """Dashboard payload apart from per-user progress, plus the users and deck names
+    _stats_user_rollup() needs. Returns (payload, users, deck_names)."""
+    profiles = _load_profiles()
+    breakdowns = _load_breakdowns()
+    decks = _load_decks(include_all=True)  # Admin sees all decks
+    deck_names = {d.get("id"): d.get("name", d.get("id")) for d in decks}
+    users = profiles.get("users", {})
+    total_users = len(users)
+
     # Card stats
     total_cards = len(cards) if status == "ok" else 0
     groups = set()
     if status == "ok":
         for c in cards:
             groups.add(c.get("group", ""))
-    
+
     # Breakdown stats
     total_breakdowns = len(breakdowns)
-    breakdowns_with_content = sum(1 for b in breakdowns.values() 
-                                   if isinstance(b, dict) and 
+    breakdowns_with_content = sum(1 for b in breakdowns.values()
+                                   if isinstance(b, dict) and
                                    (b.get("parts") or b.get("literal")))
-    
+
     # Breakdown IDs for frontend
     breakdown_ids = list(breakdowns.keys())
-    
-    # Progress stats across all users
-    total_learned = sum(u["learned"] for u in user_list)
-    total_unsure = sum(u["unsure"] for u in user_list)
-    total_active = sum(u["active"] for u in user_list)
-    
+
     # Deck stats
     total_decks = len(decks)
     user_decks = sum(1 for d in decks if not d.get("isBuiltIn"))
-    
+
     # API key status
     keys = _load_encrypted_api_keys()
-    
-    return jsonify({
+
+    return {
         "users": {
             "total": total_users,
             "admins": list(ADMIN_USERNAMES),
-            "list": user_list
         },
         "cards": {
             "total": total_cards,
@@ -1888,11 +4083,6 @@ def api_admin_stats():
             "total": total_decks,
             "user_created": user_decks
         },
-        "progress": {
-            "total_learned": total_learned,
-            "total_unsure": total_unsure,
-            "total_active": total_active
-        },
         "ai": {
             "chatgpt_configured": bool(keys.get("chatGptKey")),
             "chatgpt_model": keys.get("chatGptModel", "gpt-4o"),
@@ -1901,34 +4091,309 @@ def api_admin_stats():
         },
         "server": {
             "version": get_version().get("version", ""),
-            "build": get_version().get("build", ""),
-            "uptime": _now()
+            "build": get_version().get("build", "")
         }
-    })
+    }, users, deck_names
+
+
+@admin_bp.get("/api/admin/stats")
+def api_admin_stats():
+    """Get comprehensive admin statistics for dashboard.
+
+    Served from cached summary rows (see _stats_refresh); ?refresh=1 re-reads
+    every user's progress file.
+    """
+    global _stats_cache, _stats_rollup, _stats_scanned
+    uid = current_user_id()
+    if not uid:
+        return jsonify({"error": "login_required"}), 401
+    
+    user = _get_user(uid)
+    username = user.get("username", "") if user else ""
+    if not _is_admin_user(username):
+        return jsonify({"error": "admin_required"}), 403
+    
+    cards, status = load_cards_cached()
+    key = _stats_base_key()
+    with _stats_lock:
+        cached = _stats_cache
+    if not (cached and cached[0] == key and cached[1] is cards):
+        cached = (key, cards) + _build_admin_stats(cards, status)
+        with _stats_lock:
+            _stats_cache = cached
+    users, deck_names = cached[3], cached[4]
+    force = str(request.args.get("refresh") or "") == "1"
+    now = time.monotonic()
+    with _stats_lock:
+        # One request per interval claims the scan; a new user list (profiles changed) rescans at once
+        due = force or _stats_scanned[0] is not cached or now - _stats_scanned[1] >= STATS_SCAN_SECONDS
+        if due:
+            _stats_scanned = (cached, now)
+    if due:
+        _stats_refresh(list(users), force=force)
+    with _stats_lock:
+        rows_generation, rollup = _stats_rows_generation, _stats_rollup
+    if rollup and rollup[0] is cached and rollup[1] == rows_generation:
+        payload = rollup[2]
+    else:
+        user_list, totals = _stats_user_rollup(users, deck_names)
+        payload = dict(cached[2], users=dict(cached[2]["users"], list=user_list), progress=totals)
+        with _stats_lock:
+            _stats_rollup = (cached, rows_generation, payload)
+
+    # Live fields on top of the cached rollup
+    out = dict(payload)
+    out["ai"] = dict(payload["ai"], router=_ai_router_stats())
+    out["server"] = dict(payload["server"], uptime=_now())
+    return jsonify(out)
+
+
+@admin_bp.route("/api/admin/ai/providers", methods=["GET", "POST"])
+def api_admin_ai_providers():
+    """AI provider router health: circuit state and p50/p95 latency per provider.
+    POST with {"reset": true} clears the breakers and latency samples."""
+    uid = current_user_id()
+    if not uid:
+        return jsonify({"error": "login_required"}), 401
+    user = _get_user(uid)
+    if not _is_admin_user(user.get("username", "") if user else ""):
+        return jsonify({"error": "admin_required"}), 403
+    if request.method == "POST" and (request.get_json(silent=True) or {}).get("reset"):
+        for name in AI_PROVIDERS:
+            _ai_provider_health[name] = _ProviderHealth(name)
+    return jsonify(_ai_router_stats())
+
+# Server activity log: an O(1) in-memory ring buffer (newest MAX_LOG_ENTRIES)
+# mirrored to rotating JSONL files under data/logs so history survives restarts.
+# Every entry carries a monotonically increasing "seq", used as the paging cursor.
+# Several server processes may share the data folder, so appends and rotation
+# happen under the OS file lock (KENPO_FILE_LOCKS), the next seq follows the
+# newest entry on disk, and readers reload the ring when another process has
+# appended since.
+MAX_LOG_ENTRIES = max(50, _safe_int(os.environ.get("KENPO_LOG_ENTRIES"), 500))
+ACTIVITY_LOG_DIR = os.path.join(DATA_DIR, "logs")
+ACTIVITY_LOG_PATH = os.path.join(ACTIVITY_LOG_DIR, "activity.jsonl")
+ACTIVITY_LOG_MAX_BYTES = max(64 * 1024, _safe_int(os.environ.get("KENPO_LOG_MAX_BYTES"), 1024 * 1024))
+ACTIVITY_LOG_BACKUPS = max(1, _safe_int(os.environ.get("KENPO_LOG_BACKUPS"), 3))
+
+ACTIVITY_LOG: "deque[Dict[str, Any]]" = deque(maxlen=MAX_LOG_ENTRIES)
+_activity_lock = threading.Lock()
+_activity_seq = 0
+_activity_ring_stale = False  # another process appended entries this ring does not have
+_activity_rotate_after = 0.0  # after a failed rotation, wait before retrying instead of on every entry
+
+
+def _activity_files_oldest_first() -> List[str]:
+    paths = [f"{ACTIVITY_LOG_PATH}.{i}" for i in range(ACTIVITY_LOG_BACKUPS, 0, -1)]
+    paths.append(ACTIVITY_LOG_PATH)
+    return [p for p in paths if os.path.exists(p)]
+
+
+def _read_activity_file(path: str) -> List[Dict[str, Any]]:
+    out = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except Exception:
+                    continue  # torn last line after a crash
+                if isinstance(entry, dict) and "seq" in entry:
+                    out.append(entry)
+    except OSError:
+        pass
+    return out
+
+
+def _load_activity_log() -> None:
+    """Refill the ring buffer (and seq counter) from the JSONL files (startup, or after another process appended)."""
+    global _activity_seq
+    tail: "deque[Dict[str, Any]]" = deque(maxlen=MAX_LOG_ENTRIES)
+    for path in _activity_files_oldest_first():
+        tail.extend(_read_activity_file(path))
+    with _activity_lock:
+        ACTIVITY_LOG.clear()
+        ACTIVITY_LOG.extend(tail)
+        _activity_seq = max([_safe_int(e.get("seq"), 0) for e in tail] + [_activity_seq])
+
+
+def _activity_last_seq_on_disk() -> int:
+    """seq of the newest persisted entry (tail of activity.jsonl, else of .1)."""
+    for path in (ACTIVITY_LOG_PATH, f"{ACTIVITY_LOG_PATH}.1"):
+        try:
+            with open(path, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                if not size:
+                    continue
+                f.seek(max(0, size - 8192))
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        for line in reversed(lines):
+            try:
+                entry = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(entry, dict) and "seq" in entry:
+                return _safe_int(entry.get("seq"), 0)
+    return 0
 
 
-# Server activity log storage
-ACTIVITY_LOG = []
-MAX_LOG_ENTRIES = 500
+def _rotate_activity_files() -> None:
+    """Shift activity.jsonl -> .1 -> .2 ...; caller holds _activity_lock and the OS lock,
+    so no process has the file open for appending (Windows cannot rename it then)."""
+    oldest = f"{ACTIVITY_LOG_PATH}.{ACTIVITY_LOG_BACKUPS}"
+    if os.path.exists(oldest):
+        os.remove(oldest)
+    for i in range(ACTIVITY_LOG_BACKUPS - 1, 0, -1):
+        src = f"{ACTIVITY_LOG_PATH}.{i}"
+        if os.path.exists(src):
+            _replace_file(src, f"{ACTIVITY_LOG_PATH}.{i + 1}")
+    if os.path.exists(ACTIVITY_LOG_PATH):
+        _replace_file(ACTIVITY_LOG_PATH, f"{ACTIVITY_LOG_PATH}.1")
+
 
 def log_activity(level: str, message: str, user: str = ""):
     """Add an entry to the activity log."""
-    global ACTIVITY_LOG
-    entry = {
-        "timestamp": _now(),
-        "level": level,  # info, warn, error
-        "message": message,
-        "user": user
-    }
-    ACTIVITY_LOG.append(entry)
-    # Keep only recent entries
-    if len(ACTIVITY_LOG) > MAX_LOG_ENTRIES:
-        ACTIVITY_LOG = ACTIVITY_LOG[-MAX_LOG_ENTRIES:]
+    global _activity_seq, _activity_ring_stale, _activity_rotate_after
+    with _activity_lock:
+        fh = None
+        try:
+            os.makedirs(ACTIVITY_LOG_DIR, exist_ok=True)
+            fh = _os_lock(ACTIVITY_LOG_PATH)
+            on_disk = _activity_last_seq_on_disk()
+        except Exception as e:
+            print(f"[LOG] could not lock activity log: {e}")
+            on_disk = 0
+        try:
+            if on_disk > _activity_seq:
+                _activity_ring_stale = True
+            _activity_seq = max(_activity_seq, on_disk) + 1
+            entry = {
+                "seq": _activity_seq,
+                "timestamp": _now(),
+                "ts": round(time.time(), 3),
+                "level": level,  # info, warn, error
+                "message": message,
+                "user": user
+            }
+            ACTIVITY_LOG.append(entry)  # deque(maxlen) drops the oldest in O(1)
+            try:
+                # Opened per entry so rotation never renames a file another process holds open
+                with open(ACTIVITY_LOG_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    size = f.tell()
+                if size >= ACTIVITY_LOG_MAX_BYTES and time.time() >= _activity_rotate_after:
+                    try:
+                        _rotate_activity_files()
+                    except OSError as e:
+                        _activity_rotate_after = time.time() + 60
+                        print(f"[LOG] could not rotate activity log, retrying in 60s: {e}")
+            except Exception as e:
+                print(f"[LOG] could not persist activity entry: {e}")
+        finally:
+            _os_unlock(fh)
+
+
+def _iter_activity_newest_first(before: Optional[int] = None):
+    """Ring buffer entries, newest first, then older entries still on disk."""
+    global _activity_ring_stale
+    with _activity_lock:
+        newest = ACTIVITY_LOG[-1]["seq"] if ACTIVITY_LOG else 0
+        stale = _activity_ring_stale or _activity_last_seq_on_disk() > newest
+        _activity_ring_stale = False
+    if stale:
+        _load_activity_log()
+    with _activity_lock:
+        ring = list(ACTIVITY_LOG)
+    oldest_in_ring = ring[0]["seq"] if ring else None
+    for entry in reversed(ring):
+        if before is None or entry["seq"] < before:
+            yield entry
+    if oldest_in_ring is None:
+        return
+    for path in reversed(_activity_files_oldest_first()):
+        for entry in reversed(_read_activity_file(path)):
+            seq = _safe_int(entry.get("seq"), 0)
+            if seq < oldest_in_ring and (before is None or seq < before):
+                yield entry
+
+
+def _activity_log_filter(log_type: str = "all", level: str = "", user: str = "", since: str = "", until: str = ""):
+    """Build a predicate for /api/admin/logs filters.
+
+    since/until accept epoch seconds or a "YYYY-MM-DD[ HH:MM:SS]" prefix.
+    """
+    levels = {v.strip().lower() for v in level.split(",") if v.strip()}
+    user = user.strip().lower()
+
+    def bound(value: str):
+        value = value.strip()
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+    lo, hi = bound(since), bound(until)
+
+    def match(e: Dict[str, Any]) -> bool:
+        if log_type == "error" and e.get("level") != "error":
+            return False
+        if log_type == "user" and not e.get("user"):
+            return False
+        if log_type == "server" and e.get("user"):
+            return False
+        if levels and str(e.get("level", "")).lower() not in levels:
+            return False
+        if user and str(e.get("user", "")).lower() != user:
+            return False
+        for b, is_lo in ((lo, True), (hi, False)):
+            if b is None:
+                continue
+            v = e.get("ts", 0) if isinstance(b, float) else str(e.get("timestamp", ""))[:len(b)]
+            if (is_lo and v < b) or (not is_lo and v > b):
+                return False
+        return True
+
+    return match
 
 
-@app.get("/api/admin/logs")
+def _clear_activity_log(keep) -> None:
+    """Drop entries for which keep(entry) is False, in memory and on disk."""
+    with _activity_lock:
+        kept = [e for e in ACTIVITY_LOG if keep(e)]
+        ACTIVITY_LOG.clear()
+        ACTIVITY_LOG.extend(kept)
+        fh = _os_lock(ACTIVITY_LOG_PATH)
+        try:
+            for path in _activity_files_oldest_first():
+                entries = [e for e in _read_activity_file(path) if keep(e)]
+                if not entries:
+                    os.remove(path)
+                    continue
+                tmp = path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for e in entries:
+                        f.write(json.dumps(e, ensure_ascii=False) + "\n")
+                _replace_file(tmp, path)
+        finally:
+            _os_unlock(fh)
+
+
+_load_activity_log()
+_startup_phase("route definitions, activity log")
+
+
+@admin_bp.get("/api/admin/logs")
 def api_admin_logs():
-    """Get server activity logs (admin only)."""
+    """Get server activity logs (admin only).
+
+    Query: type=all|error|user|server, level=info,warn,error, user=<name>,
+    since/until (epoch seconds or "YYYY-MM-DD HH:MM:SS" prefix), limit,
+    cursor=<seq> (from next_cursor of the previous page). Newest first.
+    """
     uid = current_user_id()
     if not uid:
         return jsonify({"error": "login_required"}), 401
@@ -1939,30 +4404,33 @@ def api_admin_logs():
         return jsonify({"error": "admin_required"}), 403
     
     log_type = request.args.get("type", "all")
-    limit = int(request.args.get("limit", 100))
-    
-    logs = ACTIVITY_LOG.copy()
-    
-    # Filter by type
-    if log_type == "error":
-        logs = [l for l in logs if l["level"] == "error"]
-    elif log_type == "user":
-        logs = [l for l in logs if l["user"]]
-    elif log_type == "server":
-        logs = [l for l in logs if not l["user"]]
-    
-    # Return most recent first, limited
-    logs = logs[-limit:]
-    logs.reverse()
-    
-    return jsonify({"logs": logs})
+    limit = min(1000, max(1, _safe_int(request.args.get("limit"), 100)))
+    cursor = request.args.get("cursor")
+    before = _safe_int(cursor, 0) if cursor else None
+    match = _activity_log_filter(
+        log_type,
+        level=request.args.get("level", ""),
+        user=request.args.get("user", ""),
+        since=request.args.get("since", ""),
+        until=request.args.get("until", ""),
+    )
+
+    logs = []
+    next_cursor = None
+    for entry in _iter_activity_newest_first(before):
+        if not match(entry):
+            continue
+        if len(logs) == limit:
+            next_cursor = logs[-1]["seq"]
+            break
+        logs.append(entry)
 
+    return jsonify({"logs": logs, "next_cursor": next_cursor})
 
-@app.post("/api/admin/logs/clear")
+
+@admin_bp.post("/api/admin/logs/clear")
 def api_admin_logs_clear():
     """Clear activity logs (admin only)."""
-    global ACTIVITY_LOG
-    
     uid = current_user_id()
     if not uid:
         return jsonify({"error": "login_required"}), 401
@@ -1975,20 +4443,21 @@ def api_admin_logs_clear():
     log_type = request.args.get("type", "all")
     
     if log_type == "all":
-        ACTIVITY_LOG = []
+        _clear_activity_log(lambda l: False)
     elif log_type == "error":
-        ACTIVITY_LOG = [l for l in ACTIVITY_LOG if l["level"] != "error"]
+        _clear_activity_log(lambda l: l["level"] != "error")
     elif log_type == "user":
-        ACTIVITY_LOG = [l for l in ACTIVITY_LOG if not l["user"]]
+        _clear_activity_log(lambda l: not l["user"])
     elif log_type == "server":
-        ACTIVITY_LOG = [l for l in ACTIVITY_LOG if l["user"]]
+        _clear_activity_log(lambda l: bool(l["user"]))
     
     log_activity("info", f"Logs cleared by {username}", username)
     
     return jsonify({"success": True})
 
 
-@app.post("/api/admin/user/update")
+@admin_bp.post("/api/admin/user/update")
+@_json_locked("profiles", "admin_users")
 def api_admin_user_update():
     """Update user admin status."""
     global ADMIN_USERNAMES
@@ -2019,8 +4488,7 @@ def api_admin_user_update():
     # Update admin_users.json
     admin_users_path = os.path.join(DATA_DIR, "admin_users.json")
     try:
-        with open(admin_users_path, "r", encoding="utf-8") as f:
-            admin_data = json.load(f)
+        admin_data = _load_json_file(admin_users_path)
     except Exception:
         admin_data = {"admins": list(ADMIN_USERNAMES)}
     
@@ -2031,16 +4499,17 @@ def api_admin_user_update():
         admins.discard(target_username.lower())
     
     admin_data["admins"] = list(admins)
-    with open(admin_users_path, "w", encoding="utf-8") as f:
-        json.dump(admin_data, f, ensure_ascii=False, indent=2)
+    _save_json_file(admin_users_path, admin_data)
     
     # Reload admin usernames
     ADMIN_USERNAMES = _load_admin_usernames()
+    _stats_invalidate()
     
     return jsonify({"success": True})
 
 
-@app.post("/api/admin/user/reset_password")
+@admin_bp.post("/api/admin/user/reset_password")
+@_json_locked("profiles")
 def api_admin_user_reset_password():
     """Reset user password to default and require change on next login."""
     uid = current_user_id()
@@ -2064,7 +4533,10 @@ def api_admin_user_reset_password():
     
     # Set password to default and flag for reset
     default_password = "123456789"
-    profiles["users"][target_user_id]["password_hash"] = generate_password_hash(default_password)
+    try:
+        profiles["users"][target_user_id]["password_hash"] = _hash_password(default_password)
+    except _HashBusy:
+        return _hash_busy_response()
     profiles["users"][target_user_id]["password_reset_required"] = True
     
     _save_profiles(profiles)
@@ -2074,7 +4546,7 @@ def api_admin_user_reset_password():
 
 # ============ ADMIN DECK ACCESS MANAGEMENT ============
 
-@app.get("/api/admin/deck-config")
+@admin_bp.get("/api/admin/deck-config")
 def api_admin_get_deck_config():
     """Get global deck configuration (admin only)."""
     uid = current_user_id()
@@ -2097,7 +4569,8 @@ def api_admin_get_deck_config():
     })
 
 
-@app.post("/api/admin/deck-config")
+@admin_bp.post("/api/admin/deck-config")
+@_json_locked("deck_config")
 def api_admin_update_deck_config():
     """Update global deck configuration (admin only)."""
     uid = current_user_id()
@@ -2127,7 +4600,7 @@ def api_admin_update_deck_config():
 
 
 
-@app.get("/api/admin/user/<target_user_id>/deck-access")
+@admin_bp.get("/api/admin/user/<target_user_id>/deck-access")
 def api_admin_get_user_deck_access(target_user_id: str):
     """Get a user's owned decks and which of the ADMIN's decks they can access (admin only)."""
     uid = current_user_id()
@@ -2173,7 +4646,8 @@ def api_admin_get_user_deck_access(target_user_id: str):
     })
 
 
-@app.post("/api/admin/user/<target_user_id>/deck-access")
+@admin_bp.post("/api/admin/user/<target_user_id>/deck-access")
+@_json_locked("deck_access")
 def api_admin_set_user_deck_access(target_user_id: str):
     """Set which of the ADMIN's decks the target user can access (admin only)."""
     uid = current_user_id()
@@ -2219,7 +4693,8 @@ def api_admin_set_user_deck_access(target_user_id: str):
 
     return jsonify({"success": True, "grantedAdminDecks": desired})
 
-@app.post("/api/admin/deck-invite-code")
+@admin_bp.post("/api/admin/deck-invite-code")
+@_json_locked("deck_access")
 def api_admin_create_invite_code():
     """Create an invite code for a deck (admin only)."""
     uid = current_user_id()
@@ -2257,7 +4732,8 @@ def api_admin_create_invite_code():
     return jsonify({"success": True, "code": code})
 
 
-@app.delete("/api/admin/deck-invite-code/<code>")
+@admin_bp.delete("/api/admin/deck-invite-code/<code>")
+@_json_locked("deck_access")
 def api_admin_delete_invite_code(code: str):
     """Delete an invite code (admin only)."""
     uid = current_user_id()
@@ -2279,7 +4755,8 @@ def api_admin_delete_invite_code(code: str):
     return jsonify({"success": True})
 
 
-@app.post("/api/admin/user-deck-access")
+@admin_bp.post("/api/admin/user-deck-access")
+@_json_locked("deck_access")
 def api_admin_update_user_deck_access():
     """Update a user's deck access (admin only)."""
     uid = current_user_id()
@@ -2335,7 +4812,8 @@ def api_admin_update_user_deck_access():
     return jsonify({"success": True})
 
 
-@app.post("/api/redeem-invite-code")
+@decks_bp.post("/api/redeem-invite-code")
+@_json_locked("deck_access")
 def api_redeem_invite_code():
     """Redeem an invite code to unlock a deck."""
     uid = current_user_id()
@@ -2388,7 +4866,8 @@ def api_redeem_invite_code():
     return jsonify({"success": True, "deckId": deck_id, "deckName": deck_name})
 
 
-@app.post("/api/decks/<deck_id>/clear_default")
+@decks_bp.post("/api/decks/<deck_id>/clear_default")
+@_json_locked("decks")
 def api_clear_default_deck(deck_id: str):
     """Clear the default flag from a deck."""
     uid = current_user_id()
@@ -2408,7 +4887,7 @@ def api_clear_default_deck(deck_id: str):
     return jsonify({"success": True})
 
 
-@app.get("/api/cards")
+@study_bp.get("/api/cards")
 def api_cards():
     uid, _ = require_user()
     if not uid:
@@ -2479,7 +4958,8 @@ def api_cards():
     return jsonify(out)
 
 
-@app.post("/api/set_status")
+@study_bp.post("/api/set_status")
+@_json_locked("progress")
 def api_set_status():
     uid, _ = require_user()
     if not uid:
@@ -2497,7 +4977,8 @@ def api_set_status():
     return jsonify({"ok": True})
 
 
-@app.post("/api/bulk_set_status")
+@study_bp.post("/api/bulk_set_status")
+@_json_locked("progress")
 def api_bulk_set_status():
     uid, _ = require_user()
     if not uid:
@@ -2517,7 +4998,8 @@ def api_bulk_set_status():
     return jsonify({"ok": True})
 
 
-@app.post("/api/reset")
+@study_bp.post("/api/reset")
+@_json_locked("progress")
 def api_reset():
     uid, _ = require_user()
     if not uid:
@@ -2526,7 +5008,7 @@ def api_reset():
     return jsonify({"ok": True})
 
 
-@app.get("/api/breakdown")
+@study_bp.get("/api/breakdown")
 def api_breakdown_get():
     uid, user = require_user()
     if not uid:
@@ -2541,7 +5023,8 @@ def api_breakdown_get():
     return jsonify({"id": card_id, "breakdown": entry})
 
 
-@app.post("/api/breakdown")
+@study_bp.post("/api/breakdown")
+@_json_locked("breakdowns")
 def api_breakdown_set():
     uid, user = require_user()
     if not uid:
@@ -2618,7 +5101,7 @@ def api_breakdown_set():
     return jsonify({'ok': True, 'breakdown': entry})
 
 
-@app.post("/api/breakdown_autofill")
+@ai_bp.post("/api/breakdown_autofill")
 def api_breakdown_autofill():
     uid, user = require_user()
     if not uid:
@@ -2645,41 +5128,13 @@ def api_breakdown_autofill():
 
     ai_error = None
 
-    def try_openai():
-        nonlocal ai_error
-        result, err = _openai_breakdown(term=term, meaning=meaning, group=group)
-        if result and isinstance(result, dict):
-            return {"ok": True, "suggestion": result, "source": "openai", "provider": "openai"}
-        if err:
-            ai_error = err
-        return None
-
-    def try_gemini():
-        nonlocal ai_error
-        result, err = _gemini_breakdown(term=term, meaning=meaning, group=group)
-        if result and isinstance(result, dict):
-            return {"ok": True, "suggestion": result, "source": "gemini", "provider": "gemini"}
-        if err:
-            ai_error = err
-        return None
-
-    # Try requested provider(s)
-    if prov == "openai":
-        out = try_openai()
-        if out:
-            return jsonify(out)
-    elif prov == "gemini":
-        out = try_gemini()
-        if out:
-            return jsonify(out)
-    elif prov == "auto":
-        # Prefer OpenAI, then Gemini
-        out = try_openai()
-        if out:
-            return jsonify(out)
-        out = try_gemini()
-        if out:
-            return jsonify(out)
+    # Route through the provider router (health tracking, circuit breaker, optional hedging)
+    if prov in ("openai", "gemini", "auto"):
+        order = [prov] if prov != "auto" else list(AI_PROVIDERS)  # auto: prefer OpenAI, then Gemini
+        result, used, err = _route_breakdown(order, term, meaning, group)
+        if result:
+            return jsonify({"ok": True, "suggestion": result, "source": used, "provider": used})
+        ai_error = err
     # prov == off -> skip AI
 
     # Fallback: curated + conservative split
@@ -2701,8 +5156,8 @@ def api_breakdown_autofill():
     return jsonify(resp)
 
 
-@app.get("/api/ai")
-@app.get("/api/ai/status")
+@ai_bp.get("/api/ai")
+@ai_bp.get("/api/ai/status")
 def api_ai_status():
     """Simple status so the UI can show if AI autofill is available."""
     uid, _ = require_user()
@@ -2727,7 +5182,7 @@ def api_ai_status():
     })
 
 
-@app.get("/api/breakdowns")
+@study_bp.get("/api/breakdowns")
 def api_breakdowns_list():
     uid, user = require_user()
     if not uid:
@@ -2752,7 +5207,7 @@ def api_breakdowns_list():
     return jsonify({"ok": True, "items": items})
 
 
-@app.get("/api/breakdowns/ids")
+@study_bp.get("/api/breakdowns/ids")
 def api_breakdowns_ids():
     """Get just the IDs of cards that have breakdowns (lightweight endpoint)."""
     data = _load_breakdowns()
@@ -2777,26 +5232,231 @@ Copy everything below and paste it BEFORE the line:
 
 # ============ ANDROID APP SYNC API ============
 
-# In-memory token storage (simple approach - tokens expire on server restart)
-# For production, consider using Redis or database storage
-_android_tokens: Dict[str, Dict[str, Any]] = {}
+# Tokens live in a small SQLite database (data/android_tokens.sqlite3) so they
+# survive restarts and are shared by every server process on the data folder.
+# Only SHA-256 hashes of tokens are stored; an exp index lets a background
+# sweeper delete expired rows, and an LRU front cache answers repeat requests
+# without touching the database. Connections come from a small pool
+# (KENPO_TOKEN_DB_POOL) rather than one per thread. If SQLite cannot be opened
+# at startup (or KENPO_TOKEN_DB=memory), tokens are kept in memory only, as before.
+TOKEN_TTL_SECONDS = max(60, _safe_int(os.environ.get("KENPO_TOKEN_TTL_DAYS"), 7) * 24 * 60 * 60)
+TOKEN_CACHE_SIZE = max(0, _safe_int(os.environ.get("KENPO_TOKEN_CACHE"), 4096))
+TOKEN_SWEEP_SECONDS = max(10, _safe_int(os.environ.get("KENPO_TOKEN_SWEEP_SECONDS"), 600))
+TOKEN_DB_POOL = max(1, _safe_int(os.environ.get("KENPO_TOKEN_DB_POOL"), 4))  # idle connections kept open
+TOKEN_DB_PATH = (os.environ.get("KENPO_TOKEN_DB") or "").strip() or os.path.join(
+    REPLICA_SOURCE or DATA_DIR, "android_tokens.sqlite3")  # a replica checks tokens against the primary's DB
+
+_android_tokens: Dict[str, Dict[str, Any]] = {}  # memory-only fallback, keyed by token hash
+_token_cache: "OrderedDict[str, Tuple[str, Dict[str, Any], float]]" = OrderedDict()
+_token_lock = threading.Lock()
+_token_pool: List[Any] = []  # idle sqlite3 connections (opened with check_same_thread=False)
+_token_db_ok: Optional[bool] = None
+_token_sweeper: Optional[threading.Thread] = None
+_token_counts = {"hits": 0, "misses": 0, "issued": 0, "expired": 0, "swept": 0}
+
 
 def _generate_token() -> str:
     """Generate a secure random token."""
     return uuid.uuid4().hex + uuid.uuid4().hex
 
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _token_db_open():
+    import sqlite3
+    os.makedirs(os.path.dirname(os.path.abspath(TOKEN_DB_PATH)), exist_ok=True)
+    conn = sqlite3.connect(TOKEN_DB_PATH, timeout=10, isolation_level=None, check_same_thread=False)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS android_tokens ("
+            " token_hash TEXT PRIMARY KEY, uid TEXT NOT NULL, user_json TEXT NOT NULL,"
+            " created_at REAL NOT NULL, exp REAL NOT NULL) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS android_tokens_exp ON android_tokens (exp)")
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+@contextmanager
+def _token_db():
+    """Borrow a pooled SQLite connection to the token store; yields None when running memory-only.
+
+    Only a failure on the very first open switches the process to memory-only. A later
+    failure is logged and yields None for this call alone; the next call tries again.
+    At most TOKEN_DB_POOL idle connections are kept, so thread-per-request servers do
+    not leave one open connection behind per thread.
+    """
+    global _token_db_ok
+    if _token_db_ok is False or TOKEN_DB_PATH.lower() == "memory":
+        yield None
+        return
+    with _token_lock:
+        conn = _token_pool.pop() if _token_pool else None
+    if conn is None:
+        try:
+            conn = _token_db_open()
+        except Exception as e:
+            if _token_db_ok is None:
+                _token_db_ok = False
+                print(f"[TOKENS] WARNING: token database unavailable ({e}); tokens are memory-only and end on restart")
+            else:
+                print(f"[TOKENS] WARNING: could not open token database ({e}); retrying on the next request")
+            conn = None
+        else:
+            if _token_db_ok is None:
+                _token_db_ok = True
+                _start_token_sweeper()
+    if conn is None:
+        yield None
+        return
+    ok = False
+    try:
+        yield conn
+        ok = True
+    finally:
+        with _token_lock:
+            if ok and len(_token_pool) < TOKEN_DB_POOL:
+                _token_pool.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+
+def _token_cache_put(th: str, entry: Tuple[str, Dict[str, Any], float]) -> None:
+    if TOKEN_CACHE_SIZE <= 0:
+        return
+    with _token_lock:
+        _token_cache[th] = entry
+        _token_cache.move_to_end(th)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+
+def _issue_android_token(uid: str, user: Dict[str, Any]) -> str:
+    """Create and store a token for uid. The stored user snapshot omits the password hash."""
+    token = _generate_token()
+    th = _token_hash(token)
+    now = time.time()
+    exp = now + TOKEN_TTL_SECONDS
+    user = {k: v for k, v in (user or {}).items() if k != "password_hash"}
+    with _token_db() as conn:
+        if conn is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO android_tokens (token_hash, uid, user_json, created_at, exp) VALUES (?, ?, ?, ?, ?)",
+                (th, uid, json.dumps(user, ensure_ascii=False), now, exp),
+            )
+    if conn is None:
+        with _token_lock:
+            _android_tokens[th] = {"uid": uid, "user": user, "exp": exp}
+    _token_cache_put(th, (uid, user, exp))
+    with _token_lock:
+        _token_counts["issued"] += 1
+    return token
+
+
 def _verify_android_token(token: str) -> Optional[Tuple[str, Dict]]:
     """Verify token and return (user_id, user_data) or None."""
     if not token:
         return None
-    session_data = _android_tokens.get(token)
-    if not session_data:
-        return None
-    # Check expiration (7 days)
-    if time.time() > session_data.get('exp', 0):
-        del _android_tokens[token]
+    th = _token_hash(token)
+    now = time.time()
+    with _token_lock:
+        entry = _token_cache.get(th)
+        if entry is not None:
+            if now <= entry[2]:
+                _token_cache.move_to_end(th)
+                _token_counts["hits"] += 1
+                return entry[0], entry[1]
+            del _token_cache[th]
+        _token_counts["misses"] += 1
+    row = None
+    with _token_db() as conn:
+        if conn is not None:
+            row = conn.execute("SELECT uid, user_json, exp FROM android_tokens WHERE token_hash = ?", (th,)).fetchone()
+    if row is not None:
+        try:
+            entry = (row[0], json.loads(row[1]), float(row[2]))
+        except Exception:
+            return None
+    else:
+        # Memory-only mode, or a token issued while the database could not be opened
+        with _token_lock:
+            data = _android_tokens.get(th)
+        if not data:
+            return None
+        entry = (data.get("uid"), data.get("user") or {}, float(data.get("exp", 0)))
+    if now > entry[2]:
+        _delete_android_token_hash(th)
+        with _token_lock:
+            _token_counts["expired"] += 1
         return None
-    return session_data.get('uid'), session_data.get('user')
+    _token_cache_put(th, entry)
+    return entry[0], entry[1]
+
+
+def _delete_android_token_hash(th: str) -> None:
+    with _token_lock:
+        _token_cache.pop(th, None)
+        _android_tokens.pop(th, None)
+    with _token_db() as conn:
+        if conn is not None:
+            conn.execute("DELETE FROM android_tokens WHERE token_hash = ?", (th,))
+
+
+def _sweep_android_tokens(now: Optional[float] = None) -> int:
+    """Delete expired tokens (uses the exp index). Returns the number removed."""
+    now = time.time() if now is None else now
+    removed = 0
+    with _token_db() as conn:
+        if conn is not None:
+            removed = conn.execute("DELETE FROM android_tokens WHERE exp < ?", (now,)).rowcount or 0
+    with _token_lock:
+        for th in [th for th, d in _android_tokens.items() if d.get("exp", 0) < now]:
+            del _android_tokens[th]
+            removed += 1
+        for th in [th for th, e in _token_cache.items() if e[2] < now]:
+            del _token_cache[th]
+        _token_counts["swept"] += removed
+    return removed
+
+
+def _token_sweep_loop() -> None:
+    while True:
+        time.sleep(TOKEN_SWEEP_SECONDS)
+        try:
+            removed = _sweep_android_tokens()
+            if removed:
+                print(f"[TOKENS] Swept {removed} expired token(s)")
+        except Exception as e:
+            print(f"[TOKENS] Sweep failed: {e}")
+
+
+def _start_token_sweeper() -> None:
+    global _token_sweeper
+    with _token_lock:
+        if _token_sweeper is not None:
+            return
+        _token_sweeper = threading.Thread(target=_token_sweep_loop, name="token-sweeper", daemon=True)
+    _token_sweeper.start()
+
+
+def _token_store_stats() -> Dict[str, Any]:
+    with _token_db() as conn:
+        out: Dict[str, Any] = {"backend": "sqlite" if conn is not None else "memory"}
+        if conn is not None:
+            out["stored"] = conn.execute("SELECT COUNT(*) FROM android_tokens").fetchone()[0]
+    with _token_lock:
+        out.update(_token_counts)
+        out["cached"] = len(_token_cache)
+        out["memory_tokens"] = len(_android_tokens)
+        out["idle_connections"] = len(_token_pool)
+    return out
 
 def android_auth_required(f):
     """Decorator for routes that require Android token auth."""
@@ -2829,7 +5489,7 @@ def android_admin_required(f):
         return f(*args, **kwargs)
     return decorated
 
-@app.post("/api/sync/login")
+@sync_bp.post("/api/sync/login")
 def api_android_login():
     """Android app login endpoint.
     
@@ -2842,7 +5502,11 @@ def api_android_login():
     
     if not username or not password:
         return jsonify({'error': 'Username and password required'}), 400
-    
+
+    throttled = _login_throttle(username)
+    if throttled:
+        return throttled
+
     # Load profiles
     profiles = _load_profiles()
     users = profiles.get('users', {})
@@ -2857,20 +5521,21 @@ def api_android_login():
             break
     
     if not found_user:
+        _login_spend(username)
         return jsonify({'error': 'User not found'}), 401
     
     # Verify password
     password_hash = found_user.get('password_hash', '')
-    if not check_password_hash(password_hash, password):
+    try:
+        password_ok = _verify_password(password_hash, password)
+    except _HashBusy:
+        return _hash_busy_response()
+    if not password_ok:
+        _login_spend(username)
         return jsonify({'error': 'Invalid password'}), 401
     
-    # Generate token
-    token = _generate_token()
-    _android_tokens[token] = {
-        'uid': found_uid,
-        'user': found_user,
-        'exp': time.time() + (7 * 24 * 60 * 60)  # 7 days
-    }
+    # Generate token (stored hashed; valid KENPO_TOKEN_TTL_DAYS, default 7 days)
+    token = _issue_android_token(found_uid, found_user)
     
     return jsonify({
         'token': token,
@@ -2879,8 +5544,9 @@ def api_android_login():
         'displayName': found_user.get('display_name', '')
     })
 
-@app.post("/api/breakdowns")
+@sync_bp.post("/api/breakdowns")
 @android_auth_required
+@_json_locked("breakdowns")
 def api_breakdowns_save_android():
     """
     Android expects POST /api/breakdowns with a Bearer token.
@@ -2938,7 +5604,8 @@ def api_breakdowns_save_android():
 
 # ============ WEB SYNC ENDPOINTS (Session Auth) ============
 
-@app.post("/api/web/sync/push")
+@sync_bp.post("/api/web/sync/push")
+@_json_locked("progress")
 def api_web_sync_push():
     """Push progress from web app to server (session auth)."""
     uid = current_user_id()
@@ -2954,7 +5621,7 @@ def api_web_sync_push():
     return jsonify({"success": True, "message": "Sync complete"})
 
 
-@app.get("/api/web/sync/pull")
+@sync_bp.get("/api/web/sync/pull")
 def api_web_sync_pull():
     """Pull progress from server to web app (session auth)."""
     uid = current_user_id()
@@ -2986,7 +5653,7 @@ def api_web_sync_pull():
     return jsonify({'progress': entries})
 
 
-@app.get("/api/sync/pull")
+@sync_bp.get("/api/sync/pull")
 @android_auth_required
 def api_sync_pull():
     """Pull progress from server to Android app.
@@ -3022,28 +5689,15 @@ def api_sync_pull():
     return jsonify({'progress': entries})
 
 
-@app.post("/api/sync/push")
-@android_auth_required
-def api_sync_push():
-    """Push progress from Android app to server.
-
-    Accepts BOTH formats for backwards compatibility:
-      - Legacy: progress[id] = "learned"
-      - New:    progress[id] = {"status": "learned", "updated_at": 1737042271}
+def _merge_sync_progress(current: Dict[str, Any], incoming_progress: Dict[str, Any],
+                         now: Optional[int] = None) -> Tuple[int, int, int]:
+    """Merge pushed progress into current (in place); returns (applied, skipped_unknown, skipped_older).
 
     Merge rule (per card): keep the entry with the newer updated_at.
-    If legacy format is provided, server assigns updated_at = now.
+    Legacy string entries and missing timestamps count as `now`.
     """
-    uid = request.android_uid
-    payload = request.get_json(force=True, silent=True) or {}
-    incoming_progress = payload.get('progress', {})
-
-    if not isinstance(incoming_progress, dict):
-        return jsonify({'error': 'Invalid progress data'}), 400
-
-    current = load_progress(uid)
-
-    now = int(time.time())
+    if now is None:
+        now = int(time.time())
     applied = 0
     skipped_unknown = 0
     skipped_older = 0
@@ -3104,6 +5758,32 @@ def api_sync_push():
         else:
             skipped_older += 1
 
+    return applied, skipped_unknown, skipped_older
+
+
+@sync_bp.post("/api/sync/push")
+@android_auth_required
+@_json_locked("progress")
+def api_sync_push():
+    """Push progress from Android app to server.
+
+    Accepts BOTH formats for backwards compatibility:
+      - Legacy: progress[id] = "learned"
+      - New:    progress[id] = {"status": "learned", "updated_at": 1737042271}
+
+    Merge rule (per card): keep the entry with the newer updated_at.
+    If legacy format is provided, server assigns updated_at = now.
+    """
+    uid = request.android_uid
+    payload = request.get_json(force=True, silent=True) or {}
+    incoming_progress = payload.get('progress', {})
+
+    if not isinstance(incoming_progress, dict):
+        return jsonify({'error': 'Invalid progress data'}), 400
+
+    current = load_progress(uid)
+    applied, skipped_unknown, skipped_older = _merge_sync_progress(current, incoming_progress)
+
     save_progress(uid, current)
     return jsonify({
         'success': True,
@@ -3114,7 +5794,7 @@ def api_sync_push():
     })
 
 
-@app.get("/api/sync/helper")
+@sync_bp.get("/api/sync/helper")
 def api_sync_helper():
     """
     Public helper endpoint used by Android + Web to agree on canonical card IDs.
@@ -3125,15 +5805,16 @@ def api_sync_helper():
         return jsonify({"error": status}), 404
     return jsonify(helper)
 
-@app.get("/api/sync/breakdowns")
+@sync_bp.get("/api/sync/breakdowns")
 def api_sync_breakdowns():
     """Get all breakdowns for Android app (no auth required for read)."""
     data = _load_breakdowns()
     return jsonify({'breakdowns': data})
 
 
-@app.post("/api/sync/customset")
+@sync_bp.post("/api/sync/customset")
 @android_auth_required
+@_json_locked("progress")
 def api_sync_customset():
     """Sync custom study set from Android."""
     uid = request.android_uid
@@ -3151,7 +5832,7 @@ def api_sync_customset():
     return jsonify({'success': True})
 
 
-@app.get("/api/sync/customset")
+@sync_bp.get("/api/sync/customset")
 @android_auth_required
 def api_get_customset():
     """Get custom study set for Android."""
@@ -3161,10 +5842,27 @@ def api_get_customset():
     return jsonify({'customSet': custom_set})
 
 
+@sync_bp.get("/api/sync/events")
+@android_auth_required
+def api_sync_events():
+    """Server-Sent Events: this user's status, custom set and breakdown changes."""
+    return _feed_response(request.android_uid)
+
+
+@sync_bp.get("/api/web/sync/events")
+def api_web_sync_events():
+    """Server-Sent Events for the web UI (session auth)."""
+    uid = current_user_id()
+    if not uid:
+        return jsonify({"error": "Not logged in"}), 401
+    return _feed_response(uid)
+
+
 # ============ ADMIN API KEY MANAGEMENT ============
 
-@app.post("/api/admin/apikeys")
+@admin_bp.post("/api/admin/apikeys")
 @android_auth_required
+@_json_locked("api_keys")
 def api_admin_save_apikeys():
     """
     Save encrypted API keys and models (admin only).
@@ -3216,7 +5914,7 @@ def api_admin_save_apikeys():
         return jsonify({'error': 'Failed to save API keys'}), 500
 
 
-@app.get("/api/admin/apikeys")
+@admin_bp.get("/api/admin/apikeys")
 @android_auth_required
 def api_admin_get_apikeys():
     """
@@ -3241,7 +5939,7 @@ def api_admin_get_apikeys():
     })
 
 
-@app.get("/api/sync/apikeys")
+@sync_bp.get("/api/sync/apikeys")
 @android_auth_required
 def api_sync_get_apikeys():
     """
@@ -3262,7 +5960,7 @@ def api_sync_get_apikeys():
     })
 
 
-@app.get("/api/admin/status")
+@admin_bp.get("/api/admin/status")
 @android_auth_required
 def api_admin_status():
     """
@@ -3286,15 +5984,16 @@ def api_admin_status():
 # Namespace: /api/sync/admin/...
 # ===============================
 
-@app.get("/api/sync/admin/deck-config")
+@sync_bp.get("/api/sync/admin/deck-config")
 @android_admin_required
 def api_sync_admin_get_deck_config():
     """Token-admin: get global deck config."""
     return jsonify(_load_deck_config())
 
 
-@app.post("/api/sync/admin/deck-config")
+@sync_bp.post("/api/sync/admin/deck-config")
 @android_admin_required
+@_json_locked("deck_config")
 def api_sync_admin_set_deck_config():
     """Token-admin: set global deck config."""
     data = request.get_json(force=True, silent=True) or {}
@@ -3311,8 +6010,9 @@ def api_sync_admin_set_deck_config():
     return jsonify({"success": True, "config": cfg})
 
 
-@app.post("/api/sync/admin/deck-invite-code")
+@sync_bp.post("/api/sync/admin/deck-invite-code")
 @android_admin_required
+@_json_locked("deck_access")
 def api_sync_admin_create_invite_code():
     """Token-admin: create invite code for a deck."""
     data = request.get_json(force=True, silent=True) or {}
@@ -3338,8 +6038,9 @@ def api_sync_admin_create_invite_code():
     return jsonify({"success": True, "code": code, "deckId": deck_id})
 
 
-@app.delete("/api/sync/admin/deck-invite-code/<code>")
+@sync_bp.delete("/api/sync/admin/deck-invite-code/<code>")
 @android_admin_required
+@_json_locked("deck_access")
 def api_sync_admin_delete_invite_code(code: str):
     """Token-admin: delete invite code."""
     code = str(code or "").strip()
@@ -3354,8 +6055,9 @@ def api_sync_admin_delete_invite_code(code: str):
     return jsonify({"success": True})
 
 
-@app.post("/api/sync/redeem-invite-code")
+@sync_bp.post("/api/sync/redeem-invite-code")
 @android_auth_required
+@_json_locked("deck_access")
 def api_sync_redeem_invite_code():
     """Token-user: redeem invite code to unlock deck."""
     uid = request.android_uid
@@ -3396,7 +6098,7 @@ def api_sync_redeem_invite_code():
 
 
 
-@app.get("/api/admin/users")
+@admin_bp.get("/api/admin/users")
 def api_get_admin_users():
     """
     Get list of admin usernames (Source of Truth).
@@ -3410,7 +6112,7 @@ def api_get_admin_users():
 
 from flask import request, jsonify
 
-@app.get("/api/admin/user/deck_access")
+@admin_bp.get("/api/admin/user/deck_access")
 def api_admin_user_deck_access_get():
     """
     UI calls: /api/admin/user/deck_access?user_id=XXXX
@@ -3462,7 +6164,8 @@ def api_admin_user_deck_access_get():
         "grantedAdminDecks": granted_admin
     })
 
-@app.post("/api/admin/user/deck_access")
+@admin_bp.post("/api/admin/user/deck_access")
+@_json_locked("deck_access")
 def api_admin_user_deck_access_set():
     target_user_id = (request.args.get("user_id") or "").strip()
     if not target_user_id:
@@ -3504,7 +6207,7 @@ def api_admin_user_deck_access_set():
 
 # ============ WEB AI ACCESS ENDPOINTS (session-based) ============
 
-@app.get("/api/web/admin/apikeys")
+@admin_bp.get("/api/web/admin/apikeys")
 def web_admin_get_apikeys():
     """Get API keys for web admin page (session auth)."""
     uid = current_user_id()
@@ -3526,7 +6229,8 @@ def web_admin_get_apikeys():
     })
 
 
-@app.post("/api/web/admin/apikeys")
+@admin_bp.post("/api/web/admin/apikeys")
+@_json_locked("api_keys")
 def web_admin_save_apikeys():
     """Save API keys from web admin page (session auth)."""
     uid = current_user_id()
@@ -3595,8 +6299,7 @@ def _load_deck_config() -> Dict[str, Any]:
             "builtInDecks": ["kenpo"]          # List of built-in deck IDs
         }
     try:
-        with open(DECK_CONFIG_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _load_json_file(DECK_CONFIG_PATH)
     except Exception:
         return {"newUsersGetBuiltInDecks": True, "allowNonAdminDeckEdits": True, "builtInDecks": ["kenpo"]}
 
@@ -3604,8 +6307,8 @@ def _load_deck_config() -> Dict[str, Any]:
 def _save_deck_config(config: Dict[str, Any]) -> None:
     """Save global deck configuration."""
     os.makedirs(DATA_DIR, exist_ok=True)
-    with open(DECK_CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
+    _save_json_file(DECK_CONFIG_PATH, config)
+    _stats_invalidate()
 
 
 def _load_deck_access() -> Dict[str, Any]:
@@ -3618,8 +6321,7 @@ def _load_deck_access() -> Dict[str, Any]:
             "userBuiltInDisabled": []  # userIds who have built-in decks disabled
         }
     try:
-        with open(DECK_ACCESS_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = _load_json_file(DECK_ACCESS_PATH)
         # Ensure all keys exist
         data.setdefault("inviteCodes", {})
         data.setdefault("userUnlocks", {})
@@ -3633,8 +6335,7 @@ def _load_deck_access() -> Dict[str, Any]:
 def _save_deck_access(data: Dict[str, Any]) -> None:
     """Save deck access data."""
     os.makedirs(DATA_DIR, exist_ok=True)
-    with open(DECK_ACCESS_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    _save_json_file(DECK_ACCESS_PATH, data)
 
 
 def _generate_invite_code() -> str:
@@ -3696,8 +6397,7 @@ def _load_decks(user_id: str = None, include_all: bool = False) -> List[Dict[str
     # Load saved decks from file
     if os.path.exists(DECKS_PATH):
         try:
-            with open(DECKS_PATH, "r", encoding="utf-8") as f:
-                saved_decks = json.load(f)
+            saved_decks = _load_json_file(DECKS_PATH)
             if isinstance(saved_decks, list):
                 all_decks = saved_decks
         except Exception:
@@ -3759,8 +6459,8 @@ def _load_decks(user_id: str = None, include_all: bool = False) -> List[Dict[str
 def _save_decks(decks: List[Dict[str, Any]]) -> None:
     """Save deck definitions."""
     os.makedirs(DATA_DIR, exist_ok=True)
-    with open(DECKS_PATH, "w", encoding="utf-8") as f:
-        json.dump(decks, f, ensure_ascii=False, indent=2)
+    _save_json_file(DECKS_PATH, decks)
+    _stats_invalidate()
 
 
 def _user_cards_path(user_id: str) -> str:
@@ -3776,8 +6476,7 @@ def _load_user_cards(user_id: str) -> List[Dict[str, Any]]:
     if not os.path.exists(path):
         return []
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            cards = json.load(f)
+        cards = _load_json_file(path)
         return cards if isinstance(cards, list) else []
     except Exception:
         return []
@@ -3787,8 +6486,7 @@ def _save_user_cards(user_id: str, cards: List[Dict[str, Any]]) -> None:
     """Save user-created cards."""
     path = _user_cards_path(user_id)
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(cards, f, ensure_ascii=False, indent=2)
+    _save_json_file(path, cards)
 
 
 
@@ -3809,8 +6507,7 @@ def _load_deck_cards(deck_id: str) -> List[Dict[str, Any]]:
     if not os.path.exists(path):
         return []
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            cards = json.load(f)
+        cards = _load_json_file(path)
         return cards if isinstance(cards, list) else []
     except Exception:
         return []
@@ -3819,8 +6516,7 @@ def _load_deck_cards(deck_id: str) -> List[Dict[str, Any]]:
 def _save_deck_cards(deck_id: str, cards: List[Dict[str, Any]]) -> None:
     path = _deck_cards_path(deck_id)
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(cards, f, ensure_ascii=False, indent=2)
+    _save_json_file(path, cards)
 
 
 def _get_deck_by_id(deck_id: str) -> Optional[Dict[str, Any]]:
@@ -3909,40 +6605,46 @@ def _migrate_user_deck_cards(user_id: str) -> None:
     """One-way migration: move non-kenpo cards from per-user storage to per-deck storage for decks owned by user."""
     try:
         cards = _load_user_cards(user_id)
-        if not cards:
+        if all(str(c.get("deckId", "kenpo")).strip() in ("", "kenpo") for c in cards):
             return
-
-        keep = []
-        moved_by_deck: Dict[str, List[Dict[str, Any]]] = {}
-        for c in cards:
-            did = str(c.get("deckId", "kenpo")).strip() or "kenpo"
-            if did == "kenpo":
-                keep.append(c)
-                continue
-
-            deck = _get_deck_by_id(did)
-            if _deck_owner_id(deck) == user_id:
-                moved_by_deck.setdefault(did, []).append(c)
-            else:
-                # If deck isn't owned by this user, keep it in per-user file to avoid data loss.
-                keep.append(c)
-
-        # Merge into deck files
-        for did, moved in moved_by_deck.items():
-            existing = _load_deck_cards(did)
-            existing_ids = set(str(x.get("id")) for x in existing)
-            for c in moved:
-                if str(c.get("id")) not in existing_ids:
-                    existing.append(c)
-            _save_deck_cards(did, existing)
-
-        if len(keep) != len(cards):
-            _save_user_cards(user_id, keep)
+        with _json_txn(_user_cards_path(user_id), DECK_CARDS_DIR):
+            _move_user_deck_cards(user_id)
     except Exception:
         # Don't block app operation on migration issues
         return
 
 
+def _move_user_deck_cards(user_id: str) -> None:
+    """Body of _migrate_user_deck_cards; the caller holds the card files' txn locks."""
+    cards = _load_user_cards(user_id)
+    keep = []
+    moved_by_deck: Dict[str, List[Dict[str, Any]]] = {}
+    for c in cards:
+        did = str(c.get("deckId", "kenpo")).strip() or "kenpo"
+        if did == "kenpo":
+            keep.append(c)
+            continue
+
+        deck = _get_deck_by_id(did)
+        if _deck_owner_id(deck) == user_id:
+            moved_by_deck.setdefault(did, []).append(c)
+        else:
+            # If deck isn't owned by this user, keep it in per-user file to avoid data loss.
+            keep.append(c)
+
+    # Merge into deck files
+    for did, moved in moved_by_deck.items():
+        existing = _load_deck_cards(did)
+        existing_ids = set(str(x.get("id")) for x in existing)
+        for c in moved:
+            if str(c.get("id")) not in existing_ids:
+                existing.append(c)
+        _save_deck_cards(did, existing)
+
+    if len(keep) != len(cards):
+        _save_user_cards(user_id, keep)
+
+
 def _owned_decks_for_user(user_id: str) -> List[Dict[str, Any]]:
     decks = _load_decks(include_all=True)
     out = []
@@ -3978,7 +6680,7 @@ def _generate_card_id() -> str:
     return uuid.uuid4().hex[:16]
 
 
-@app.get("/api/decks")
+@decks_bp.get("/api/decks")
 def api_get_decks():
     """Get all available decks for the current user."""
     uid = current_user_id()
@@ -4004,7 +6706,8 @@ def api_get_decks():
     return jsonify(decks)
 
 
-@app.post("/api/decks")
+@decks_bp.post("/api/decks")
+@_json_locked("decks")
 def api_create_deck():
     """Create a new user deck."""
     uid = current_user_id()
@@ -4052,7 +6755,8 @@ def api_create_deck():
     return jsonify(new_deck)
 
 
-@app.post("/api/decks/<deck_id>")
+@decks_bp.post("/api/decks/<deck_id>")
+@_json_locked("decks")
 def api_update_deck(deck_id: str):
     """Update a user-created deck."""
     uid = current_user_id()
@@ -4118,7 +6822,8 @@ def api_update_deck(deck_id: str):
 
 
 
-@app.post("/api/decks/<deck_id>/upload_logo")
+@decks_bp.post("/api/decks/<deck_id>/upload_logo")
+@_json_locked("decks")
 def api_upload_deck_logo(deck_id: str):
     """Upload / set a deck logo image for a user-created deck.
 
@@ -4176,7 +6881,8 @@ def api_upload_deck_logo(deck_id: str):
     return jsonify({"success": True, "deckId": deck_id, "logoPath": url_path})
 
 
-@app.delete("/api/decks/<deck_id>")
+@decks_bp.delete("/api/decks/<deck_id>")
+@_json_locked("decks", "deck_access", "user_cards", "deck_cards")
 def api_delete_deck(deck_id: str):
     """Delete a user-created deck."""
     uid = current_user_id()
@@ -4244,7 +6950,8 @@ def api_delete_deck(deck_id: str):
     return jsonify({"success": True, "deleted": deck_id})
 
 
-@app.post("/api/decks/<deck_id>/set_default")
+@decks_bp.post("/api/decks/<deck_id>/set_default")
+@_json_locked("decks", "progress")
 def api_set_default_deck(deck_id: str):
     """Set a deck as the default startup deck."""
     uid = current_user_id()
@@ -4282,7 +6989,7 @@ def api_set_default_deck(deck_id: str):
     return jsonify({"success": True, "defaultDeckId": deck_id})
 
 
-@app.get("/api/user_cards")
+@decks_bp.get("/api/user_cards")
 def api_get_user_cards():
     """Get user-editable cards.
 
@@ -4327,7 +7034,8 @@ def api_get_user_cards():
     return jsonify(out)
 
 
-@app.post("/api/user_cards")
+@decks_bp.post("/api/user_cards")
+@_json_locked("user_cards", "deck_cards")
 def api_add_user_card():
     """Add a new user-created card."""
     uid = current_user_id()
@@ -4386,7 +7094,8 @@ def api_add_user_card():
     return jsonify(new_card)
 
 
-@app.put("/api/user_cards/<card_id>")
+@decks_bp.put("/api/user_cards/<card_id>")
+@_json_locked("user_cards", "deck_cards")
 def api_update_user_card(card_id: str):
     """Update a user-editable card (kenpo personal or owned deck cards)."""
     uid = current_user_id()
@@ -4457,7 +7166,8 @@ def api_update_user_card(card_id: str):
     return jsonify(card)
 
 
-@app.delete("/api/user_cards/<card_id>")
+@decks_bp.delete("/api/user_cards/<card_id>")
+@_json_locked("user_cards", "deck_cards")
 def api_delete_user_card(card_id: str):
     """Delete a user-editable card (kenpo personal or owned deck cards)."""
     uid = current_user_id()
@@ -4479,7 +7189,7 @@ def api_delete_user_card(card_id: str):
     return jsonify({"success": True, "deleted": card_id})
 
 
-@app.post("/api/ai/generate_definition")
+@ai_bp.post("/api/ai/generate_definition")
 def api_ai_generate_definition():
     """Generate definition options using AI."""
     uid = current_user_id()
@@ -4530,7 +7240,7 @@ Do NOT include explanations or full sentences."""
         return jsonify({"error": str(e)}), 500
 
 
-@app.post("/api/ai/generate_pronunciation")
+@ai_bp.post("/api/ai/generate_pronunciation")
 def api_ai_generate_pronunciation():
     """Generate pronunciation using AI."""
     uid = current_user_id()
@@ -4561,7 +7271,7 @@ Return ONLY the pronunciation guide, nothing else. Example: tay-kwon-doh"""
         return jsonify({"error": str(e)}), 500
 
 
-@app.post("/api/ai/generate_group")
+@ai_bp.post("/api/ai/generate_group")
 def api_ai_generate_group():
     """Generate group suggestions using AI."""
     uid = current_user_id()
@@ -4603,7 +7313,175 @@ Prefer existing groups if they fit. Return ONLY a JSON array with 3 strings. Exa
         return jsonify({"error": str(e)}), 500
 
 
-@app.post("/api/ai/generate_deck")
+# ============ AI BATCH ENRICHMENT (definition + pronunciation + group) ============
+
+# Terms per LLM call and max concurrent calls for /api/ai/enrich_cards
+AI_ENRICH_BATCH_SIZE = max(1, _safe_int(os.environ.get("KENPO_AI_ENRICH_BATCH"), 25))
+AI_ENRICH_MAX_PARALLEL = max(1, _safe_int(os.environ.get("KENPO_AI_ENRICH_PARALLEL"), 4))
+AI_ENRICH_MAX_TERMS = 500
+AI_ENRICH_CACHE_MAX = 5000
+
+# LRU cache: key -> {"definitions": [...], "pronunciation": "...", "groups": [...]}
+_ai_enrich_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_ai_enrich_lock = threading.Lock()
+
+
+def _ai_enrich_cache_key(term: str, meaning: str, context: str, groups_str: str) -> str:
+    model = OPENAI_MODEL if OPENAI_API_KEY else GEMINI_MODEL
+    base = f"{model}||{term.lower()}||{meaning.lower()}||{context}||{groups_str}".encode("utf-8")
+    return hashlib.sha1(base).hexdigest()
+
+
+def _ai_enrich_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    with _ai_enrich_lock:
+        hit = _ai_enrich_cache.get(key)
+        if hit is not None:
+            _ai_enrich_cache.move_to_end(key)
+        return hit
+
+
+def _ai_enrich_cache_put(key: str, value: Dict[str, Any]) -> None:
+    with _ai_enrich_lock:
+        _ai_enrich_cache[key] = value
+        _ai_enrich_cache.move_to_end(key)
+        while len(_ai_enrich_cache) > AI_ENRICH_CACHE_MAX:
+            _ai_enrich_cache.popitem(last=False)
+
+
+def _str_list(value: Any, limit: int = 3) -> List[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [str(v).strip() for v in value if str(v).strip()][:limit]
+
+
+def _ai_enrich_batch(items: List[Dict[str, str]], context: str, groups_str: str) -> Dict[str, Dict[str, Any]]:
+    """One LLM call for a batch of terms. Returns {term_lower: {definitions, pronunciation, groups}}."""
+    lines = []
+    for it in items:
+        if it["meaning"]:
+            lines.append(f"- {it['term']} (meaning: {it['meaning']})")
+        else:
+            lines.append(f"- {it['term']}")
+
+    prompt = f"""For each vocabulary term below (flashcards in the context of {context}), provide:
+- definitions: 3 SHORT, LITERAL translation/definition options (1-5 words each; English translation for foreign words)
+- pronunciation: English phonetic guide with hyphen-separated syllables (e.g., tay-kwon-doh)
+- groups: 3 category/group names. Existing groups in the deck: {groups_str}. Prefer existing groups if they fit.
+
+Terms:
+{chr(10).join(lines)}
+
+Respond ONLY with valid JSON, no markdown or explanation, one item per term, with "term" copied exactly:
+{{"items": [{{"term": "Hola", "definitions": ["Hello", "Hi", "Greetings"], "pronunciation": "oh-lah", "groups": ["Greetings", "Basics", "Phrases"]}}]}}"""
+
+    obj = _extract_json_object(_call_ai_chat(prompt)) or {}
+    out: Dict[str, Dict[str, Any]] = {}
+    for row in obj.get("items") or []:
+        if not isinstance(row, dict):
+            continue
+        term = str(row.get("term") or "").strip()
+        if not term:
+            continue
+        out[term.lower()] = {
+            "definitions": _str_list(row.get("definitions")),
+            "pronunciation": str(row.get("pronunciation") or "").strip(),
+            "groups": _str_list(row.get("groups")),
+        }
+    return out
+
+
+@ai_bp.post("/api/ai/enrich_cards")
+def api_ai_enrich_cards():
+    """Generate definition options, pronunciation and group suggestions for many terms at once.
+
+    Expects JSON: {"terms": ["Hola", {"term": "Adiós", "meaning": "Goodbye"}, ...],
+                   "deckName": "...", "deckDescription": "...", "existingGroups": [...]}
+    Returns: {"results": [{"term", "definitions", "pronunciation", "groups"}], "calls": n, "cached": n}
+
+    Terms are sent AI_ENRICH_BATCH_SIZE at a time in a single prompt each, and
+    results are cached so repeat lookups (or re-imports) cost no LLM calls.
+    """
+    uid = current_user_id()
+    if not uid:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    if not OPENAI_API_KEY and not GEMINI_API_KEY:
+        return jsonify({"error": "No AI provider configured"}), 400
+    
+    data = request.get_json() or {}
+    raw_terms = data.get("terms", [])
+    if not isinstance(raw_terms, list) or not raw_terms:
+        return jsonify({"error": "terms[] required"}), 400
+    if len(raw_terms) > AI_ENRICH_MAX_TERMS:
+        return jsonify({"error": f"Too many terms (max {AI_ENRICH_MAX_TERMS})"}), 400
+    
+    deck_name = str(data.get("deckName", "")).strip() or "General vocabulary"
+    deck_desc = str(data.get("deckDescription", "")).strip()
+    context = f"{deck_name} ({deck_desc})" if deck_desc else deck_name
+    existing_groups = data.get("existingGroups", [])
+    groups_str = ", ".join(_str_list(existing_groups, 20)) or "None yet"
+    
+    items: List[Dict[str, str]] = []
+    for t in raw_terms:
+        if isinstance(t, dict):
+            term = str(t.get("term", "")).strip()
+            meaning = str(t.get("meaning", "")).strip()
+        else:
+            term, meaning = str(t or "").strip(), ""
+        if term:
+            items.append({"term": term, "meaning": meaning})
+    if not items:
+        return jsonify({"error": "terms[] required"}), 400
+    
+    results: Dict[str, Dict[str, Any]] = {}
+    pending: List[Dict[str, str]] = []
+    seen = set()
+    for it in items:
+        key = _ai_enrich_cache_key(it["term"], it["meaning"], context, groups_str)
+        it["key"] = key
+        hit = _ai_enrich_cache_get(key)
+        if hit is not None:
+            results[key] = hit
+        elif key not in seen:
+            seen.add(key)
+            pending.append(it)
+    cached = len(items) - len(pending)
+    
+    batches = [pending[i:i + AI_ENRICH_BATCH_SIZE] for i in range(0, len(pending), AI_ENRICH_BATCH_SIZE)]
+    errors = []
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(AI_ENRICH_MAX_PARALLEL, len(batches))) as pool:
+            futures = [(batch, pool.submit(_ai_enrich_batch, batch, context, groups_str)) for batch in batches]
+            for batch, fut in futures:
+                try:
+                    by_term = fut.result()
+                except Exception as e:
+                    errors.append(str(e))
+                    continue
+                for it in batch:
+                    row = by_term.get(it["term"].lower())
+                    if row:
+                        _ai_enrich_cache_put(it["key"], row)
+                        results[it["key"]] = row
+    
+    if errors and not results:
+        return jsonify({"error": errors[0]}), 500
+    
+    out = []
+    for it in items:
+        row = results.get(it["key"]) or {"definitions": [], "pronunciation": "", "groups": []}
+        out.append({"term": it["term"], **row})
+    
+    print(f"[AI ENRICH] {len(items)} terms, {cached} cached, {len(batches)} call(s)")
+    resp = {"results": out, "calls": len(batches), "cached": cached}
+    if errors:
+        resp["errors"] = errors
+    return jsonify(resp)
+
+
+@ai_bp.post("/api/ai/generate_deck")
 def api_ai_generate_deck():
     """Generate flashcard deck from keywords, photo, or document using AI."""
     uid = current_user_id()
@@ -4654,9 +7532,100 @@ def api_ai_generate_deck():
         return jsonify({"error": str(e)}), 500
 
 
-def _ai_generate_from_keywords(keywords: str, max_cards: int) -> list:
-    """Generate flashcards from search keywords."""
-    prompt = f"""Generate exactly {max_cards} vocabulary flashcards about: {keywords}
+@ai_bp.post("/api/ai/generate_deck/stream")
+def api_ai_generate_deck_stream():
+    """Streaming variant of /api/ai/generate_deck.
+
+    Responds with newline-delimited JSON so the UI can render each card as soon
+    as the model finishes writing it:
+      {"card": {...}}            one line per card
+      {"done": true, "count": n} final line
+      {"error": "..."}           on failure (after any cards already sent)
+
+    Keywords and plain-text documents stream from the provider; photo and PDF
+    requests use the vision call and emit all cards when it returns.
+    """
+    uid = current_user_id()
+    if not uid:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    if not OPENAI_API_KEY and not GEMINI_API_KEY:
+        return jsonify({"error": "No AI provider configured"}), 400
+    
+    data = request.get_json() or {}
+    gen_type = data.get("type", "keywords")
+    max_cards = min(int(data.get("maxCards", 20)), 200)
+    
+    prompt = None
+    buffered = None
+    if gen_type == "keywords":
+        keywords = str(data.get("keywords", "")).strip()
+        if not keywords:
+            return jsonify({"error": "Keywords required"}), 400
+        prompt = _keywords_deck_prompt(keywords, max_cards)
+    elif gen_type == "document":
+        doc = data.get("document", {})
+        if not doc.get("content"):
+            return jsonify({"error": "Document content required"}), 400
+        content = doc.get("content", "")
+        if doc.get("type", "text/plain") == "application/pdf" and content.startswith("data:"):
+            buffered = lambda: _ai_generate_from_document(doc, max_cards)
+        else:
+            prompt = _document_deck_prompt(content, max_cards)
+    elif gen_type == "photo":
+        image_data = data.get("imageData", "")
+        if not image_data:
+            return jsonify({"error": "Image data required"}), 400
+        buffered = lambda: _ai_generate_from_image(image_data, max_cards)
+    else:
+        return jsonify({"error": "Invalid generation type"}), 400
+
+    def _line(obj: Dict[str, Any]) -> str:
+        return json.dumps(obj, ensure_ascii=False) + "\n"
+
+    def generate():
+        started = time.time()
+        count = 0
+        try:
+            if buffered is not None:
+                for card in buffered():
+                    count += 1
+                    yield _line({"card": card})
+            else:
+                scanner = _CardStreamScanner()
+                first_at = None
+                for chunk in _stream_ai_chat(prompt):
+                    for card in scanner.feed(chunk):
+                        if first_at is None:
+                            first_at = time.time()
+                        count += 1
+                        yield _line({"card": card})
+                        if count >= max_cards:
+                            break
+                    if count >= max_cards:
+                        break
+                if scanner.emitted == 0:
+                    # Model ignored the expected shape; fall back to the tolerant parser.
+                    for card in _parse_ai_cards_response(scanner.text)[:max_cards]:
+                        count += 1
+                        yield _line({"card": card})
+                if first_at is not None:
+                    print(f"[AI GEN] stream first card after {first_at - started:.2f}s")
+            print(f"[AI GEN] streamed {count} cards ({gen_type}) in {time.time() - started:.2f}s")
+            yield _line({"done": True, "count": count})
+        except Exception as e:
+            print(f"[AI GEN ERROR] stream: {e}")
+            yield _line({"error": str(e), "count": count})
+
+    resp = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+def _keywords_deck_prompt(keywords: str, max_cards: int) -> str:
+    """Prompt used to generate a deck from search keywords."""
+    return f"""Generate exactly {max_cards} vocabulary flashcards about: {keywords}
 
 IMPORTANT: For foreign language vocabulary, definitions should be SHORT LITERAL TRANSLATIONS.
 Example for Spanish: "Hola" -> definition: "Hello" (NOT a long explanation)
@@ -4672,16 +7641,135 @@ Respond ONLY with valid JSON, no markdown or explanation:
     {{"term": "Hola", "definition": "Hello", "pronunciation": "oh-lah", "group": "Greetings"}},
     {{"term": "Adiós", "definition": "Goodbye", "pronunciation": "ah-dee-ohs", "group": "Greetings"}}
 ]}}"""
+
+
+def _document_deck_prompt(content: str, max_cards: int) -> str:
+    """Prompt used to generate a deck from plain-text document content."""
+    # Truncate if too long
+    if len(content) > 15000:
+        content = content[:15000] + "...[truncated]"
     
-    return _parse_ai_cards_response(_call_ai_chat(prompt))
+    return f"""Analyze this document and create up to {max_cards} educational flashcards from its content:
+
+---DOCUMENT START---
+{content}
+---DOCUMENT END---
+
+For each key term/concept found, create a flashcard with:
+- term: the word or concept
+- definition: clear explanation based on the document
+- pronunciation: phonetic guide if applicable, or empty string
+- group: category for organization
+
+Respond ONLY with valid JSON:
+{{"cards": [{{"term": "Term", "definition": "Definition", "pronunciation": "", "group": "Category"}}]}}"""
+
+
+def _ai_generate_from_keywords(keywords: str, max_cards: int) -> list:
+    """Generate flashcards from search keywords."""
+    return _parse_ai_cards_response(_call_ai_chat(_keywords_deck_prompt(keywords, max_cards)))
+
+
+# ============ VISION IMAGE PIPELINE ============
+# Photos from phones are often 3-12 MB. Vision models tile/downsample them
+# anyway, so decode once, fit to the provider's useful resolution, re-encode as
+# JPEG and cache the result by content hash (repeat "Generate" clicks reuse it).
+# Pillow is optional; without it the image is forwarded unchanged.
+VISION_IMAGE_LIMITS = {
+    # provider: (max long side, max short side)
+    "openai": (2048, 768),   # high-detail: fit 2048x2048, then shortest side 768
+    "gemini": (1536, 768),
+}
+VISION_JPEG_QUALITY = min(95, max(40, _safe_int(os.environ.get("KENPO_VISION_JPEG_QUALITY"), 85)))
+VISION_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+_vision_cache: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+_vision_cache_bytes = 0
+_vision_lock = threading.Lock()
+_vision_pillow_warned = False
+
+
+def _split_data_url(data: str) -> Tuple[str, str]:
+    """Return (mime_type, base64_payload) for a data URL or bare base64 string."""
+    data = (data or "").strip()
+    if data.startswith("data:") and "," in data:
+        header, payload = data.split(",", 1)
+        mime = header[5:].split(";", 1)[0].strip().lower() or "image/jpeg"
+        return mime, payload
+    return "image/jpeg", data
+
+
+def _downscale_image(raw: bytes, provider: str) -> Optional[Tuple[bytes, str]]:
+    """Resize/re-encode with Pillow. Returns None if Pillow is missing or decoding fails."""
+    global _vision_pillow_warned
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        if not _vision_pillow_warned:
+            _vision_pillow_warned = True
+            print("[AI] Pillow not installed; photos are sent to the vision API at full size (pip install Pillow)")
+        return None
+
+    import io
+    try:
+        img = Image.open(io.BytesIO(raw))
+        img = ImageOps.exif_transpose(img)
+        max_long, max_short = VISION_IMAGE_LIMITS.get(provider, VISION_IMAGE_LIMITS["openai"])
+        w, h = img.size
+        scale = min(1.0, max_long / float(max(w, h)), max_short / float(min(w, h)))
+        if scale < 1.0:
+            img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            # Flatten transparency onto white so labels on PNG screenshots stay readable.
+            rgba = img.convert("RGBA")
+            bg = Image.new("RGB", rgba.size, (255, 255, 255))
+            bg.paste(rgba, mask=rgba.split()[-1])
+            img = bg
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        return out.getvalue(), "image/jpeg"
+    except Exception as e:
+        print(f"[AI] image downscale failed ({e.__class__.__name__}); sending original")
+        return None
+
+
+def _prepare_vision_image(image_data: str, provider: str) -> Tuple[str, str]:
+    """Decode once, downscale for ``provider`` and re-encode. Returns (base64, mime)."""
+    global _vision_cache_bytes
+    import base64
+
+    mime, payload = _split_data_url(image_data)
+    try:
+        raw = base64.b64decode(payload, validate=False)
+    except Exception:
+        return payload, mime
+    key = hashlib.sha256(raw).hexdigest() + ":" + provider
+    with _vision_lock:
+        hit = _vision_cache.get(key)
+        if hit is not None:
+            _vision_cache.move_to_end(key)
+            return hit
+
+    prepared = _downscale_image(raw, provider)
+    if prepared and (len(prepared[0]) < len(raw) or mime not in ("image/jpeg", "image/png", "image/webp", "image/gif")):
+        b64, mime = base64.b64encode(prepared[0]).decode("ascii"), prepared[1]
+        print(f"[AI] image {len(raw) // 1024} KB -> {len(prepared[0]) // 1024} KB for {provider}")
+    else:
+        b64 = payload
+    del raw, prepared
+
+    with _vision_lock:
+        if key not in _vision_cache:
+            _vision_cache[key] = (b64, mime)
+            _vision_cache_bytes += len(b64)
+            while _vision_cache_bytes > VISION_CACHE_MAX_BYTES and len(_vision_cache) > 1:
+                _, (old_b64, _) = _vision_cache.popitem(last=False)
+                _vision_cache_bytes -= len(old_b64)
+    return b64, mime
 
 
 def _ai_generate_from_image(image_data: str, max_cards: int) -> list:
     """Generate flashcards from image using vision API."""
-    # Extract base64 data if it's a data URL
-    if "," in image_data:
-        image_data = image_data.split(",", 1)[1]
-    
     prompt = f"""Analyze this image and extract educational content to create up to {max_cards} flashcards.
 Look for: vocabulary terms, definitions, concepts, diagrams with labels, or any study material.
 
@@ -4696,11 +7784,13 @@ Respond ONLY with valid JSON, no markdown:
     {{"term": "Term", "definition": "Definition", "pronunciation": "", "group": "Category"}}
 ]}}"""
     
-    # Use vision-capable model
+    # Use vision-capable model (image is downscaled for the provider that will see it)
     if OPENAI_API_KEY:
-        result = _call_openai_vision(prompt, image_data)
+        b64, mime = _prepare_vision_image(image_data, "openai")
+        result = _call_openai_vision(prompt, b64, mime)
     elif GEMINI_API_KEY:
-        result = _call_gemini_vision(prompt, image_data)
+        b64, mime = _prepare_vision_image(image_data, "gemini")
+        result = _call_gemini_vision(prompt, b64, mime)
     else:
         return []
     
@@ -4739,34 +7829,42 @@ Respond ONLY with valid JSON:
         return _parse_ai_cards_response(result)
     
     # For text content, use regular chat
-    # Truncate if too long
-    if len(content) > 15000:
-        content = content[:15000] + "...[truncated]"
-    
-    prompt = f"""Analyze this document and create up to {max_cards} educational flashcards from its content:
-
----DOCUMENT START---
-{content}
----DOCUMENT END---
+    return _parse_ai_cards_response(_call_ai_chat(_document_deck_prompt(content, max_cards)))
 
-For each key term/concept found, create a flashcard with:
-- term: the word or concept
-- definition: clear explanation based on the document
-- pronunciation: phonetic guide if applicable, or empty string
-- group: category for organization
 
-Respond ONLY with valid JSON:
-{{"cards": [{{"term": "Term", "definition": "Definition", "pronunciation": "", "group": "Category"}}]}}"""
-    
-    return _parse_ai_cards_response(_call_ai_chat(prompt))
+def _call_ai_chat(prompt: str) -> str:
+    """Call the configured AI chat API (OpenAI first), failing over past open circuits."""
+    configured = [p for p in AI_PROVIDERS if _ai_provider_configured(p)]
+    if not configured:
+        raise Exception("No AI provider configured")
+    ready = [p for p in configured if _ai_provider_health[p].available()]
+    forced = not ready  # every circuit open: still try the first provider
+    last_exc: Optional[Exception] = None
+    for name in ready or configured[:1]:
+        if not _ai_provider_health[name].begin() and not forced:
+            last_exc = Exception(f"{name} temporarily skipped after repeated failures (circuit open)")
+            continue
+        t0 = time.perf_counter()
+        try:
+            if name == "openai":
+                text = _call_openai_chat(prompt, OPENAI_MODEL, OPENAI_API_KEY)
+            else:
+                text = _call_gemini_chat(prompt, GEMINI_MODEL, GEMINI_API_KEY)
+        except Exception as e:
+            _ai_provider_health[name].record(False, (time.perf_counter() - t0) * 1000.0, str(e))
+            last_exc = e
+            continue
+        _ai_provider_health[name].record(True, (time.perf_counter() - t0) * 1000.0)
+        return text
+    raise last_exc or Exception("No AI provider configured")
 
 
-def _call_ai_chat(prompt: str) -> str:
-    """Call the configured AI chat API."""
+def _stream_ai_chat(prompt: str):
+    """Streaming counterpart of _call_ai_chat (yields text deltas)."""
     if OPENAI_API_KEY:
-        return _call_openai_chat(prompt, OPENAI_MODEL, OPENAI_API_KEY)
+        return _stream_openai_chat(prompt, OPENAI_MODEL, OPENAI_API_KEY)
     elif GEMINI_API_KEY:
-        return _call_gemini_chat(prompt, GEMINI_MODEL, GEMINI_API_KEY)
+        return _stream_gemini_chat(prompt, GEMINI_MODEL, GEMINI_API_KEY)
     else:
         raise Exception("No AI provider configured")
 
@@ -4776,8 +7874,8 @@ def _call_openai_vision(prompt: str, image_data: str, media_type: str = "image/j
     url = f"{OPENAI_API_BASE}/v1/chat/completions"
     
     # Determine the correct media type prefix
-    if media_type == "application/pdf":
-        data_url = f"data:application/pdf;base64,{image_data}"
+    if media_type == "application/pdf" or media_type.startswith("image/"):
+        data_url = f"data:{media_type};base64,{image_data}"
     else:
         data_url = f"data:image/jpeg;base64,{image_data}"
     
@@ -4794,7 +7892,7 @@ def _call_openai_vision(prompt: str, image_data: str, media_type: str = "image/j
         "temperature": 0.7
     }
     
-    r = requests.post(
+    r = _ai_post(
         url,
         headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
         json=payload,
@@ -4827,7 +7925,7 @@ def _call_gemini_vision(prompt: str, image_data: str, media_type: str = "image/j
         }
     }
     
-    r = requests.post(
+    r = _ai_post(
         url,
         headers={"Content-Type": "application/json", "x-goog-api-key": GEMINI_API_KEY},
         json=payload,
@@ -4900,50 +7998,283 @@ def _parse_ai_cards_response(response: str) -> list:
     # Validate and normalize cards
     valid_cards = []
     for card in cards:
-        if isinstance(card, dict) and card.get("term") and card.get("definition"):
-            valid_cards.append({
-                "term": str(card.get("term", "")).strip(),
-                "definition": str(card.get("definition", "")).strip(),
-                "pronunciation": str(card.get("pronunciation", "")).strip(),
-                "group": str(card.get("group", "General")).strip() or "General"
-            })
+        norm = _normalize_ai_card(card)
+        if norm:
+            valid_cards.append(norm)
     
     return valid_cards
 
 
+def _normalize_ai_card(card: Any) -> Optional[Dict[str, str]]:
+    """Validate one model-produced card; returns None if term/definition is missing."""
+    if isinstance(card, dict) and card.get("term") and card.get("definition"):
+        return {
+            "term": str(card.get("term", "")).strip(),
+            "definition": str(card.get("definition", "")).strip(),
+            "pronunciation": str(card.get("pronunciation", "")).strip(),
+            "group": str(card.get("group", "General")).strip() or "General"
+        }
+    return None
+
+
+class _CardStreamScanner:
+    """Incremental JSON object scanner for streamed deck-generation output.
+
+    Feed text chunks as they arrive from the provider; each feed() returns the
+    cards whose closing brace has been seen inside the "cards" array (or a bare
+    top-level array). Uses the same string/escape-aware brace matching as
+    _extract_json_object, but keeps its state between chunks.
+    """
+
+    _CARDS_KEY_RE = re.compile(r'"cards"\s*:\s*\[')
+
+    def __init__(self):
+        self.text = ""          # full response, kept for the non-streaming fallback parse
+        self.emitted = 0
+        self._buf = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._obj_start = -1
+
+    def _find_array_start(self) -> int:
+        m = self._CARDS_KEY_RE.search(self._buf)
+        if m:
+            return m.end()
+        # Bare array response: "[" before any "{"
+        lb = self._buf.find("[")
+        lc = self._buf.find("{")
+        if lb != -1 and (lc == -1 or lb < lc):
+            return lb + 1
+        return -1
+
+    def feed(self, chunk: str) -> List[Dict[str, str]]:
+        if not chunk:
+            return []
+        self.text += chunk
+        if self._done:
+            return []
+        self._buf += chunk
+
+        if not self._in_array:
+            start = self._find_array_start()
+            if start == -1:
+                return []
+            self._in_array = True
+            self._pos = start
+
+        out: List[Dict[str, str]] = []
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start >= 0:
+                    try:
+                        card = _normalize_ai_card(json.loads(buf[self._obj_start:i + 1]))
+                    except Exception:
+                        card = None
+                    if card:
+                        out.append(card)
+                    self._obj_start = -1
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+                i += 1
+                break
+            i += 1
+
+        # Drop consumed text so the buffer only holds the object in progress.
+        keep_from = self._obj_start if self._obj_start >= 0 else i
+        self._buf = buf[keep_from:]
+        self._pos = i - keep_from
+        if self._obj_start >= 0:
+            self._obj_start = 0
+
+        self.emitted += len(out)
+        return out
+
+
+# ============ STATIC ASSETS ============
+# app.js, styles.css and the HTML pages are served from memory, pre-compressed
+# (gzip, plus brotli when the optional `brotli` package is installed) and picked
+# per request from Accept-Encoding. app.js/styles.css also get content-hashed
+# names (app.<sha>.js) that the pages are rewritten to use; those URLs are
+# cached by browsers as immutable, while pages and the plain names revalidate
+# with an ETag. The bundle is built on first use and rebuilt when a source file
+# changes on disk. KENPO_STATIC_PIPELINE=0 serves the files as-is.
+STATIC_PIPELINE = (os.environ.get("KENPO_STATIC_PIPELINE", "1") or "1").strip().lower() not in ("0", "false", "no", "off")
+STATIC_DIR = os.path.join(APP_DIR, "static")
+STATIC_PAGES = ("index.html", "admin.html", "about.html", "user-guide.html", "ai-access.html")
+STATIC_FINGERPRINTED = ("app.js", "styles.css")
+STATIC_MIN_COMPRESS = 512
+STATIC_CHECK_SECONDS = 2.0
+
+_static_lock = threading.Lock()
+_static_assets: Dict[str, Dict[str, Any]] = {}
+_static_sig: Optional[Tuple] = None
+_static_checked = 0.0
+
+
+def _static_compress(raw: bytes) -> Dict[str, bytes]:
+    """identity/gzip/br bodies for raw; encodings that do not shrink it are left out."""
+    out = {"identity": raw}
+    if len(raw) < STATIC_MIN_COMPRESS:
+        return out
+    import gzip
+    out["gzip"] = gzip.compress(raw, compresslevel=9, mtime=0)
+    try:
+        import brotli
+        out["br"] = brotli.compress(raw, quality=11)
+    except ImportError:
+        pass
+    return {k: v for k, v in out.items() if k == "identity" or len(v) < len(raw)}
+
+
+def _static_entry(name: str, raw: bytes, mtime: float, immutable: bool = False) -> Dict[str, Any]:
+    import mimetypes
+    return {
+        "bodies": _static_compress(raw),
+        "etag": hashlib.sha256(raw).hexdigest()[:20],
+        "mimetype": mimetypes.guess_type(name)[0] or "application/octet-stream",
+        "mtime": mtime,
+        "immutable": immutable,
+    }
+
+
+def _static_signature() -> Tuple:
+    sig = []
+    for name in STATIC_FINGERPRINTED + STATIC_PAGES:
+        try:
+            st = os.stat(os.path.join(STATIC_DIR, name))
+            sig.append((name, st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append((name, None, None))
+    return tuple(sig)
+
+
+def _build_static_assets() -> Dict[str, Dict[str, Any]]:
+    t0 = time.perf_counter()
+    assets: Dict[str, Dict[str, Any]] = {}
+    renames: Dict[str, str] = {}
+    for name in STATIC_FINGERPRINTED:
+        path = os.path.join(STATIC_DIR, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            raw = f.read()
+        mtime = os.path.getmtime(path)
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{hashlib.sha256(raw).hexdigest()[:12]}{ext}"
+        renames[name] = hashed
+        assets[name] = _static_entry(name, raw, mtime)
+        assets[hashed] = dict(assets[name], immutable=True)
+    for name in STATIC_PAGES:
+        path = os.path.join(STATIC_DIR, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        for plain, hashed in renames.items():
+            text = text.replace(f'"/{plain}"', f'"/{hashed}"')
+        assets[name] = _static_entry(name, text.encode("utf-8"), os.path.getmtime(path))
+    raw_total = sum(len(a["bodies"]["identity"]) for n, a in assets.items() if not a["immutable"])
+    best_total = sum(min(len(b) for b in a["bodies"].values()) for n, a in assets.items() if not a["immutable"])
+    print(f"[STATIC] Built {len(assets)} assets ({raw_total // 1024} KB -> {best_total // 1024} KB compressed) "
+          f"in {(time.perf_counter() - t0) * 1000:.0f}ms: " + ", ".join(sorted(renames.values())))
+    return assets
+
+
+def _static_asset(name: str) -> Optional[Dict[str, Any]]:
+    global _static_assets, _static_sig, _static_checked
+    if not STATIC_PIPELINE:
+        return None
+    now = time.monotonic()
+    if _static_sig is None or now - _static_checked > STATIC_CHECK_SECONDS:
+        with _static_lock:
+            if _static_sig is None or now - _static_checked > STATIC_CHECK_SECONDS:
+                sig = _static_signature()
+                if sig != _static_sig:
+                    _static_assets = _build_static_assets()
+                    _static_sig = sig
+                _static_checked = now
+    return _static_assets.get(name)
+
+
+def _send_static(name: str):
+    """Serve a static file through the asset bundle when it is part of it, else from disk."""
+    asset = _static_asset(name)
+    if asset is None:
+        return send_from_directory("static", name)
+    bodies = asset["bodies"]
+    accept = request.accept_encodings
+    enc = "identity"
+    for candidate in ("br", "gzip"):
+        if candidate in bodies and accept.quality(candidate) > 0:
+            enc = candidate
+            break
+    resp = Response(bodies[enc], mimetype=asset["mimetype"])
+    resp.set_etag(asset["etag"] if enc == "identity" else f"{asset['etag']}-{enc}")
+    resp.last_modified = asset["mtime"]
+    resp.vary.add("Accept-Encoding")
+    if enc != "identity":
+        resp.headers["Content-Encoding"] = enc
+    if asset["immutable"]:
+        resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
 # --- Common public files (avoid 404 noise) ---
-@app.get("/favicon.ico")
+@core_bp.get("/favicon.ico")
 def favicon():
     return send_from_directory("static/res/webappicons", "favicon.ico")
 
-@app.get("/robots.txt")
+@core_bp.get("/robots.txt")
 def robots():
     return send_from_directory("static", "robots.txt")
 
-@app.get("/sitemap.xml")
+@core_bp.get("/sitemap.xml")
 def sitemap():
     return send_from_directory("static", "sitemap.xml")
 
 # OPTION A (recommended for your project): put security.txt at static/.well-known/security.txt
-@app.get("/.well-known/security.txt")
+@core_bp.get("/.well-known/security.txt")
 def security_txt():
     return send_from_directory("static/.well-known", "security.txt")
 
-@app.get("/<path:filename>")
+@core_bp.get("/<path:filename>")
 def static_files(filename):
-    return send_from_directory("static", filename)
+    return _send_static(filename)
 
 
 # ============ ANDROID SYNC API ============
 
-@app.get("/api/vocabulary")
+@sync_bp.get("/api/vocabulary")
 def api_get_vocabulary():
     """Get the kenpo vocabulary file (for Android app sync)."""
     # Return the canonical kenpo_words.json from data folder
-    vocab_path = DATA_DIR / "kenpo_words.json"
+    vocab_path = Path(DATA_DIR) / "kenpo_words.json"
     if vocab_path.exists():
-        with open(vocab_path, "r", encoding="utf-8") as f:
-            return jsonify(json.load(f))
+        return jsonify(_load_json_file(vocab_path))
     else:
         # Fallback: load from cards if vocab file doesn't exist
         cards, status = load_cards_cached()
@@ -4962,7 +8293,7 @@ def api_get_vocabulary():
         return jsonify({"error": "Vocabulary not available"}), 500
 
 
-@app.get("/api/sync/decks")
+@sync_bp.get("/api/sync/decks")
 def api_sync_get_decks():
     """Get all decks for Android sync (requires auth)."""
     uid = current_user_id()
@@ -4996,7 +8327,8 @@ def api_sync_get_decks():
     })
 
 
-@app.post("/api/sync/decks")
+@sync_bp.post("/api/sync/decks")
+@_json_locked("decks", "progress")
 def api_sync_push_decks():
     """Push deck changes from Android (requires auth)."""
     uid = current_user_id()
@@ -5060,7 +8392,7 @@ def api_sync_push_decks():
     return jsonify({"success": True, "deckCount": len(existing_decks)})
 
 
-@app.get("/api/sync/user_cards")
+@sync_bp.get("/api/sync/user_cards")
 def api_sync_get_user_cards():
     """Get all user-created cards for Android sync (requires auth)."""
     uid = current_user_id()
@@ -5076,7 +8408,8 @@ def api_sync_get_user_cards():
     return jsonify({"cards": cards})
 
 
-@app.post("/api/sync/user_cards")
+@sync_bp.post("/api/sync/user_cards")
+@_json_locked("user_cards")
 def api_sync_push_user_cards():
     """Push user-created cards from Android (requires auth)."""
     uid = current_user_id()
@@ -5147,7 +8480,8 @@ def api_sync_push_user_cards():
     })
 
 
-@app.delete("/api/sync/user_cards/<card_id>")
+@sync_bp.delete("/api/sync/user_cards/<card_id>")
+@_json_locked("user_cards")
 def api_sync_delete_user_card(card_id: str):
     """Delete a user-created card (for Android sync)."""
     uid = current_user_id()
@@ -5182,7 +8516,308 @@ def _load_api_keys_on_startup():
         print(f"[STARTUP] Loaded encrypted API keys from {API_KEYS_PATH}")
 
 
+# ============ SERVING ============
+# Production mode runs on waitress (pure-Python, Windows friendly): a fixed pool of
+# worker threads, a cap on open connections and idle keep-alive timeouts. The Flask
+# dev server remains available (KENPO_SERVER=werkzeug) and is used automatically when
+# waitress is not installed. Both stop gracefully: on Ctrl+C / SIGTERM / SIGBREAK (or
+# request_server_shutdown() from the tray) the listener stops accepting, /api/health
+# reports "draining", and in-flight requests get KENPO_SHUTDOWN_TIMEOUT seconds to finish.
+
+SERVER_KIND = (os.environ.get("KENPO_SERVER", "auto") or "auto").strip().lower()
+SERVER_HOST = (os.environ.get("KENPO_HOST", "0.0.0.0") or "0.0.0.0").strip()
+SERVER_THREADS = max(1, _safe_int(os.environ.get("KENPO_THREADS", "8"), 8))
+SERVER_CONNECTION_LIMIT = max(1, _safe_int(os.environ.get("KENPO_CONNECTION_LIMIT", "100"), 100))
+SERVER_CHANNEL_TIMEOUT = max(1, _safe_int(os.environ.get("KENPO_CHANNEL_TIMEOUT", "120"), 120))
+SERVER_BACKLOG = max(1, _safe_int(os.environ.get("KENPO_BACKLOG", "1024"), 1024))
+SERVER_SHUTDOWN_TIMEOUT = max(0, _safe_int(os.environ.get("KENPO_SHUTDOWN_TIMEOUT", "15"), 15))
+
+_server_lock = threading.Lock()
+_server_draining = threading.Event()
+_server_drain_skip = threading.Event()
+_server_state: Dict[str, Any] = {"kind": "", "server": None, "inflight": 0, "started": 0.0}
+
+
+class _InflightCounter:
+    """WSGI middleware counting requests until their response iterable is closed (covers streaming)."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        with _server_lock:
+            _server_state["inflight"] += 1
+        try:
+            result = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return _InflightResponse(result, self._done)
+
+    @staticmethod
+    def _done() -> None:
+        with _server_lock:
+            _server_state["inflight"] -= 1
+
+
+class _InflightResponse:
+    def __init__(self, result, on_close):
+        self._result = result
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        return iter(self._result)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._result, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._on_close()
+
+
+
+def _server_status() -> Dict[str, Any]:
+    with _server_lock:
+        return {
+            "kind": _server_state["kind"] or "none",
+            "draining": _server_draining.is_set(),
+            "inflight": _server_state["inflight"],
+            "threads": SERVER_THREADS if _server_state["kind"] == "waitress" else None,
+            "feed_threads": FEED_MAX_STREAMS if _server_state["kind"] == "waitress" else None,
+            "connection_limit": SERVER_CONNECTION_LIMIT if _server_state["kind"] == "waitress" else None,
+            "blueprints": ["core"] + list(app.config.get("KENPO_BLUEPRINTS") or []),
+        }
+
+
+def _stop_listener(kind: str, server: Any) -> None:
+    """Stop accepting new connections; existing ones keep being served."""
+    if kind == "waitress":
+        def _thunk():
+            server.accepting = False
+            try:
+                server.del_channel()
+                server.socket.close()
+            except Exception:
+                pass
+        server.trigger.pull_trigger(_thunk)
+
+
+def _stop_server_loop(kind: str, server: Any) -> None:
+    if kind == "waitress":
+        def _thunk():
+            # asyncore.loop() returns once its socket map is empty
+            for ch in list(server._map.values()):
+                try:
+                    ch.close()
+                except Exception:
+                    pass
+        server.trigger.pull_trigger(_thunk)
+    elif kind == "werkzeug":
+        server.shutdown()
+
+
+def _drain_and_stop(kind: str, server: Any) -> None:
+    deadline = time.time() + SERVER_SHUTDOWN_TIMEOUT
+    while time.time() < deadline and not _server_drain_skip.is_set():
+        with _server_lock:
+            inflight = _server_state["inflight"]
+        if inflight <= 0:
+            break
+        time.sleep(0.05)
+    with _server_lock:
+        left = _server_state["inflight"]
+    if left > 0:
+        print(f"[SERVER] Shutdown timeout: {left} request(s) still running")
+    _stop_server_loop(kind, server)
+
+
+def request_server_shutdown(reason: str = "") -> bool:
+    """Start a graceful shutdown of the server started by run_server() (any thread).
+
+    A second call skips the remaining drain wait. Returns False when no server is running.
+    """
+    with _server_lock:
+        kind, server = _server_state["kind"], _server_state["server"]
+    if server is None:
+        return False
+    if _server_draining.is_set():
+        _server_drain_skip.set()
+        return True
+    _server_draining.set()
+    print(f"[SERVER] Shutting down{' (' + reason + ')' if reason else ''}: "
+          f"no new connections, waiting up to {SERVER_SHUTDOWN_TIMEOUT}s for in-flight requests")
+    _stop_listener(kind, server)
+    threading.Thread(target=_drain_and_stop, args=(kind, server), name="kenpo-drain", daemon=True).start()
+    return True
+
+
+def _install_shutdown_signals() -> None:
+    import signal
+
+    def _handler(signum, _frame):
+        request_server_shutdown(f"signal {signum}")
+
+    for name in ("SIGINT", "SIGTERM", "SIGBREAK"):
+        sig = getattr(signal, name, None)
+        if sig is not None:
+            try:
+                signal.signal(sig, _handler)
+            except (ValueError, OSError):
+                pass
+
+
+def run_server(host: Optional[str] = None, port: Optional[int] = None, install_signals: bool = True) -> None:
+    """Serve the app until request_server_shutdown() (or a signal) finishes draining.
+
+    KENPO_SERVER picks the server: "waitress", "werkzeug" (Flask dev server, threaded)
+    or "auto" (waitress when installed). The tray launcher calls this from a thread
+    with install_signals=False.
+    """
+    host = host or SERVER_HOST
+    port = int(port or PORT)
+    kind = SERVER_KIND
+    waitress_mod = None
+    if kind in ("auto", "waitress"):
+        try:
+            import waitress.server as waitress_mod
+        except ImportError:
+            if kind == "waitress":
+                print("[SERVER] KENPO_SERVER=waitress but waitress is not installed (pip install waitress); using werkzeug")
+            kind = "werkzeug"
+        else:
+            kind = "waitress"
+    elif kind in ("flask", "dev"):
+        kind = "werkzeug"
+    if kind not in ("waitress", "werkzeug"):
+        print(f"[SERVER] Unknown KENPO_SERVER={SERVER_KIND!r}; using werkzeug")
+        kind = "werkzeug"
+
+    _server_draining.clear()
+    _server_drain_skip.clear()
+    if kind == "waitress":
+        server = waitress_mod.create_server(
+            app, host=host, port=port, threads=SERVER_THREADS + FEED_MAX_STREAMS,
+            connection_limit=SERVER_CONNECTION_LIMIT, channel_timeout=SERVER_CHANNEL_TIMEOUT,
+            backlog=SERVER_BACKLOG, ident="KenpoFlashcards",
+        )
+        print(f"[SERVER] waitress on http://{host}:{port} • {SERVER_THREADS} threads (+{FEED_MAX_STREAMS} for change feeds) • "
+              f"max {SERVER_CONNECTION_LIMIT} connections • idle timeout {SERVER_CHANNEL_TIMEOUT}s")
+    else:
+        from werkzeug.serving import make_server
+        server = make_server(host, port, app, threaded=True)
+        print(f"[SERVER] werkzeug (development server) on http://{host}:{port} • thread per request")
+
+    with _server_lock:
+        _server_state.update({"kind": kind, "server": server, "started": time.time()})
+    if install_signals:
+        _install_shutdown_signals()
+    if STATIC_PIPELINE:
+        # Compress/fingerprint the static bundle now rather than on the first page load
+        threading.Thread(target=_static_asset, args=("index.html",), name="static-build", daemon=True).start()
+
+    try:
+        if kind == "waitress":
+            server.run()
+            # run() returns once the drain thread emptied the socket map; stop the worker pool
+            server.task_dispatcher.shutdown(timeout=max(1, SERVER_SHUTDOWN_TIMEOUT))
+        else:
+            server.serve_forever()
+            server.server_close()
+    finally:
+        with _server_lock:
+            _server_state.update({"kind": "", "server": None})
+        print("[SERVER] Stopped")
+
+
+def startup_profile(host: str = "127.0.0.1", port: Optional[int] = None, log=print) -> int:
+    """--startup-profile: start the server, time the first /api/health response, log the
+    import/init time per phase and stop again. Returns 0 when time-to-first-response
+    (measured from the top of app.py) is within KENPO_STARTUP_TARGET_MS, else 1."""
+    import socket
+    from urllib.request import urlopen
+
+    target_ms = _safe_int(os.environ.get("KENPO_STARTUP_TARGET_MS"), 1500)
+    if not port:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sk:
+            sk.bind((host, 0))
+            port = sk.getsockname()[1]
+    import_ms = (time.perf_counter() - _STARTUP_T0) * 1000.0
+    thread = threading.Thread(target=run_server, kwargs={"host": host, "port": port, "install_signals": False},
+                              name="startup-profile-server", daemon=True)
+    thread.start()
+    first_ms = None
+    deadline = time.perf_counter() + 60
+    while time.perf_counter() < deadline and thread.is_alive():
+        try:
+            with urlopen(f"http://{host}:{port}/api/health", timeout=2) as r:
+                if r.status == 200:
+                    _startup_phase("server start + first /api/health")
+                    first_ms = (time.perf_counter() - _STARTUP_T0) * 1000.0
+                    break
+        except Exception:
+            time.sleep(0.01)
+    request_server_shutdown("startup profile")
+    thread.join(10)
+
+    log(f"[STARTUP] {'phase':<48}{'ms':>9}")
+    for name, ms in _startup_phases:
+        log(f"[STARTUP] {name:<48}{ms:>9.1f}")
+    log(f"[STARTUP] {'import app.py total':<48}{import_ms:>9.1f}")
+    if first_ms is None:
+        log("[STARTUP] server did not answer /api/health within 60s")
+        return 1
+    verdict = "OK" if first_ms <= target_ms else "OVER TARGET"
+    log(f"[STARTUP] time to first response: {first_ms:.0f} ms (target {target_ms} ms) {verdict}")
+    log("[STARTUP] (excludes interpreter start; `python -X importtime app.py --startup-profile` breaks imports down further)")
+    return 0 if first_ms <= target_ms else 1
+
+
+# ============ APPLICATION FACTORY ============
+def create_app(blueprints: Optional[Any] = None) -> Flask:
+    """Build a Flask app with the core blueprint plus the named subsystems.
+
+    blueprints: iterable of names from BLUEPRINTS, or a comma-separated string; "all"
+    or None means KENPO_BLUEPRINTS (default all; sync on a replica). Unregistered subsystems' URL rules
+    are never compiled, and their requests fall through to the static-file 404.
+    """
+    if blueprints is None:
+        blueprints = os.environ.get("KENPO_BLUEPRINTS") or ("sync" if REPLICA_SOURCE else "all")
+    if isinstance(blueprints, str):
+        blueprints = [b.strip().lower() for b in blueprints.split(",") if b.strip()]
+    names = list(BLUEPRINTS) if "all" in blueprints else [b for b in BLUEPRINTS if b in blueprints]
+    unknown = sorted(set(blueprints) - set(BLUEPRINTS) - {"all", "core"})
+    if unknown:
+        raise ValueError(f"Unknown blueprint(s) {unknown}; choose from: all, {', '.join(BLUEPRINTS)}")
+
+    flask_app = Flask(__name__, static_folder="static")
+    flask_app.secret_key = SECRET_KEY
+    flask_app.config["KENPO_BLUEPRINTS"] = names
+    flask_app.register_blueprint(core_bp)
+    for name in names:
+        flask_app.register_blueprint(BLUEPRINTS[name])
+    if REPLICA_SOURCE:
+        flask_app.before_request(_replica_read_only)
+    flask_app.wsgi_app = _InflightCounter(flask_app.wsgi_app)
+    if set(names) != set(BLUEPRINTS):
+        print(f"[SERVER] Blueprints: core, {', '.join(names) or '(none)'}")
+    return flask_app
+
+
+_startup_phase("remaining subsystems and route definitions")
+app = create_app()
+_startup_phase("app factory (register blueprints, compile routes)")
+
+
 if __name__ == "__main__":
+    if "--startup-profile" in sys.argv[1:]:
+        sys.exit(startup_profile())
+
     # Load encrypted API keys from file (overrides environment variables)
     _load_api_keys_on_startup()
     
@@ -5192,7 +8827,10 @@ if __name__ == "__main__":
         gemini_state = "SET" if bool(GEMINI_API_KEY) else "not set"
         print(f"[AI] OpenAI key: {openai_state} • model: {OPENAI_MODEL if OPENAI_API_KEY else 'n/a'}")
         print(f"[AI] Gemini key: {gemini_state} • model: {GEMINI_MODEL if GEMINI_API_KEY else 'n/a'}")
+        for _name, _base in (("OpenAI", OPENAI_API_BASE), ("Gemini", GEMINI_API_BASE)):
+            if _base.startswith("stub://"):
+                print(f"[AI] {_name} served by local STUB provider • latency {AI_STUB_LATENCY_MS}ms (+{AI_STUB_JITTER_MS}ms jitter)")
     except Exception:
         pass
 
-    app.run(host="0.0.0.0", port=PORT, debug=False)
+    run_server()
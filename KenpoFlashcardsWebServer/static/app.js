@@ -75,12 +75,14 @@ let aiStatus = { openai_available: false, openai_model: "", gemini_available: fa
 
 async function postLoginInit(){
   let _activeDeckLoadedFromSettings = false;
+  let _liveUpdates = false;
   if(appInitialized) return;
   
   // Load saved active deck from settings FIRST
   try {
     const settingsResp = await jget("/api/settings?scope=all");
     const settings = (settingsResp && settingsResp.settings) ? settingsResp.settings : settingsResp;
+    _liveUpdates = !!(settings && settings.live_updates);
     if(settings && settings.activeDeckId){
       activeDeckId = settings.activeDeckId;
       _activeDeckLoadedFromSettings = true;
@@ -120,6 +122,7 @@ async function postLoginInit(){
   await refreshCounts();
   // default start view
   setTab("active");
+  if(_liveUpdates) startChangeFeed();
   appInitialized = true;
 }
 
@@ -138,6 +141,73 @@ function cardHasBreakdown(cardId){
   return breakdownIds.has(cardId);
 }
 
+// Live updates from other devices (Server-Sent Events), opt-in via the "live_updates"
+// setting since each open tab holds a server thread. Progress/custom set changes
+// refresh the counts and list views; study mode keeps the current card.
+const CHANGE_FEED_RETRY_MIN_MS = 60000;
+const CHANGE_FEED_RETRY_MAX_MS = 15 * 60000;
+let changeFeed = null;
+let changeFeedTimer = null;
+let changeFeedPending = false;
+let changeFeedRetryMs = CHANGE_FEED_RETRY_MIN_MS;
+let changeFeedRetryTimer = null;
+
+function startChangeFeed(){
+  if(changeFeed || typeof EventSource === "undefined") return;
+  clearTimeout(changeFeedRetryTimer);
+  changeFeed = new EventSource("/api/web/sync/events");
+  changeFeed.onopen = () => { changeFeedRetryMs = CHANGE_FEED_RETRY_MIN_MS; };
+  const onChange = (ev) => {
+    let data = {};
+    try { data = JSON.parse(ev.data || "{}"); } catch(e){}
+    if(data.origin && data.origin === feedClientId) return;
+    clearTimeout(changeFeedTimer);
+    changeFeedTimer = setTimeout(liveRefresh, 400);
+  };
+  changeFeed.addEventListener("progress", onChange);
+  changeFeed.addEventListener("customset", onChange);
+  changeFeed.addEventListener("resync", onChange);
+  changeFeed.addEventListener("breakdowns", (ev) => {
+    try {
+      const data = JSON.parse(ev.data || "{}");
+      (data.ids || []).forEach(id => breakdownIds.add(id));
+      (data.deleted || []).forEach(id => breakdownIds.delete(id));
+    } catch(e){}
+  });
+  changeFeed.onerror = () => {
+    // EventSource retries dropped connections itself, but gives up on errors such as 401/503.
+    // Back off (with jitter) so a full server is not hit by every tab at once.
+    if(changeFeed && changeFeed.readyState === EventSource.CLOSED){
+      changeFeed = null;
+      const delay = changeFeedRetryMs * (0.5 + Math.random());
+      changeFeedRetryMs = Math.min(changeFeedRetryMs * 2, CHANGE_FEED_RETRY_MAX_MS);
+      changeFeedRetryTimer = setTimeout(() => { if(currentUser) startChangeFeed(); }, delay);
+    }
+  };
+}
+
+function stopChangeFeed(){
+  if(changeFeed){ changeFeed.close(); changeFeed = null; }
+  clearTimeout(changeFeedTimer);
+  clearTimeout(changeFeedRetryTimer);
+  changeFeedRetryMs = CHANGE_FEED_RETRY_MIN_MS;
+}
+
+async function liveRefresh(){
+  if(!currentUser) return;
+  if(document.hidden){
+    if(!changeFeedPending){
+      changeFeedPending = true;
+      document.addEventListener("visibilitychange", () => { changeFeedPending = false; liveRefresh(); }, {once: true});
+    }
+    return;
+  }
+  await refreshCounts();
+  if(!$("viewList").classList.contains("hidden")){
+    try{ await loadList(activeTab); } catch(e){}
+  }
+}
+
 
 function showAuthOverlay(){ $("authOverlay").classList.remove("hidden"); }
 function hideAuthOverlay(){ $("authOverlay").classList.add("hidden"); }
@@ -240,6 +310,9 @@ async function ensureLoggedIn(){
 }
 
 
+// Sent with writes so the change feed can tell this tab's own changes apart
+const feedClientId = Math.random().toString(36).slice(2) + Date.now().toString(36);
+
 async function jget(url){
   const r = await fetch(url);
   if(r.status === 401){
@@ -250,7 +323,7 @@ async function jget(url){
   return r.json();
 }
 async function jpost(url, body){
-  const r = await fetch(url, {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify(body||{})});
+  const r = await fetch(url, {method:"POST", headers:{"Content-Type":"application/json", "X-Kenpo-Client": feedClientId}, body: JSON.stringify(body||{})});
   if(r.status === 401){
     await ensureLoggedIn();
     throw new Error("login_required");
@@ -1670,6 +1743,7 @@ $("setShowGroup").checked = effective.show_group_label !== false;
   if($("setAllListShowUnlearnedUnsureBtns")) $("setAllListShowUnlearnedUnsureBtns").checked = (effective.all_list_show_unlearned_unsure_buttons !== false);
   if($("setLearnedListShowMoveBtns")) $("setLearnedListShowMoveBtns").checked = (effective.learned_list_show_relearn_unsure_buttons !== false);
   if($("setLearnedListShowGroupLabel")) $("setLearnedListShowGroupLabel").checked = (effective.learned_list_show_group_label !== false);
+  if($("setLiveUpdates")) $("setLiveUpdates").checked = !!effective.live_updates;
 
   // AI breakdown provider (global)
   const aiSection = $("aiSettingsSection");
@@ -1759,6 +1833,10 @@ async function saveSettings(){
     patch.all_list_show_unlearned_unsure_buttons = $("setAllListShowUnlearnedUnsureBtns").checked;
     patch.learned_list_show_relearn_unsure_buttons = $("setLearnedListShowMoveBtns").checked;
     patch.learned_list_show_group_label = $("setLearnedListShowGroupLabel").checked;
+    if($("setLiveUpdates")){
+      patch.live_updates = $("setLiveUpdates").checked;
+      if(patch.live_updates) startChangeFeed(); else stopChangeFeed();
+    }
     if($("setBreakdownProvider")) patch.breakdown_ai_provider = $("setBreakdownProvider").value || "auto";
   }
 
@@ -1773,8 +1851,27 @@ async function saveSettings(){
   await refresh();
 }
 
+// Login/register POST. A burst of sign-ins can briefly fill the server's password-hash
+// queue (503 server_busy); wait Retry-After and try once more before showing an error.
+async function authPost(url, body){
+  const send = () => fetch(url, {
+    method: "POST",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify(body)
+  });
+  let r = await send();
+  if(r.status === 503){
+    const wait = parseInt(r.headers.get("Retry-After") || "1", 10) || 1;
+    await new Promise(resolve => setTimeout(resolve, Math.min(wait, 10) * 1000));
+    r = await send();
+  }
+  return r.json();
+}
+
 function getErrorMessage(error){
   const msg = error.message || "";
+  if(msg.includes("server_busy")) return "The server is busy right now. Please try again in a moment.";
+  if(msg.includes("too_many_attempts")) return "Too many attempts. Please wait a minute and try again.";
   if(msg.includes("username_and_password_required")) return "Please enter both username and password.";
   if(msg.includes("username_too_short")) return "Username must be at least 3 characters.";
   if(msg.includes("password_too_short")) return "Password must be at least 4 characters.";
@@ -1951,11 +2048,7 @@ async function main(){
     }
     
     try{
-      const res = await fetch("/api/login", {
-        method: "POST",
-        headers: {"Content-Type": "application/json"},
-        body: JSON.stringify({username, password})
-      }).then(r => r.json());
+      const res = await authPost("/api/login", {username, password});
       
       if(res.error){
         $("authMessage").textContent = getErrorMessage({message: res.error});
@@ -1999,11 +2092,7 @@ async function main(){
     }
     
     try{
-      const res = await fetch("/api/register", {
-        method: "POST",
-        headers: {"Content-Type": "application/json"},
-        body: JSON.stringify({username, password, display_name: displayName})
-      }).then(r => r.json());
+      const res = await authPost("/api/register", {username, password, display_name: displayName});
       
       if(res.error){
         $("authMessage").textContent = getErrorMessage({message: res.error});
@@ -2333,6 +2422,7 @@ bind("card","click", flip);
     if(!confirm("Reset settings to defaults for this scope?")) return;
     try{
       await jpost("/api/settings_reset", {scope});
+      if(scope === "all") stopChangeFeed();  // live_updates defaults to off
       // clear cached settings + reload form
       settingsAll = null;
       settingsGroup = {};
@@ -2377,6 +2467,7 @@ async function doLogout(){
   if(!confirm("Are you sure you want to logout?")) return;
   
   try{ await jpost("/api/logout", {}); } catch(e){}
+  stopChangeFeed();
   currentUser = null;
   setUserLine();
   appInitialized = false;
@@ -3113,6 +3204,27 @@ async function deleteUserCard(cardId, term){
   }
 }
 
+// AI enrichment: one /api/ai/enrich_cards call returns definition options,
+// pronunciation and group suggestions. Buttons pressed while a call for the same
+// term/meaning is in flight share it; once it settles the next press asks again.
+const aiEnrichRequests = new Map();
+function aiEnrichTerm(term){
+  const meaning = $("addCardMeaning").value.trim();
+  const existingGroups = [...new Set(allGroups || [])];
+  const key = JSON.stringify([activeDeckId, term.toLowerCase(), meaning, existingGroups]);
+  if(!aiEnrichRequests.has(key)){
+    // Get current deck context for better AI results
+    const deck = currentDecks.find(d => d.id === activeDeckId);
+    const deckName = deck?.name || "General";
+    const deckDesc = deck?.description || "";
+    const req = jpost("/api/ai/enrich_cards", { terms: [{ term, meaning }], deckName, deckDescription: deckDesc, existingGroups })
+      .then(res => (res.results || [])[0] || {})
+      .finally(() => { aiEnrichRequests.delete(key); });
+    aiEnrichRequests.set(key, req);
+  }
+  return aiEnrichRequests.get(key);
+}
+
 // AI Generate Definition
 async function aiGenerateDefinition(){
   const term = $("addCardTerm").value.trim();
@@ -3121,21 +3233,21 @@ async function aiGenerateDefinition(){
     return;
   }
   
-  // Get current deck context for better AI results
-  const deck = currentDecks.find(d => d.id === activeDeckId);
-  const deckName = deck?.name || "General";
-  const deckDesc = deck?.description || "";
-  
   const dropdown = $("aiDefDropdown");
   const list = $("aiDefList");
   dropdown.classList.remove("hidden");
   list.innerHTML = '<div class="aiLoading">🤖 Generating...</div>';
   
   try {
-    const res = await jpost("/api/ai/generate_definition", { term, deckName, deckDescription: deckDesc });
+    let definitions = (await aiEnrichTerm(term)).definitions;
+    if(!definitions?.length){
+      const deck = currentDecks.find(d => d.id === activeDeckId);
+      const res = await jpost("/api/ai/generate_definition", { term, deckName: deck?.name || "General", deckDescription: deck?.description || "" });
+      definitions = res.definitions;
+    }
     list.innerHTML = "";
     
-    for(const def of (res.definitions || [])){
+    for(const def of (definitions || [])){
       const opt = document.createElement("div");
       opt.className = "aiOption";
       opt.textContent = def;
@@ -3163,8 +3275,11 @@ async function aiGeneratePronunciation(){
   btn.disabled = true;
   
   try {
-    const res = await jpost("/api/ai/generate_pronunciation", { term });
-    $("addCardPron").value = res.pronunciation || "";
+    let pronunciation = (await aiEnrichTerm(term)).pronunciation;
+    if(!pronunciation){
+      pronunciation = (await jpost("/api/ai/generate_pronunciation", { term })).pronunciation;
+    }
+    $("addCardPron").value = pronunciation || "";
     showEditDecksStatus("Pronunciation generated", "success");
   } catch(e){
     showEditDecksStatus("Failed to generate: " + e.message, "error");
@@ -3188,14 +3303,16 @@ async function aiGenerateGroup(){
   dropdown.classList.remove("hidden");
   list.innerHTML = '<div class="aiLoading">🤖 Generating...</div>';
   
-  // Get existing groups from cards
-  const existingGroups = [...new Set(allGroups || [])];
-  
   try {
-    const res = await jpost("/api/ai/generate_group", { term, meaning, existingGroups });
+    let groups = (await aiEnrichTerm(term)).groups;
+    if(!groups?.length){
+      // Get existing groups from cards
+      const existingGroups = [...new Set(allGroups || [])];
+      groups = (await jpost("/api/ai/generate_group", { term, meaning, existingGroups })).groups;
+    }
     list.innerHTML = "";
     
-    for(const grp of (res.groups || [])){
+    for(const grp of (groups || [])){
       const opt = document.createElement("div");
       opt.className = "aiOption";
       opt.textContent = grp;
@@ -3490,53 +3607,99 @@ async function aiGenFromDocument(){
   await generateCards({ type: "document", document: aiDocData, maxCards });
 }
 
+// POST and read a newline-delimited JSON stream, calling onItem for each parsed line.
+async function jpostStream(url, body, onItem){
+  const r = await fetch(url, {method:"POST", headers:{"Content-Type":"application/json"}, body: JSON.stringify(body||{})});
+  if(r.status === 401){
+    await ensureLoggedIn();
+    throw new Error("login_required");
+  }
+  if(!r.ok || !r.body) throw new Error(await r.text());
+  const reader = r.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  for(;;){
+    const { value, done } = await reader.read();
+    if(done) break;
+    buf += decoder.decode(value, { stream: true });
+    let nl;
+    while((nl = buf.indexOf("\n")) >= 0){
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if(line) onItem(JSON.parse(line));
+    }
+  }
+  if(buf.trim()) onItem(JSON.parse(buf.trim()));
+}
+
 async function generateCards(params){
   $("aiGenLoading")?.classList.remove("hidden");
   $("aiGenResults")?.classList.add("hidden");
   
   try {
-    const result = await jpost("/api/ai/generate_deck", params);
+    // Get existing terms to filter out duplicates
+    const existingTerms = new Set();
     
-    if(result.cards && result.cards.length > 0){
-      // Get existing terms to filter out duplicates
-      const existingTerms = new Set();
-      
-      // Add terms from main cards
-      if(window.allCards){
-        window.allCards.forEach(c => {
-          if(c.term) existingTerms.add(c.term.toLowerCase().trim());
-        });
-      }
-      
-      // Add terms from user cards
-      const userCardsData = await jget("/api/user_cards?deck_id=" + activeDeckId).catch(() => []);
-      if(Array.isArray(userCardsData)){
-        userCardsData.forEach(c => {
-          if(c.term) existingTerms.add(c.term.toLowerCase().trim());
-        });
-      }
-      
-      // Filter out cards that already exist
-      const newCards = result.cards.filter(card => {
-        const termLower = card.term.toLowerCase().trim();
-        return !existingTerms.has(termLower);
+    // Add terms from main cards
+    if(window.allCards){
+      window.allCards.forEach(c => {
+        if(c.term) existingTerms.add(c.term.toLowerCase().trim());
       });
+    }
+    
+    // Add terms from user cards
+    const userCardsData = await jget("/api/user_cards?deck_id=" + activeDeckId).catch(() => []);
+    if(Array.isArray(userCardsData)){
+      userCardsData.forEach(c => {
+        if(c.term) existingTerms.add(c.term.toLowerCase().trim());
+      });
+    }
+    
+    aiGeneratedCards = [];
+    aiSelectedIndices = new Set();
+    let received = 0;
+    
+    const addCard = (card) => {
+      received++;
+      if(existingTerms.has(card.term.toLowerCase().trim())) return;
+      aiSelectedIndices.add(aiGeneratedCards.length); // Select all by default
+      aiGeneratedCards.push(card);
+      renderAiGenResults();
+      $("aiGenResults")?.classList.remove("hidden");
+    };
+    
+    // Stream cards in as the model writes them; fall back to the one-shot endpoint.
+    let streamError = null;
+    try {
+      await jpostStream("/api/ai/generate_deck/stream", params, (item) => {
+        if(item.card) addCard(item.card);
+        else if(item.error) streamError = item.error;
+      });
+    } catch(e){
+      if(e.message === "login_required") throw e;
+      if(received === 0){
+        const result = await jpost("/api/ai/generate_deck", params);
+        (result.cards || []).forEach(addCard);
+      } else {
+        streamError = e.message;
+      }
+    }
+    if(streamError && received === 0) throw new Error(streamError);
+    
+    if(received > 0){
+      const filteredCount = received - aiGeneratedCards.length;
       
-      const filteredCount = result.cards.length - newCards.length;
-      
-      if(newCards.length > 0){
-        aiGeneratedCards = newCards;
-        aiSelectedIndices = new Set(newCards.map((_, i) => i)); // Select all by default
+      if(aiGeneratedCards.length > 0){
         renderAiGenResults();
         $("aiGenResults")?.classList.remove("hidden");
         
-        let msg = `Generated ${newCards.length} new cards.`;
+        let msg = `Generated ${aiGeneratedCards.length} new cards.`;
         if(filteredCount > 0){
           msg += ` (${filteredCount} duplicates filtered out)`;
         }
         showEditDecksStatus(msg, "success");
       } else {
-        showEditDecksStatus(`All ${result.cards.length} generated cards already exist in your deck.`, "error");
+        showEditDecksStatus(`All ${received} generated cards already exist in your deck.`, "error");
       }
     } else {
       showEditDecksStatus("AI could not generate cards. Try different input.", "error");
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+KenpoFlashcards Web Server - Synthetic Dataset Generator
+========================================================
+
+Writes a data folder at scale for benchmarking caching and storage changes.
+It uses the same schemas the server's _load_* helpers read:
+
+  <out>/kenpo_words.json                   built-in deck source (KENPO_JSON_PATH)
+  <out>/data/profiles.json                 {"users": {uid: {...}}}
+  <out>/data/admin_users.json              {"admin_usernames": [...]}
+  <out>/data/users/<uid>/progress.json     {"__settings__": {...}, card_id: {status, updated_at}}
+  <out>/data/user_cards/<uid>/cards.json   user cards added to the built-in deck
+  <out>/data/decks.json                    built-in + user-owned deck definitions
+  <out>/data/deck_cards/<deck>/cards.json  deck-scoped cards
+  <out>/data/deck_access.json              inviteCodes / userUnlocks / userBuiltInDisabled
+  <out>/data/breakdowns.json               {card_id: {id, term, parts, literal, ...}}
+  <out>/bench_dataset.json                 manifest (accounts, card ids) for tools/loadtest.py
+
+SKEW:
+  Real usage is lopsided: a few users study a lot and own most decks, and a few
+  decks get most invite redemptions. --skew is a Zipf exponent (0 = uniform)
+  applied to deck ownership, per-user progress size, invite popularity and the
+  account weights the load test uses to pick users. Deck sizes are log-normal
+  around --deck-cards.
+
+Every run with the same options and --seed writes identical files
+(timestamps are relative to --epoch).
+
+Usage:
+    python tools/gen_dataset.py <out_folder> [options]
+
+Examples:
+    python tools/gen_dataset.py /tmp/kenpo-5k --users 5000 --decks 400 --breakdowns 5000
+    python tools/gen_dataset.py /tmp/kenpo-flat --users 1000 --skew 0
+    set KENPO_DATA_DIR=C:\\bench\\kenpo-5k\\data
+    set KENPO_JSON_PATH=C:\\bench\\kenpo-5k\\kenpo_words.json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from werkzeug.security import check_password_hash
+
+BENCH_PASSWORD = "bench-pass"
+ADMIN_USERNAME = "bench_admin"
+STATUSES = ("active", "unsure", "learned", "deleted")
+# Stored progress is mostly learned/unsure; "active" entries exist after un-marking
+STATUS_WEIGHTS = (10, 25, 60, 5)
+GROUPS = ["Numbers", "Stances", "Blocks", "Strikes", "Kicks", "Forms", "Terms", "Etiquette",
+          "Techniques", "History"]
+
+SYLLABLES = ["ka", "ki", "ku", "ke", "ko", "sa", "shi", "su", "se", "so", "ta", "chi", "tsu",
+             "te", "to", "na", "ni", "nu", "ne", "no", "ha", "hi", "fu", "he", "ho", "ma",
+             "mi", "mu", "me", "mo", "ya", "yu", "yo", "ra", "ri", "ru", "re", "ro", "wa", "n"]
+MEANING_WORDS = ["strike", "block", "kick", "stance", "hand", "foot", "inward", "outward",
+                 "upward", "downward", "rising", "front", "back", "side", "crane", "tiger",
+                 "dragon", "snake", "form", "bow", "breath", "spirit", "way", "fist", "palm"]
+INVITE_WORDS = ["Study", "Learn", "Flash", "Card", "Deck", "Quiz", "Train", "Vocab", "Word", "Smart"]
+
+
+def _stable_id(group: str, subgroup: str, term: str, meaning: str, pron: str) -> str:
+    """Same card id scheme as app._stable_id."""
+    base = f"{group}||{subgroup}||{term}||{meaning}||{pron}".encode("utf-8")
+    return hashlib.sha1(base).hexdigest()[:16]
+
+
+def _fake_term(rng: random.Random, n: int) -> str:
+    words = []
+    for _ in range(rng.randint(1, 3)):
+        words.append("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))).capitalize())
+    # Suffix keeps terms unique even when syllables collide
+    return f"{' '.join(words)} {n}"
+
+
+def _fake_meaning(rng: random.Random) -> str:
+    return " ".join(rng.choice(MEANING_WORDS) for _ in range(rng.randint(1, 4))).capitalize()
+
+
+def _zipf_weights(n: int, s: float) -> List[float]:
+    """Rank weights 1/k^s normalised to mean 1.0 (s=0 gives all 1.0)."""
+    if n <= 0:
+        return []
+    raw = [1.0 / math.pow(k, s) for k in range(1, n + 1)]
+    scale = n / sum(raw)
+    return [w * scale for w in raw]
+
+
+def make_builtin_cards(rng: random.Random, count: int) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Raw kenpo_words.json-style cards (no ids, like the real file) and their ids."""
+    raw_cards = []
+    ids: List[str] = []
+    for n in range(count):
+        term = _fake_term(rng, n)
+        c = {"group": GROUPS[n % len(GROUPS)], "subgroup": "", "term": term,
+             "pron": term.lower(), "meaning": _fake_meaning(rng)}
+        raw_cards.append(c)
+        ids.append(_stable_id(c["group"], "", c["term"], c["meaning"], c["pron"]))
+    return raw_cards, ids
+
+
+def _password_hash(password: str, seed: int) -> str:
+    """Werkzeug-format scrypt hash (same cost as generate_password_hash) with a
+    seed-derived salt, so repeated runs write identical profiles.json files."""
+    salt = hashlib.sha1(f"kenpo-bench-{seed}".encode("utf-8")).hexdigest()[:16]
+    n, r, p = 32768, 8, 1
+    digest = hashlib.scrypt(password.encode("utf-8"), salt=salt.encode("utf-8"), n=n, r=r, p=p,
+                            maxmem=132 * n * r * p).hex()
+    out = f"scrypt:{n}:{r}:{p}${salt}${digest}"
+    assert check_password_hash(out, password)
+    return out
+
+
+def _write_json(path: Path, obj: Any) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    text = json.dumps(obj, ensure_ascii=False)
+    path.write_text(text, encoding="utf-8")
+    return len(text)
+
+
+def generate_dataset(root: Path, users: int = 1000, decks: int = 200, deck_cards: int = 60,
+                     kenpo_cards: int = 500, breakdowns: int = 1000, progress_fill: float = 0.3,
+                     user_cards: float = 0.1, invite_codes: int = 50, redemptions: int = 500,
+                     builtin_disabled: float = 0.0, skew: float = 1.1, seed: int = 1,
+                     epoch: int = 1767225600) -> Dict[str, Any]:
+    """Write the dataset under root and return its manifest (also saved as bench_dataset.json)."""
+    rng = random.Random(seed)
+    data_dir = root / "data"
+    sizes: Dict[str, int] = {}
+
+    def ts(max_age_days: int) -> int:
+        return epoch - rng.randint(0, 86400 * max_age_days)
+
+    # ---- Built-in deck source ----
+    raw_cards, kenpo_ids = make_builtin_cards(rng, kenpo_cards)
+    sizes["kenpo_words.json"] = _write_json(root / "kenpo_words.json", raw_cards)
+
+    # ---- Users (rank 0 is the most active) ----
+    pw_hash = _password_hash(BENCH_PASSWORD, seed)
+    activity = _zipf_weights(users, skew)
+    accounts: List[Dict[str, Any]] = []
+    profile_users: Dict[str, Any] = {}
+    admin_uid = "%012x" % rng.getrandbits(48)
+    profile_users[admin_uid] = {"username": ADMIN_USERNAME, "password_hash": pw_hash,
+                                "display_name": "Bench Admin", "created_at": ts(720)}
+    for n in range(users):
+        uid = "%012x" % rng.getrandbits(48)
+        username = f"bench_user_{n:05d}"
+        profile_users[uid] = {"username": username, "password_hash": pw_hash,
+                              "display_name": f"Bench User {n}", "created_at": ts(720)}
+        accounts.append({"uid": uid, "username": username, "weight": round(activity[n], 4),
+                         "builtin": rng.random() >= builtin_disabled, "decks": []})
+    sizes["profiles.json"] = _write_json(data_dir / "profiles.json", {"users": profile_users})
+    _write_json(data_dir / "admin_users.json", {"admin_usernames": [ADMIN_USERNAME]})
+
+    # ---- User-owned decks (owners drawn with the activity skew) ----
+    deck_rows: List[Dict[str, Any]] = [{
+        "id": "kenpo", "name": "Kenpo Vocabulary", "description": "Korean martial arts terminology for Kenpo students",
+        "isDefault": False, "isBuiltIn": True, "sourceFile": "kenpo_words.json", "cardCount": kenpo_cards,
+        "createdAt": 0, "updatedAt": 0,
+    }]
+    deck_card_ids: Dict[str, List[str]] = {}
+    all_cards_for_bd: List[Dict[str, Any]] = [dict(c, id=cid) for c, cid in zip(raw_cards, kenpo_ids)]
+    sigma = 0.4 + 0.4 * min(skew, 2.0)
+    mu = math.log(max(1, deck_cards)) - sigma * sigma / 2
+    owners = rng.choices(range(users), weights=activity, k=decks) if users else []
+    deck_bytes = 0
+    for owner_idx in owners:
+        acct = accounts[owner_idx]
+        deck_id = "deck_%08x" % rng.getrandbits(32)
+        while deck_id in deck_card_ids:
+            deck_id = "deck_%08x" % rng.getrandbits(32)
+        count = max(1, min(5000, int(rng.lognormvariate(mu, sigma))))
+        created = ts(365)
+        cards = []
+        for n in range(count):
+            term = _fake_term(rng, n)
+            meaning = _fake_meaning(rng)
+            group = rng.choice(GROUPS)
+            cid = _stable_id(group, "", term, meaning, "")
+            cards.append({"id": cid, "term": term, "meaning": meaning, "pron": "", "group": group,
+                          "subgroup": "", "deckId": deck_id, "isUserCreated": True,
+                          "createdAt": created, "updatedAt": created})
+        deck_bytes += _write_json(data_dir / "deck_cards" / deck_id / "cards.json", cards)
+        deck_card_ids[deck_id] = [c["id"] for c in cards]
+        all_cards_for_bd.extend(cards)
+        deck_rows.append({"id": deck_id, "name": f"{acct['username']} deck {len(acct['decks']) + 1}",
+                          "description": "", "isDefault": False, "isBuiltIn": False, "sourceFile": None,
+                          "cardCount": count, "createdAt": created, "updatedAt": created,
+                          "ownerId": acct["uid"], "createdBy": acct["uid"]})
+        acct["decks"].append(deck_id)
+    sizes["decks.json"] = _write_json(data_dir / "decks.json", deck_rows)
+    sizes["deck_cards/*"] = deck_bytes
+
+    # ---- Invite codes and redemptions (popular decks get most redemptions) ----
+    shared_ids = [d["id"] for d in deck_rows[1:]]
+    rng.shuffle(shared_ids)
+    shared_ids = shared_ids[:invite_codes]
+    invites: Dict[str, Any] = {}
+    code_for_deck: Dict[str, str] = {}
+    for deck_id in shared_ids:
+        code = f"Kenpo{rng.choice(INVITE_WORDS)}{rng.randint(100, 999)}"
+        while code in invites:
+            code = f"Kenpo{rng.choice(INVITE_WORDS)}{rng.randint(100, 99999)}"
+        invites[code] = {"deckId": deck_id, "createdAt": ts(180), "createdBy": ADMIN_USERNAME, "uses": 0}
+        code_for_deck[deck_id] = code
+    unlocks: Dict[str, List[str]] = {}
+    if shared_ids and accounts:
+        popularity = _zipf_weights(len(shared_ids), skew)
+        for _ in range(redemptions):
+            acct = rng.choices(accounts, weights=activity, k=1)[0]
+            deck_id = rng.choices(shared_ids, weights=popularity, k=1)[0]
+            mine = unlocks.setdefault(acct["uid"], [])
+            if deck_id in mine or deck_id in acct["decks"]:
+                continue
+            mine.append(deck_id)
+            invites[code_for_deck[deck_id]]["uses"] += 1
+    for acct in accounts:
+        acct["unlocked"] = list(unlocks.get(acct["uid"], []))
+    access = {
+        "inviteCodes": invites,
+        "userUnlocks": {uid: ids for uid, ids in unlocks.items() if ids},
+        "userOverrides": {},
+        "userBuiltInDisabled": [a["uid"] for a in accounts if not a["builtin"]],
+    }
+    sizes["deck_access.json"] = _write_json(data_dir / "deck_access.json", access)
+
+    # ---- Per-user progress and built-in-deck user cards ----
+    progress_bytes = 0
+    user_card_bytes = 0
+    for acct in accounts:
+        fill = min(1.0, progress_fill * acct["weight"])
+        studied: List[str] = []
+        if acct["builtin"]:
+            studied.extend(kenpo_ids)
+        for deck_id in acct["decks"] + acct["unlocked"]:
+            studied.extend(deck_card_ids.get(deck_id, []))
+        k = int(len(studied) * fill)
+        progress: Dict[str, Any] = {}
+        for cid in rng.sample(studied, k) if k else []:
+            progress[cid] = {"status": rng.choices(STATUSES, weights=STATUS_WEIGHTS, k=1)[0],
+                             "updated_at": ts(180)}
+        settings: Dict[str, Any] = {"all": {}, "groups": {}}
+        own_choices = acct["decks"] + acct["unlocked"]
+        if own_choices and (not acct["builtin"] or rng.random() < 0.3):
+            settings["all"]["activeDeckId"] = rng.choice(own_choices)
+        progress["__settings__"] = settings
+        if rng.random() < 0.5:
+            progress["__last_sync__"] = ts(30)
+        progress_bytes += _write_json(data_dir / "users" / acct["uid"] / "progress.json", progress)
+
+        if acct["builtin"] and rng.random() < user_cards:
+            cards = []
+            for n in range(rng.randint(1, 40)):
+                term = _fake_term(rng, n)
+                meaning = _fake_meaning(rng)
+                created = ts(180)
+                cards.append({"id": _stable_id("kenpo", acct["uid"], term, meaning, ""), "term": term,
+                              "meaning": meaning, "pron": "", "group": rng.choice(GROUPS), "subgroup": "",
+                              "deckId": "kenpo", "isUserCreated": True, "createdAt": created,
+                              "updatedAt": created})
+            user_card_bytes += _write_json(data_dir / "user_cards" / acct["uid"] / "cards.json", cards)
+    sizes["users/*/progress.json"] = progress_bytes
+    sizes["user_cards/*"] = user_card_bytes
+
+    # ---- Shared breakdowns ----
+    bd: Dict[str, Any] = {}
+    for c in rng.sample(all_cards_for_bd, min(breakdowns, len(all_cards_for_bd))):
+        words = c["term"].split()[:-1] or [c["term"]]
+        bd[c["id"]] = {"id": c["id"], "term": c["term"],
+                       "parts": [{"part": w, "meaning": _fake_meaning(rng)} for w in words],
+                       "literal": c["meaning"], "notes": "", "updated_at": ts(365),
+                       "updated_by": rng.choice([None, ADMIN_USERNAME])}
+    sizes["breakdowns.json"] = _write_json(data_dir / "breakdowns.json", bd)
+
+    manifest = {
+        "generator": "kenpo-gen-dataset",
+        "format": 1,
+        "seed": seed,
+        "epoch": epoch,
+        "skew": skew,
+        "users": users,
+        "decks": len(deck_rows) - 1,
+        "deck_cards_total": sum(len(v) for v in deck_card_ids.values()),
+        "kenpo_cards": kenpo_cards,
+        "breakdowns": len(bd),
+        "invite_codes": len(invites),
+        "unlocks": sum(len(v) for v in unlocks.values()),
+        "progress_fill": progress_fill,
+        "bytes": sizes,
+        "password": BENCH_PASSWORD,
+        "admin": ADMIN_USERNAME,
+        "kenpo_ids": kenpo_ids,
+        "accounts": accounts,
+    }
+    _write_json(root / "bench_dataset.json", manifest)
+    return manifest
+
+
+def add_arguments(ap: argparse.ArgumentParser) -> None:
+    """Dataset options, shared with tools/loadtest.py."""
+    g = ap.add_argument_group("dataset")
+    g.add_argument("--users", type=int, default=1000, help="synthetic users (default 1000)")
+    g.add_argument("--decks", type=int, default=200, help="user-owned decks (default 200)")
+    g.add_argument("--deck-cards", type=int, default=60, help="mean cards per owned deck, log-normal (default 60)")
+    g.add_argument("--kenpo-cards", type=int, default=500, help="cards in the built-in deck (default 500)")
+    g.add_argument("--breakdowns", type=int, default=1000, help="entries in breakdowns.json (default 1000)")
+    g.add_argument("--progress-fill", type=float, default=0.3,
+                   help="mean fraction of a user's accessible cards with saved progress (default 0.3)")
+    g.add_argument("--user-cards", type=float, default=0.1,
+                   help="share of users who added their own cards to the built-in deck (default 0.1)")
+    g.add_argument("--invite-codes", type=int, default=50, help="decks with an invite code (default 50)")
+    g.add_argument("--redemptions", type=int, default=500, help="invite redemptions to attempt (default 500)")
+    g.add_argument("--builtin-disabled", type=float, default=0.0,
+                   help="share of users with built-in decks disabled (default 0)")
+    g.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for activity/ownership (default 1.1, 0 = uniform)")
+    g.add_argument("--seed", type=int, default=1, help="random seed (default 1)")
+    g.add_argument("--epoch", type=int, default=1767225600,
+                   help="unix time the generated timestamps count back from (default 2026-01-01)")
+
+
+def dataset_kwargs(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "users": args.users, "decks": args.decks, "deck_cards": args.deck_cards,
+        "kenpo_cards": args.kenpo_cards, "breakdowns": args.breakdowns,
+        "progress_fill": args.progress_fill, "user_cards": args.user_cards,
+        "invite_codes": args.invite_codes, "redemptions": args.redemptions,
+        "builtin_disabled": args.builtin_disabled, "skew": args.skew, "seed": args.seed,
+        "epoch": args.epoch,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Generate a synthetic KenpoFlashcards data folder")
+    ap.add_argument("out", help="output folder (data/ and kenpo_words.json are created inside)")
+    ap.add_argument("--force", action="store_true", help="delete the output folder first if it exists")
+    add_arguments(ap)
+    args = ap.parse_args()
+
+    root = Path(args.out).resolve()
+    if root.exists() and any(root.iterdir()):
+        if not args.force:
+            print(f"ERROR: {root} is not empty (use --force to replace it)")
+            return 1
+        shutil.rmtree(root)
+    root.mkdir(parents=True, exist_ok=True)
+
+    t0 = time.perf_counter()
+    m = generate_dataset(root, **dataset_kwargs(args))
+    print(f"[DATASET] Wrote {root} in {time.perf_counter() - t0:.1f}s")
+    print(f"[DATASET] users={m['users']} decks={m['decks']} deck_cards={m['deck_cards_total']} "
+          f"kenpo_cards={m['kenpo_cards']} breakdowns={m['breakdowns']} "
+          f"invites={m['invite_codes']} unlocks={m['unlocks']}")
+    for name, n in m["bytes"].items():
+        print(f"[DATASET]   {name:<24}{n / 1024:>10.1f} KB")
+    print(f"[DATASET] Run the server with KENPO_DATA_DIR={root / 'data'} KENPO_JSON_PATH={root / 'kenpo_words.json'}")
+    print(f"[DATASET] Every account's password is '{BENCH_PASSWORD}'; admin user is '{ADMIN_USERNAME}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
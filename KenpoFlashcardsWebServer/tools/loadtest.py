@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+KenpoFlashcards Web Server - HTTP Load Test
+===========================================
+
+Starts the web server (app.py) against a throw-away synthetic data folder
+(built by tools/gen_dataset.py) and drives concurrent study traffic at it, then writes throughput and latency
+percentiles to a JSON file so runs can be compared between commits.
+
+TRAFFIC MIX (default weights, change with --mix):
+  cards=30        GET  /api/cards            (study tab load)
+  counts=25       GET  /api/counts           (tab badges)
+  set_status=25   POST /api/set_status       (mark learned/unsure)
+  sync_push=8     POST /api/sync/push        (Android push, token auth)
+  sync_pull=8     GET  /api/sync/pull        (Android pull, token auth)
+  admin_stats=4   GET  /api/admin/stats      (admin dashboard)
+
+Each worker thread plays one user for --session-requests requests, then logs
+in as another user. Users are picked with the dataset's activity weights
+(--skew), so hot users' files are hit more often, as in real traffic.
+All randomness comes from --seed, so two runs with the same options send the
+same request sequence per worker.
+
+The server runs with KENPO_AI_STUB=all, so nothing leaves the machine. Login
+throttling is raised far above the test's login rate (every worker shares
+127.0.0.1) and the password-hash queue fits every worker; pass e.g.
+--server-env KENPO_LOGIN_IP_PER_MIN=30 or KENPO_HASH_MAX_PENDING=4 to test
+them. Logins answered 429/503 are retried after Retry-After (up to 5 tries)
+and counted as errors of their op.
+
+Usage:
+    python tools/loadtest.py [options]
+
+Examples:
+    python tools/loadtest.py --users 200 --concurrency 16 --duration 30
+    python tools/loadtest.py --out before.json
+    python tools/loadtest.py --out after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from gen_dataset import add_arguments as add_dataset_arguments, dataset_kwargs, generate_dataset  # noqa: E402
+
+APP_DIR = Path(__file__).resolve().parent.parent
+APP_PY = APP_DIR / "app.py"
+
+DEFAULT_MIX = "cards=30,counts=25,set_status=25,sync_push=8,sync_pull=8,admin_stats=4"
+STATUSES = ("active", "unsure", "learned", "deleted")
+LOGIN_RETRIES = 5
+
+
+# ============ SERVER PROCESS ============
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(root: Path, port: int, extra_env: Dict[str, str]) -> Tuple[subprocess.Popen, Any]:
+    env = dict(os.environ)
+    env.update({
+        "KENPO_DATA_DIR": str(root / "data"),
+        "KENPO_JSON_PATH": str(root / "kenpo_words.json"),
+        "KENPO_WEB_PORT": str(port),
+        "KENPO_SECRET_KEY": "loadtest",
+        "KENPO_AI_STUB": "all",
+        "KENPO_LOGIN_IP_BURST": "1000000",
+        "KENPO_LOGIN_IP_PER_MIN": "1000000",
+        "KENPO_LOGIN_USER_BURST": "1000000",
+        "KENPO_LOGIN_USER_PER_MIN": "1000000",
+        "PYTHONUNBUFFERED": "1",
+    })
+    env.update(extra_env)
+    log = open(root / "server.log", "w", encoding="utf-8")
+    proc = subprocess.Popen([sys.executable, str(APP_PY)], cwd=str(APP_DIR), env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+    return proc, log
+
+
+def wait_ready(base: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode} (see server.log)")
+        try:
+            if requests.get(base + "/api/health", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server did not become ready within {timeout:.0f}s")
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+# ============ TRAFFIC ============
+
+def parse_mix(spec: str) -> List[Tuple[str, int]]:
+    known = {"cards", "counts", "set_status", "sync_push", "sync_pull", "admin_stats"}
+    out = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in known:
+            raise SystemExit(f"unknown op in --mix: {name} (known: {', '.join(sorted(known))})")
+        w = int(weight or 0)
+        if w > 0:
+            out.append((name, w))
+    if not out:
+        raise SystemExit("--mix has no ops with a positive weight")
+    return out
+
+
+class Recorder:
+    """Collects (op, latency_ms, ok) samples from all workers once warmup ends."""
+
+    def __init__(self, measure_from: float):
+        self.measure_from = measure_from
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.status_codes: Dict[str, Dict[str, int]] = {}
+
+    def add(self, op: str, started: float, elapsed_ms: float, code: int) -> None:
+        if started < self.measure_from:
+            return
+        with self.lock:
+            self.samples.setdefault(op, []).append(elapsed_ms)
+            codes = self.status_codes.setdefault(op, {})
+            codes[str(code)] = codes.get(str(code), 0) + 1
+            if code == 0 or code >= 400:
+                self.errors[op] = self.errors.get(op, 0) + 1
+
+
+class Worker(threading.Thread):
+    def __init__(self, idx: int, base: str, manifest: Dict[str, Any], mix: List[Tuple[str, int]],
+                 args: argparse.Namespace, recorder: Recorder, stop_at: float):
+        super().__init__(name=f"loadtest-{idx}", daemon=True)
+        self.base = base
+        self.manifest = manifest
+        self.rng = random.Random(args.seed * 1000 + idx)
+        self.ops = [m[0] for m in mix]
+        self.weights = [m[1] for m in mix]
+        self.args = args
+        self.rec = recorder
+        self.stop_at = stop_at
+        self.http: Optional[requests.Session] = None
+        self.admin_http: Optional[requests.Session] = None
+        # Users with nothing to study (built-in disabled, no decks) would only produce 403s
+        self.accounts = [a for a in manifest["accounts"] if a.get("builtin", True) or a.get("decks") or a.get("unlocked")]
+        self.account_weights = [a.get("weight", 1.0) for a in self.accounts]
+        self.account: Dict[str, Any] = {}
+        self.token = ""
+
+    def _call(self, op: str, sess: requests.Session, method: str, path: str, **kwargs) -> Optional[requests.Response]:
+        t0 = time.time()
+        p0 = time.perf_counter()
+        try:
+            r = sess.request(method, self.base + path, timeout=self.args.timeout, **kwargs)
+            r.content  # include body transfer in the timing
+            code = r.status_code
+        except requests.RequestException:
+            r, code = None, 0
+        self.rec.add(op, t0, (time.perf_counter() - p0) * 1000.0, code)
+        return r
+
+    def _post_login(self, op: str, sess: requests.Session, path: str, username: str) -> Optional[requests.Response]:
+        """Log in like a real client: on 429/503 (throttled / hash pool busy) wait Retry-After and retry."""
+        r = None
+        for _ in range(LOGIN_RETRIES):
+            r = self._call(op, sess, "POST", path, json={"username": username, "password": self.manifest["password"]})
+            if r is None or r.status_code not in (429, 503) or time.time() >= self.stop_at:
+                break
+            time.sleep(min(2.0, float(r.headers.get("Retry-After") or 1)))
+        return r
+
+    def _login(self) -> None:
+        self.account = self.rng.choices(self.accounts, self.account_weights)[0]
+        self.token = ""
+        if self.http is not None:
+            self.http.close()
+        self.http = requests.Session()
+        self._post_login("login", self.http, "/api/login", self.account["username"])
+
+    def _sync_headers(self) -> Dict[str, str]:
+        if not self.token:
+            r = self._post_login("sync_login", self.http, "/api/sync/login", self.account["username"])
+            if r is not None and r.status_code == 200:
+                self.token = (r.json() or {}).get("token", "")
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def _deck_param(self) -> Dict[str, str]:
+        decks = (self.account.get("decks") or []) + (self.account.get("unlocked") or [])
+        if decks and (not self.account.get("builtin", True) or self.rng.random() < self.args.own_deck_ratio):
+            return {"deck_id": self.rng.choice(decks)}
+        return {"deck_id": "kenpo"}
+
+    def run_op(self, op: str) -> None:
+        ids = self.manifest["kenpo_ids"]
+        if op == "cards":
+            params = self._deck_param()
+            params["status"] = self.rng.choice(["active", "active", "unsure", "learned", "all"])
+            self._call(op, self.http, "GET", "/api/cards", params=params)
+        elif op == "counts":
+            self._call(op, self.http, "GET", "/api/counts", params=self._deck_param())
+        elif op == "set_status":
+            self._call(op, self.http, "POST", "/api/set_status",
+                       json={"id": self.rng.choice(ids), "status": self.rng.choice(STATUSES[:3])})
+        elif op == "sync_push":
+            now = int(time.time())
+            batch = {cid: {"status": self.rng.choice(STATUSES[:3]), "updated_at": now}
+                     for cid in self.rng.sample(ids, min(len(ids), self.args.push_batch))}
+            self._call(op, self.http, "POST", "/api/sync/push", json={"progress": batch},
+                       headers=self._sync_headers())
+        elif op == "sync_pull":
+            self._call(op, self.http, "GET", "/api/sync/pull", headers=self._sync_headers())
+        elif op == "admin_stats":
+            if self.admin_http is None:
+                self.admin_http = requests.Session()
+                self._post_login("login", self.admin_http, "/api/login", self.manifest["admin"])
+            self._call(op, self.admin_http, "GET", "/api/admin/stats")
+
+    def run(self) -> None:
+        done = 0
+        while time.time() < self.stop_at:
+            if self.http is None or done % self.args.session_requests == 0:
+                self._login()
+            self.run_op(self.rng.choices(self.ops, self.weights)[0])
+            done += 1
+            if self.args.think_ms:
+                time.sleep(self.rng.uniform(0, self.args.think_ms) / 1000.0)
+
+
+# ============ REPORT ============
+
+def _pct(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(p / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+def summarize(samples: List[float], errors: int, seconds: float) -> Dict[str, Any]:
+    vals = sorted(samples)
+    n = len(vals)
+    return {
+        "requests": n,
+        "errors": errors,
+        "rps": round(n / seconds, 2) if seconds > 0 else 0.0,
+        "mean_ms": round(sum(vals) / n, 3) if n else 0.0,
+        "p50_ms": round(_pct(vals, 50), 3),
+        "p95_ms": round(_pct(vals, 95), 3),
+        "p99_ms": round(_pct(vals, 99), 3),
+        "max_ms": round(vals[-1], 3) if n else 0.0,
+    }
+
+
+def git_info() -> Dict[str, Any]:
+    def _git(*a: str) -> str:
+        try:
+            return subprocess.check_output(["git", *a], cwd=str(APP_DIR), stderr=subprocess.DEVNULL,
+                                           text=True).strip()
+        except Exception:
+            return ""
+    return {"commit": _git("rev-parse", "HEAD"), "dirty": bool(_git("status", "--porcelain", "--", "."))}
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    ops = dict(report["ops"])
+    ops["TOTAL"] = report["totals"]
+    base_ops = dict((baseline or {}).get("ops") or {})
+    if baseline:
+        base_ops["TOTAL"] = baseline.get("totals") or {}
+    print()
+    print(f"{'op':<13}{'reqs':>8}{'err':>6}{'rps':>10}{'p50':>9}{'p95':>9}{'p99':>9}" +
+          (f"{'p95 vs base':>14}{'rps vs base':>14}" if baseline else ""))
+    for op, s in ops.items():
+        line = (f"{op:<13}{s['requests']:>8}{s['errors']:>6}{s['rps']:>10.1f}"
+                f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}")
+        b = base_ops.get(op)
+        if baseline and b and b.get("p95_ms") and b.get("rps"):
+            line += f"{(s['p95_ms'] / b['p95_ms'] - 1) * 100:>+13.1f}%{(s['rps'] / b['rps'] - 1) * 100:>+13.1f}%"
+        print(line)
+    print("(latencies in ms)")
+
+
+# ============ MAIN ============
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="HTTP load test for the KenpoFlashcards web server")
+    add_dataset_arguments(ap)
+    ap.add_argument("--data-dir", help="build/reuse a pristine dataset here; each run uses a temp copy")
+    ap.add_argument("--in-place", action="store_true",
+                    help="run the server directly on --data-dir, keeping the writes it makes")
+    ap.add_argument("--keep-data", action="store_true", help="do not delete the temp dataset afterwards")
+    t = ap.add_argument_group("traffic")
+    t.add_argument("--concurrency", type=int, default=8, help="worker threads (default 8)")
+    t.add_argument("--duration", type=float, default=20.0, help="measured seconds (default 20)")
+    t.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before measuring (default 3)")
+    t.add_argument("--mix", default=DEFAULT_MIX, help=f"op weights (default {DEFAULT_MIX})")
+    t.add_argument("--session-requests", type=int, default=25,
+                   help="requests before a worker logs in as another user (default 25)")
+    t.add_argument("--own-deck-ratio", type=float, default=0.2,
+                   help="share of cards/counts calls aimed at a user-owned deck (default 0.2)")
+    t.add_argument("--push-batch", type=int, default=20, help="cards per sync push (default 20)")
+    t.add_argument("--think-ms", type=float, default=0.0, help="max random pause between requests (default 0)")
+    t.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    t.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                   help="extra environment for the server process (repeatable)")
+    o = ap.add_argument_group("output")
+    o.add_argument("--out", help="results JSON path (default loadtest-<commit>-<time>.json in the current folder)")
+    o.add_argument("--compare", help="earlier results JSON to print deltas against")
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    args.session_requests = max(1, args.session_requests)
+    # Let every worker's login queue for the hash pool rather than be shed with 503
+    extra_env = {"KENPO_HASH_MAX_PENDING": str(args.concurrency + 2)}
+    for kv in args.server_env:
+        k, sep, v = kv.partition("=")
+        if not sep:
+            raise SystemExit(f"--server-env expects KEY=VALUE, got {kv!r}")
+        extra_env[k] = v
+
+    tmp_root = None
+    if args.data_dir:
+        root = Path(args.data_dir).resolve()
+    else:
+        tmp_root = Path(tempfile.mkdtemp(prefix="kenpo-loadtest-"))
+        root = tmp_root
+
+    manifest_path = root / "bench_dataset.json"
+    proc = None
+    log = None
+    try:
+        if manifest_path.exists():
+            print(f"[LOADTEST] Reusing dataset in {root}")
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        else:
+            print(f"[LOADTEST] Building dataset in {root} ...")
+            t0 = time.perf_counter()
+            manifest = generate_dataset(root, **dataset_kwargs(args))
+            print(f"[LOADTEST] Dataset ready in {time.perf_counter() - t0:.1f}s")
+        if not manifest.get("accounts"):
+            raise SystemExit("dataset has no user accounts")
+        run_root = root
+        if tmp_root is None and not args.in_place:
+            # The run writes progress, decks and tokens; keep --data-dir pristine so runs stay comparable
+            tmp_root = Path(tempfile.mkdtemp(prefix="kenpo-loadtest-"))
+            run_root = tmp_root / "dataset"
+            shutil.copytree(root, run_root, ignore=shutil.ignore_patterns("server.log"))
+            print(f"[LOADTEST] Running on a copy in {run_root}")
+
+        port = _free_port()
+        base = f"http://127.0.0.1:{port}"
+        proc, log = start_server(run_root, port, extra_env)
+        wait_ready(base, proc)
+        server_version = {}
+        try:
+            server_version = requests.get(base + "/api/version", timeout=5).json()
+        except Exception:
+            pass
+        print(f"[LOADTEST] Server up at {base}; {args.concurrency} workers, "
+              f"{args.warmup:.0f}s warmup + {args.duration:.0f}s measured")
+
+        start = time.time()
+        recorder = Recorder(measure_from=start + args.warmup)
+        stop_at = start + args.warmup + args.duration
+        workers = [Worker(i, base, manifest, mix, args, recorder, stop_at) for i in range(args.concurrency)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(timeout=args.warmup + args.duration + args.timeout + 5)
+        measured = max(0.001, min(time.time(), stop_at) - recorder.measure_from)
+        if proc.poll() is not None:
+            print(f"[LOADTEST] WARNING: server exited during the run (code {proc.returncode})")
+    finally:
+        if proc is not None:
+            stop_server(proc)
+        if log is not None:
+            log.close()
+
+    all_samples: List[float] = []
+    ops_report: Dict[str, Any] = {}
+    for op in sorted(recorder.samples):
+        ops_report[op] = summarize(recorder.samples[op], recorder.errors.get(op, 0), measured)
+        ops_report[op]["status_codes"] = recorder.status_codes.get(op, {})
+        all_samples.extend(recorder.samples[op])
+
+    report = {
+        "tool": "kenpo-loadtest",
+        "format": 1,
+        "started_at": datetime.fromtimestamp(start).isoformat(timespec="seconds"),
+        "git": git_info(),
+        "server_version": server_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "keep_data", "in_place")},
+        "dataset": {k: v for k, v in manifest.items() if k not in ("accounts", "kenpo_ids", "password")},
+        "measured_seconds": round(measured, 3),
+        "totals": summarize(all_samples, sum(recorder.errors.values()), measured),
+        "ops": ops_report,
+    }
+
+    out = args.out
+    if not out:
+        commit = (report["git"]["commit"] or "nogit")[:8]
+        out = f"loadtest-{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"[LOADTEST] Results written to {out}")
+
+    if tmp_root is not None and not args.keep_data:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+    elif tmp_root is not None:
+        print(f"[LOADTEST] Dataset kept in {tmp_root}")
+    return 1 if report["totals"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+KenpoFlashcards Web Server - Micro-benchmarks
+=============================================
+
+Times the hot pure-Python card/sync helpers in app.py on fixed synthetic
+inputs at several sizes, writes the results to JSON, and can fail when a run
+is slower than a saved baseline.
+
+BENCHMARKS (each at every --sizes value, default 100 / 10k / 100k cards):
+  normalize_cards   app._normalize_cards(raw kenpo_words.json list)
+  build_helper      app._build_helper(normalized cards)
+  stable_id         app._stable_id(...) for every card
+  canonical_id      app._canonical_id_for_term(...) for up to 10k terms
+                    (exact, different-case and unknown terms, helper cached)
+  sync_merge        app._merge_sync_progress(...), the /api/sync/push merge,
+                    with id keys, legacy term keys, older entries and unknowns
+
+Inputs come from tools/gen_dataset.py with a fixed seed, so numbers are only
+comparable between runs on the same machine and Python version. Timing uses
+timeit: each case is auto-ranged to >= 0.2 s per sample and the best of
+--repeat samples is reported (the median is kept for reference).
+
+Usage:
+    python tools/microbench.py [options]
+
+Examples:
+    python tools/microbench.py --out base.json
+    python tools/microbench.py --baseline base.json --threshold 10
+    python tools/microbench.py --sizes 100,10000 --only sync_merge,canonical_id
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+TOOLS_DIR = Path(__file__).resolve().parent
+APP_DIR = TOOLS_DIR.parent
+sys.path.insert(0, str(TOOLS_DIR))
+from gen_dataset import make_builtin_cards  # noqa: E402
+
+BENCHMARKS = ("normalize_cards", "build_helper", "stable_id", "canonical_id", "sync_merge")
+DEFAULT_SIZES = "100,10000,100000"
+CANONICAL_LOOKUPS = 10000
+SEED = 39
+
+
+def import_app(scratch: Path) -> Any:
+    """Import app.py against a scratch data folder, hiding its startup prints."""
+    os.environ["KENPO_DATA_DIR"] = str(scratch / "data")
+    os.environ["KENPO_JSON_PATH"] = str(scratch / "kenpo_words.json")
+    os.environ.setdefault("KENPO_SECRET_KEY", "microbench")
+    sys.path.insert(0, str(APP_DIR))
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as kenpo_app
+    return kenpo_app
+
+
+def use_card_file(app: Any, path: Path) -> None:
+    """Point the app's card/helper caches at a different kenpo_words.json."""
+    app.KENPO_JSON_PATH = str(path)
+    app._cards_cache = []
+    app._cards_cache_mtime = None
+    app._helper_cache = {}
+    app._helper_cache_mtime = None
+    helper, status = app.load_helper_cached()
+    if status != "ok":
+        raise SystemExit(f"helper build failed for {path}: {status}")
+
+
+def build_cases(app: Any, size: int, scratch: Path, only: List[str]) -> List[Tuple[str, Callable[[], Any], int]]:
+    """Return (benchmark, zero-arg callable, items per call) for one input size."""
+    rng = random.Random(SEED + size)
+    raw, ids = make_builtin_cards(rng, size)
+    cards = app._normalize_cards(raw)
+    cases: List[Tuple[str, Callable[[], Any], int]] = []
+
+    if "normalize_cards" in only:
+        cases.append(("normalize_cards", lambda: app._normalize_cards(raw), size))
+
+    if "build_helper" in only:
+        cases.append(("build_helper", lambda: app._build_helper(cards, 0.0), size))
+
+    if "stable_id" in only:
+        rows = [(c["group"], c["subgroup"], c["term"], c["meaning"], c["pron"]) for c in raw]
+
+        def _stable_ids() -> None:
+            f = app._stable_id
+            for r in rows:
+                f(*r)
+        cases.append(("stable_id", _stable_ids, size))
+
+    if "canonical_id" in only or "sync_merge" in only:
+        card_path = scratch / f"kenpo_words_{size}.json"
+        card_path.write_text(json.dumps(raw), encoding="utf-8")
+        use_card_file(app, card_path)
+
+    if "canonical_id" in only:
+        lookups = []
+        for i in range(min(size, CANONICAL_LOOKUPS)):
+            term = raw[rng.randrange(size)]["term"]
+            kind = i % 4
+            if kind == 1:
+                term = f"  {term.upper()} "
+            elif kind == 3:
+                term = f"{term} unknown"
+            lookups.append(term)
+
+        def _canonical() -> None:
+            f = app._canonical_id_for_term
+            for t in lookups:
+                f(t)
+        cases.append(("canonical_id", _canonical, len(lookups)))
+
+    if "sync_merge" in only:
+        now = 1767225600
+        current: Dict[str, Any] = {"__settings__": app._default_settings()}
+        incoming: Dict[str, Any] = {}
+        for i, (c, cid) in enumerate(zip(raw, ids)):
+            if i % 2 == 0:
+                current[cid] = {"status": "unsure", "updated_at": now - 1000}
+            kind = i % 10
+            if kind < 7:
+                incoming[cid] = {"status": "learned", "updated_at": now}
+            elif kind == 7:
+                current[cid] = {"status": "learned", "updated_at": now + 1000}
+                incoming[cid] = {"status": "unsure", "updated_at": now}
+            elif kind == 8:
+                incoming[c["term"]] = "learned"
+            else:
+                incoming[f"{c['term']} unknown"] = {"status": "learned", "updated_at": now}
+        # Re-running mutates current into the same end state, so every sample does the same work
+        cases.append(("sync_merge", lambda: app._merge_sync_progress(current, incoming, now), size))
+
+    return cases
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {"best_s": min(samples), "median_s": statistics.median(samples), "loops": number, "repeat": repeat}
+
+
+def git_info() -> Dict[str, Any]:
+    def _git(*a: str) -> str:
+        try:
+            return subprocess.check_output(["git", *a], cwd=str(APP_DIR), stderr=subprocess.DEVNULL,
+                                           text=True).strip()
+        except Exception:
+            return ""
+    return {"commit": _git("rev-parse", "HEAD"), "dirty": bool(_git("status", "--porcelain", "--", "."))}
+
+
+def _fmt_time(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print per-benchmark change vs baseline; return names slower than threshold %."""
+    regressions = []
+    base = baseline.get("benchmarks") or {}
+    if baseline.get("python") != results.get("python"):
+        print(f"[BENCH] NOTE: baseline ran on Python {baseline.get('python')}, this run on {results.get('python')}")
+    print()
+    print(f"{'benchmark':<28}{'baseline':>12}{'now':>12}{'change':>10}")
+    for name, r in results["benchmarks"].items():
+        b = base.get(name)
+        if not b or not b.get("best_s"):
+            print(f"{name:<28}{'-':>12}{_fmt_time(r['best_s']):>12}{'new':>10}")
+            continue
+        change = (r["best_s"] / b["best_s"] - 1.0) * 100.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<28}{_fmt_time(b['best_s']):>12}{_fmt_time(r['best_s']):>12}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Micro-benchmarks for app.py card/sync helpers")
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated card counts (default {DEFAULT_SIZES})")
+    ap.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated benchmark names (default all)")
+    ap.add_argument("--repeat", type=int, default=5, help="timed samples per benchmark (default 5)")
+    ap.add_argument("--out", help="results JSON path (default microbench-<commit>-<time>.json)")
+    ap.add_argument("--baseline", help="earlier results JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=10.0,
+                    help="percent slowdown vs --baseline that counts as a regression (default 10)")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    only = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = [s for s in only if s not in BENCHMARKS]
+    if unknown or not sizes or min(sizes) < 1:
+        raise SystemExit(f"unknown benchmark(s) {unknown}; known: {', '.join(BENCHMARKS)}" if unknown
+                         else "--sizes needs positive integers")
+
+    results: Dict[str, Any] = {
+        "tool": "kenpo-microbench",
+        "format": 1,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git": git_info(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": sizes,
+        "benchmarks": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="kenpo-microbench-") as tmp:
+        scratch = Path(tmp)
+        app = import_app(scratch)
+        print(f"{'benchmark':<28}{'best':>12}{'median':>12}{'per item':>12}")
+        for size in sizes:
+            for name, fn, items in build_cases(app, size, scratch, only):
+                r = measure(fn, max(1, args.repeat))
+                r["items"] = items
+                r["per_item_ns"] = round(r["best_s"] / items * 1e9, 1)
+                key = f"{name}/{size}"
+                results["benchmarks"][key] = r
+                print(f"{key:<28}{_fmt_time(r['best_s']):>12}{_fmt_time(r['median_s']):>12}"
+                      f"{r['per_item_ns']:>9.0f} ns", flush=True)
+
+    out = args.out
+    if not out:
+        commit = (results["git"]["commit"] or "nogit")[:8]
+        out = f"microbench-{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"[BENCH] Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"[BENCH] {len(regressions)} benchmark(s) slower than the baseline by more than "
+                  f"{args.threshold:g}%: {', '.join(regressions)}")
+            return 1
+        print(f"[BENCH] No regressions beyond {args.threshold:g}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
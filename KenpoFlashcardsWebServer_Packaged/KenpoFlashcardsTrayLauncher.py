@@ -506,13 +506,30 @@ def _wait_for_server(timeout_s: float = 10.0) -> bool:
 def _run_server():
     try:
         _log(f"Starting server on {HOST}:{PORT} (base={os.environ.get('KENPO_WEBAPP_BASE_DIR')}, data={os.environ.get('KENPO_DATA_DIR')})")
-        from app import app as kenpo_app
-        kenpo_app.run(host=HOST, port=PORT, debug=False, use_reloader=False)
+        t0 = time.perf_counter()
+        import app as kenpo_module
+        _log(f"app.py imported in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        if hasattr(kenpo_module, "run_server"):
+            # waitress (or werkzeug fallback) with graceful shutdown; signals only work on the main thread
+            kenpo_module.run_server(host=HOST, port=PORT,
+                                    install_signals=threading.current_thread() is threading.main_thread())
+        else:
+            kenpo_module.app.run(host=HOST, port=PORT, debug=False, use_reloader=False)
     except Exception:
         tb = traceback.format_exc()
         _log("SERVER ERROR:\n" + tb)
         _popup("Advanced Flashcards WebApp Server - Server Error", "The web server failed to start.\n\nDetails were written to:\n" + str(_get_log_path()) + "\n\n" + tb)
 
+def _stop_server_gracefully(server_thread, timeout_s: float = 20.0):
+    """Let in-flight requests finish before the tray exits (no-op for older app.py)."""
+    try:
+        kenpo_module = sys.modules.get("app")
+        if kenpo_module is not None and hasattr(kenpo_module, "request_server_shutdown"):
+            if kenpo_module.request_server_shutdown("tray exit"):
+                server_thread.join(timeout_s)
+    except Exception as e:
+        _log(f"Graceful shutdown failed: {e}")
+
 def _open_config():
     """Open the config file in the default editor."""
     config_path = _get_config_path()
@@ -546,6 +563,14 @@ def main():
         _run_server()
         return
 
+    # Cold-start timing: import app.py, answer one request on a spare port, write the phase table to the log
+    if any(a.lower()=='--startup-profile' for a in sys.argv[1:]):
+        import app as kenpo_module
+        if hasattr(kenpo_module, "startup_profile"):
+            sys.exit(kenpo_module.startup_profile(log=_log))
+        _log("--startup-profile needs a newer app.py")
+        sys.exit(2)
+
     # Step 4: ensure local data and seed missing files
     state = _load_json(BACKUP_STATE_FILE, {})
     if state.get("last_run_version") != APP_VERSION:
@@ -637,6 +662,7 @@ def main():
     os._exit(0)
 
     def quit_app(_icon=None, _item=None):
+        _stop_server_gracefully(server_thread)
         os._exit(0)
 
     def show_info(_icon=None, _item=None):